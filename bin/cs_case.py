@@ -34,6 +34,7 @@ import os.path
 import platform
 import sys
 import stat
+import unittest
 
 from code_saturne import cs_exec_environment, cs_run_conf
 
@@ -181,6 +182,71 @@ def get_case_dir(case=None, param=None, coupling=None, id=None):
 
     return casedir, staging_dir
 
+#-------------------------------------------------------------------------------
+
+def get_procs_distribution(pkg):
+    """
+    Return the process distribution mode for coupled domains, based on
+    the CS_PROCS_DISTRIBUTION environment variable or the
+    "procs_distribution" option of the "run" configuration section:
+    "uniform" (default) scales requested process counts, while "weighted"
+    uses work estimates for each domain.
+    """
+
+    mode = os.getenv('CS_PROCS_DISTRIBUTION')
+
+    if mode == None:
+        config = configparser.ConfigParser()
+        config.read(pkg.get_configfiles())
+        if config.has_option('run', 'procs_distribution'):
+            mode = config.get('run', 'procs_distribution')
+
+    if mode and mode.strip().lower() == 'weighted':
+        return 'weighted'
+
+    return 'uniform'
+
+#-------------------------------------------------------------------------------
+
+def weighted_procs_distribution(np_list, work, n_procs):
+    """
+    Distribute n_procs processes among domains so as to minimize the
+    largest work per process, given [n_procs, n_procs_min, n_procs_max]
+    lists and an estimated work for each domain.
+
+    Domains with no work estimate keep their requested process count
+    (within available processes). Returns the list of process counts.
+    """
+
+    import heapq
+
+    counts = [np[1] for np in np_list]
+    n_free = n_procs - sum(counts)
+
+    for i, np in enumerate(np_list):
+        if work[i] == None:
+            n_add = max(min(np[0] - counts[i], n_free), 0)
+            counts[i] += n_add
+            n_free -= n_add
+
+    # Each added process goes to the domain with the highest load
+    # per process, which is optimal for this (convex) cost model.
+
+    heap = []
+    for i, np in enumerate(np_list):
+        if work[i] != None and (np[2] == None or counts[i] < np[2]):
+            heap.append((-work[i]/counts[i], i))
+    heapq.heapify(heap)
+
+    while n_free > 0 and heap:
+        i = heapq.heappop(heap)[1]
+        counts[i] += 1
+        n_free -= 1
+        if np_list[i][2] == None or counts[i] < np_list[i][2]:
+            heapq.heappush(heap, (-work[i]/counts[i], i))
+
+    return counts
+
 
 #===============================================================================
 # Main class
@@ -342,6 +408,10 @@ class case:
 
         self.time_limit = None
 
+        # Work estimates used for weighted process distribution
+
+        self.procs_work = None
+
         # Error reporting
         self.error = ''
         self.error_long = ''
@@ -411,12 +481,73 @@ class case:
             for d in self.py_domains:
                 msg = ' Python script domain ' + d.name + ' on ' \
                     + str(d.n_procs) + ' processes.\n'
-                sys.stdout(msg)
+                sys.stdout.write(msg)
+
+        # Print work estimates if used
+
+        if self.procs_work != None:
+            kind, source, work = self.procs_work
+            if kind == 'time':
+                msg = '\n Weighted distribution, based on times measured in\n' \
+                    + ' ' + source + ':\n'
+                unit = ' s'
+            else:
+                msg = '\n Weighted distribution, based on cell counts:\n'
+                unit = ' cells'
+            sys.stdout.write(msg)
+            loads = []
+            for d, w in zip(self.domains + self.syr_domains + self.py_domains,
+                            work):
+                if w == None:
+                    msg = '   ' + str(d.name) + ': no estimate\n'
+                else:
+                    loads.append((w, d.n_procs))
+                    msg = '   ' + str(d.name) + ': %g' % w + unit \
+                        + ', %g' % (w/d.n_procs) + unit + ' per process\n'
+                sys.stdout.write(msg)
+            w_tot = sum([l[0] for l in loads])
+            if len(loads) > 1 and w_tot > 0:
+                w_mean = w_tot / sum([l[1] for l in loads])
+                w_max = max([l[0]/l[1] for l in loads])
+                msg = ' Estimated load imbalance: %.2f\n' % (w_max/w_mean)
+                sys.stdout.write(msg)
 
         sys.stdout.write('\n')
 
     #---------------------------------------------------------------------------
 
+    def __work_estimates(self):
+
+        """
+        Estimate the work of each domain, using times measured in the most
+        recent previous run in which they are available, or cell counts
+        otherwise. Returns a (kind, source, work list) tuple, or None.
+        """
+
+        domains = self.domains + self.syr_domains + self.py_domains
+
+        run_dirs = []
+        if self.result_dir != None:
+            resu_dir, run_id = os.path.split(self.result_dir)
+            for r in os.listdir(resu_dir):
+                p = os.path.join(resu_dir, r)
+                if r != run_id and os.path.isdir(p):
+                    run_dirs.append((os.path.getmtime(p), p))
+            run_dirs = [r[1] for r in sorted(run_dirs, reverse=True)]
+
+        for r in run_dirs:
+            work = [d.measured_work(r) for d in domains]
+            if work.count(None) < len(work):
+                return ('time', r, work)
+
+        work = [d.estimated_n_cells(run_dirs) for d in domains]
+        if work.count(None) < len(work):
+            return ('cells', None, work)
+
+        return None
+
+    #---------------------------------------------------------------------------
+
     def distribute_procs(self, n_procs=None):
 
         """
@@ -437,9 +568,15 @@ class case:
             n_procs_tot += np[0]
             n_procs_min += np[1]
 
+        self.procs_work = None
+
+        weighted = False
+        if len(np_list) > 1 and n_procs != None:
+            weighted = (get_procs_distribution(self.package) == 'weighted')
+
         # If no process count is given or everything fits:
 
-        if n_procs == None or n_procs == n_procs_tot:
+        if n_procs == None or (n_procs == n_procs_tot and not weighted):
             return n_procs_tot
 
         # If process count is given and not sufficient, abort.
@@ -461,6 +598,22 @@ class case:
         n_fixed_procs = 0
         n_fixed_apps = 0
 
+        # Using work estimates if available (in which case all
+        # counts are final, so the following passes are skipped)
+
+        if weighted:
+            self.procs_work = self.__work_estimates()
+
+        if self.procs_work != None:
+            counts = weighted_procs_distribution(np_list,
+                                                 self.procs_work[2],
+                                                 n_procs)
+            for i, n in enumerate(counts):
+                np_list[i][0] = n
+            n_procs_tot = sum(counts)
+            n_fixed_procs = n_procs_tot
+            n_fixed_apps = len(np_list)
+
         while (    n_procs_tot != n_procs and n_fixed_apps != len(np_list)
                and n_passes < 5):
 
@@ -2005,6 +2158,50 @@ class case:
 
         return run_id
 
+#-------------------------------------------------------------------------------
+# Unit tests
+#-------------------------------------------------------------------------------
+
+class ProcsDistributionTestCase(unittest.TestCase):
+    """
+    Check the distribution of processes among coupled domains.
+    """
+
+    def checkWeightedDistribution(self):
+        """Check that processes follow the work of each domain"""
+        counts = weighted_procs_distribution([[1, 1, None], [1, 1, None]],
+                                             [300., 100.], 8)
+        assert counts == [6, 2], 'Wrong distribution for work ratio'
+
+    def checkBounds(self):
+        """Check minimum and maximum process counts"""
+        counts = weighted_procs_distribution([[1, 1, 2], [1, 3, None]],
+                                             [1000., 1.], 8)
+        assert counts == [2, 6], 'Maximum process count not honored'
+        counts = weighted_procs_distribution([[1, 1, None], [1, 3, None]],
+                                             [1000., 1.], 8)
+        assert counts == [5, 3], 'Minimum process count not honored'
+
+    def checkUnknownWork(self):
+        """Check domains with no work estimate"""
+        counts = weighted_procs_distribution([[2, 1, None], [1, 1, None]],
+                                             [None, 10.], 6)
+        assert counts == [2, 4], 'Requested count not kept for unknown work'
+        counts = weighted_procs_distribution([[4, 1, None], [1, 1, None]],
+                                             [None, 10.], 3)
+        assert counts == [2, 1], 'Process count exceeded for unknown work'
+
+#-------------------------------------------------------------------------------
+
+def suite():
+    testSuite = unittest.makeSuite(ProcsDistributionTestCase, "check")
+    return testSuite
+
+def runTest():
+    print("ProcsDistributionTestCase")
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
+
 #-------------------------------------------------------------------------------
 # End
 #-------------------------------------------------------------------------------
@@ -32,9 +32,12 @@ import datetime
 import fnmatch
 import os
 import os.path
+import re
 import sys
 import shutil
 import stat
+import time
+import zlib
 
 from code_saturne import cs_compile
 from code_saturne import cs_xml_reader
@@ -79,6 +82,449 @@ def make_clean_dir(path):
 
 #-------------------------------------------------------------------------------
 
+def get_staging_options(pkg):
+    """
+    Return the number of threads used to copy results and whether
+    copies are verified using checksums, based on the CS_STAGING_THREADS
+    and CS_STAGING_CHECKSUM environment variables or the "staging_threads"
+    and "staging_checksum" options of the "run" configuration section.
+    """
+
+    n_threads = os.getenv('CS_STAGING_THREADS')
+    checksum = os.getenv('CS_STAGING_CHECKSUM')
+
+    if n_threads == None or checksum == None:
+        config = configparser.ConfigParser()
+        config.read(pkg.get_configfiles())
+        if n_threads == None and config.has_option('run', 'staging_threads'):
+            n_threads = config.get('run', 'staging_threads')
+        if checksum == None and config.has_option('run', 'staging_checksum'):
+            checksum = config.get('run', 'staging_checksum')
+
+    if n_threads:
+        n_threads = max(int(n_threads), 1)
+    else:
+        n_threads = 4
+
+    checksum = checksum in ('1', 'yes', 'true', 'on')
+
+    return n_threads, checksum
+
+#-------------------------------------------------------------------------------
+
+def copy_file(src, dest, checksum=False, buf_size=1<<24):
+    """
+    Copy a file and its metadata, using copy_file_range when available
+    and large buffers otherwise. If checksum is True, the copy is
+    read back and compared with the source.
+    """
+
+    f_src = open(src, 'rb')
+    f_dest = open(dest, 'wb')
+
+    crc = 0
+    done = False
+
+    if hasattr(os, 'copy_file_range') and not checksum:
+        try:
+            while os.copy_file_range(f_src.fileno(), f_dest.fileno(),
+                                     buf_size) > 0:
+                pass
+            done = True
+        except OSError:
+            f_src.seek(0)
+            f_dest.seek(0)
+            f_dest.truncate()
+
+    if not done:
+        buf = bytearray(buf_size)
+        mv = memoryview(buf)
+        while True:
+            n = f_src.readinto(buf)
+            if not n:
+                break
+            f_dest.write(mv[:n])
+            if checksum:
+                crc = zlib.crc32(mv[:n], crc)
+
+    f_src.close()
+    f_dest.close()
+
+    if checksum:
+        crc_dest = 0
+        f = open(dest, 'rb')
+        while True:
+            b = f.read(buf_size)
+            if not b:
+                break
+            crc_dest = zlib.crc32(b, crc_dest)
+        f.close()
+        if crc_dest != crc:
+            raise RunCaseError('Checksum of copy ' + dest
+                               + ' does not match that of ' + src)
+
+    shutil.copystat(src, dest)
+
+#-------------------------------------------------------------------------------
+
+def copy_files(file_list, n_threads=1, checksum=False):
+    """
+    Copy a list of (source, destination) files, using a bounded
+    thread pool, and reporting progress for large copies.
+    """
+
+    if len(file_list) < 2 or n_threads < 2:
+        for src, dest in file_list:
+            copy_file(src, dest, checksum)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    sizes = {}
+    for src, dest in file_list:
+        sizes[src] = os.path.getsize(src)
+    total = sum(sizes.values())
+    report = (total > 1<<30)
+
+    n_done = 0
+    size_done = 0
+    t_last = time.time()
+    error = None
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        futures = {}
+        for src, dest in file_list:
+            futures[executor.submit(copy_file, src, dest, checksum)] = src
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                if error == None:
+                    error = e
+            n_done += 1
+            size_done += sizes[futures[future]]
+            if report and (time.time() - t_last > 10 or n_done == len(futures)):
+                t_last = time.time()
+                sys.stdout.write('   copied %d/%d files (%.1f/%.1f GiB)\n'
+                                 % (n_done, len(futures),
+                                    size_done / (1<<30), total / (1<<30)))
+                sys.stdout.flush()
+
+    if error != None:
+        raise error
+
+#-------------------------------------------------------------------------------
+
+def _move_tree(src, dest):
+    """
+    Rename a file, link, or directory, merging directories with an
+    existing destination directory.
+    """
+
+    if os.path.isdir(src) and not os.path.islink(src) \
+       and os.path.isdir(dest) and not os.path.islink(dest):
+        for f in os.listdir(src):
+            _move_tree(os.path.join(src, f), os.path.join(dest, f))
+        os.rmdir(src)
+    else:
+        os.replace(src, dest)
+
+#-------------------------------------------------------------------------------
+
+def move_result(src, dest):
+    """
+    Move a file or directory using renames, merging directories with
+    an existing destination; symbolic links are moved as links.
+    Return False (doing nothing) if the source is not on the same file
+    system as the destination.
+    """
+
+    try:
+        if os.lstat(src).st_dev != os.stat(os.path.dirname(dest)).st_dev:
+            return False
+    except OSError:
+        return False
+
+    _move_tree(src, dest)
+
+    return True
+
+#-------------------------------------------------------------------------------
+
+def get_mesh_cache(pkg):
+    """
+    Return the preprocessed mesh cache defined by the CS_MESH_CACHE
+    environment variable or the "mesh_cache" option of the "run"
+    configuration section (with optional "mesh_cache_size", in MB), or None.
+    """
+
+    path = os.getenv('CS_MESH_CACHE')
+    max_size = os.getenv('CS_MESH_CACHE_SIZE')
+
+    if path == None:
+        config = configparser.ConfigParser()
+        config.read(pkg.get_configfiles())
+        if config.has_option('run', 'mesh_cache'):
+            path = config.get('run', 'mesh_cache')
+            if config.has_option('run', 'mesh_cache_size'):
+                max_size = config.get('run', 'mesh_cache_size')
+
+    if not path:
+        return None
+
+    path = os.path.expanduser(os.path.expandvars(path))
+    if max_size:
+        return mesh_cache(path, int(max_size) << 20)
+    return mesh_cache(path)
+
+#-------------------------------------------------------------------------------
+
+def get_preprocess_jobs(pkg):
+    """
+    Return the maximum number of meshes preprocessed concurrently, based
+    on the CS_PREPROCESS_JOBS environment variable or the "preprocess_jobs"
+    option of the "run" configuration section, or on available cores.
+    """
+
+    n_jobs = os.getenv('CS_PREPROCESS_JOBS')
+
+    if n_jobs == None:
+        config = configparser.ConfigParser()
+        config.read(pkg.get_configfiles())
+        if config.has_option('run', 'preprocess_jobs'):
+            n_jobs = config.get('run', 'preprocess_jobs')
+
+    if n_jobs:
+        return max(int(n_jobs), 1)
+
+    return cs_compile.available_cores()
+
+#-------------------------------------------------------------------------------
+
+def performance_log_work(path):
+    """
+    Return the work measured in a solver performance.log file, in
+    rank-seconds, or None if not available.
+
+    Communication and wait times reported for couplings are excluded,
+    so that time spent waiting for other domains is not counted.
+    """
+
+    n_ranks = 1
+    t_elapsed = None
+    t_wait = 0.
+
+    try:
+        f = open(path, 'r')
+    except Exception:
+        return None
+
+    for line in f:
+        kw, sep, val = line.partition(':')
+        if not sep:
+            continue
+        kw = kw.strip()
+        try:
+            if kw == 'MPI ranks':
+                n_ranks = int(val.split()[0])
+            elif kw == 'Elapsed time':
+                t_elapsed = float(val.split()[0])
+            elif kw == 'communication and wait':
+                t_wait += float(val.split()[0])
+        except (IndexError, ValueError):
+            pass
+
+    f.close()
+
+    if t_elapsed == None:
+        return None
+
+    return n_ranks * max(t_elapsed - t_wait, 0.)
+
+#-------------------------------------------------------------------------------
+
+def log_n_cells(path, pattern):
+    """
+    Return the number of cells reported in a log file, based on the
+    last line matching a given regular expression, or None.
+    """
+
+    n_cells = None
+
+    try:
+        f = open(path, 'r', errors='replace')
+    except Exception:
+        return None
+
+    r = re.compile(pattern)
+    for line in f:
+        m = r.match(line)
+        if m:
+            n_cells = int(m.group(1))
+
+    f.close()
+
+    return n_cells
+
+#-------------------------------------------------------------------------------
+
+def mesh_input_n_cells(path):
+    """
+    Return the number of cells in a preprocessed mesh file or directory,
+    or None if it cannot be determined.
+    """
+
+    try:
+        from code_saturne.cs_io_reader import io_file
+    except ImportError:
+        return None
+
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    else:
+        files = [path]
+
+    n_cells = None
+    for f in files:
+        try:
+            v = io_file(f).read_values('n_cells')
+        except Exception:
+            v = None
+        if v is None or len(v) < 1:
+            return None
+        if n_cells == None:
+            n_cells = 0
+        n_cells += int(v[0])
+
+    return n_cells
+
+#-------------------------------------------------------------------------------
+
+class mesh_cache(cs_compile.compile_cache):
+    """
+    Persistent cache of preprocessed meshes, indexed by a hash of the
+    source mesh contents, preprocessor options, and version.
+
+    Cached meshes are linked (rather than copied) to and from execution
+    directories when possible; a lock per entry ensures a mesh is
+    preprocessed only once when several runs start at the same time.
+
+    Only the preprocessed mesh and the preprocessor log are cached, so
+    the cache is not used when postprocessing output of the mesh is
+    requested (--post-volume option).
+    """
+
+    def __init__(self, path, max_size=20<<30):
+        """
+        Initialize cache object.
+        """
+        cs_compile.compile_cache.__init__(self, path, max_size)
+
+    #---------------------------------------------------------------------------
+
+    def file_digest(self, path):
+        """
+        Return a hash of a file's contents, reusing the hash computed
+        for the same file path, size, and modification time if present.
+        """
+        st = os.stat(path)
+        s_key = self.key(os.path.realpath(path), st.st_size,
+                         st.st_mtime_ns, st.st_ino, 'digest')
+        e = self.entry(s_key)
+        try:
+            with open(e, 'r') as f:
+                digest = f.read().strip()
+            if len(digest) == 64:
+                os.utime(e, None)
+                return digest
+        except Exception:
+            pass
+
+        digest = self.key(('file', path))
+
+        try:
+            d = os.path.dirname(e)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            with open(e + '.tmp', 'w') as f:
+                f.write(digest)
+            os.replace(e + '.tmp', e)
+        except Exception:
+            pass
+
+        return digest
+
+    #---------------------------------------------------------------------------
+
+    def lock(self, key):
+        """
+        Lock a cache entry, waiting if it is already locked.
+        Return the lock file object, or None if locking is not possible.
+        """
+        try:
+            import fcntl
+            d = os.path.dirname(self.entry(key))
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            f = open(self.entry(key) + '.lock', 'w')
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            return f
+        except Exception:
+            return None
+
+    #---------------------------------------------------------------------------
+
+    def unlock(self, lock):
+        """
+        Release a lock obtained with lock().
+        """
+        if lock != None:
+            lock.close()
+
+    #---------------------------------------------------------------------------
+
+    def link(self, key, dest):
+        """
+        Link a cached file to dest if present (using a hard link if
+        possible, a copy otherwise, as trimming the cache could leave a
+        symbolic link dangling); return True in this case.
+        """
+        e = self.entry(key)
+        if not os.path.isfile(e):
+            return False
+        try:
+            if os.path.lexists(dest):
+                os.remove(dest)
+            try:
+                os.link(e, dest)
+                os.utime(e, None)
+                return True
+            except OSError:
+                return self.get(key, dest)
+        except Exception:
+            return False
+
+    #---------------------------------------------------------------------------
+
+    def put(self, key, src):
+        """
+        Add a file to the cache, using a hard link if possible.
+        """
+        e = self.entry(key)
+        try:
+            d = os.path.dirname(e)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            os.link(src, e + '.tmp')
+            os.replace(e + '.tmp', e)
+            os.utime(e, None)
+        except Exception:
+            cs_compile.compile_cache.put(self, key, src)
+            return
+        self.trim()
+
+#-------------------------------------------------------------------------------
+
 class RunCaseError(Exception):
     """Base class for exception handling."""
 
@@ -152,6 +598,11 @@ class base_domain:
 
         self.debug = None
 
+        # Number of threads and checksum option for copy of results
+        # (determined when first needed)
+
+        self.staging_options = None
+
         # Error reporting
         self.error = ''
 
@@ -239,35 +690,46 @@ class base_domain:
         if src == dest:
             return
 
-        # Copy single file
+        # Move file or directory if on the same file system
 
-        if os.path.isfile(src):
-            shutil.copy2(src, dest)
-            if purge:
-                os.remove(src)
+        if purge and move_result(src, dest):
+            return
+
+        # Determine files to copy; unlike os.path.copytree, the destination
+        # directory may already exist.
 
-        # Copy single directory (possibly recursive)
-        # Unkike os.path.copytree, the destination directory
-        # may already exist.
+        file_list = []
+
+        if os.path.isfile(src):
+            file_list.append((src, dest))
 
         elif os.path.isdir(src):
+            for d_src, dirs, files in os.walk(src, followlinks=True):
+                # Do not follow links to a directory or its parents
+                r_src = os.path.realpath(d_src)
+                for d in list(dirs):
+                    r = os.path.realpath(os.path.join(d_src, d))
+                    if r_src == r or r_src.startswith(r + os.sep):
+                        dirs.remove(d)
+                d_rel = os.path.relpath(d_src, src)
+                d_dest = os.path.normpath(os.path.join(dest, d_rel))
+                if not os.path.isdir(d_dest):
+                    os.mkdir(d_dest)
+                for f in files:
+                    f_src = os.path.join(d_src, f)
+                    if os.path.isfile(f_src):
+                        file_list.append((f_src, os.path.join(d_dest, f)))
 
-            if not os.path.isdir(dest):
-                os.mkdir(dest)
-            l = os.listdir(src)
-            for f in l:
-                f_src = os.path.join(src, f)
-                f_dest = os.path.join(dest, f)
-                if os.path.isfile(f_src):
-                    shutil.copy2(f_src, f_dest)
-                elif os.path.isdir(f_src):
-                    self.copy_result(f_src, f_dest)
+        else:
+            return
 
-            if purge:
-                if os.path.islink(src):
-                    os.remove(f)
-                else:
-                    shutil.rmtree(src)
+        if self.staging_options == None:
+            self.staging_options = get_staging_options(self.package)
+        n_threads, checksum = self.staging_options
+        copy_files(file_list, n_threads, checksum)
+
+        if purge:
+            self.purge_result(src)
 
     #---------------------------------------------------------------------------
 
@@ -313,6 +775,26 @@ class base_domain:
 
     #---------------------------------------------------------------------------
 
+    def measured_work(self, run_dir):
+        """
+        Return the work measured for this domain in a previous run
+        directory (in rank-seconds), or None if unknown.
+        """
+
+        return None
+
+    #---------------------------------------------------------------------------
+
+    def estimated_n_cells(self, run_dirs):
+        """
+        Return the number of cells of this domain, based on logs of
+        previous run directories or on its input mesh, or None if unknown.
+        """
+
+        return None
+
+    #---------------------------------------------------------------------------
+
     def solver_command(self, **kw):
         """
         Returns a tuple indicating the solver's working directory,
@@ -464,9 +946,13 @@ class domain(base_domain):
                 m = os.path.join(results_dir, r, 'checkpoint', 'main')
             if os.path.isfile(m):
                 try:
-                    cmd = self.package.get_io_dump()
-                    cmd += ' --location 0 ' + m
-                    res = get_command_output(cmd)
+                    try:
+                        from code_saturne.cs_io_reader import io_file
+                        io_file(m)
+                    except ImportError:
+                        cmd = self.package.get_io_dump()
+                        cmd += ' --location 0 ' + m
+                        res = get_command_output(cmd)
                 except Exception:
                     print('checkpoint of result: ' + r + ' does not seem usable')
                     continue
@@ -635,7 +1121,8 @@ class domain(base_domain):
 
             self.mci = meg_to_c_interpreter(case,
                                             module_name=module_name,
-                                            wdir = os.path.join(self.exec_dir, 'src'))
+                                            wdir = os.path.join(self.exec_dir, 'src'),
+                                            cache_dir = self.case_dir)
 
             if self.mci.has_meg_code():
                 needs_comp = True
@@ -692,6 +1179,8 @@ class domain(base_domain):
 
             solver_name = os.path.basename(self.solver_path)
 
+            cache = cs_compile.get_compile_cache(self.package_compute)
+
             retval = cs_compile.compile_and_link(self.package_compute,
                                                  solver_name,
                                                  exec_src,
@@ -702,7 +1191,8 @@ class domain(base_domain):
                                                  self.compile_libs,
                                                  keep_going=True,
                                                  stdout=log,
-                                                 stderr=log)
+                                                 stderr=log,
+                                                 cache=cache)
 
             log.close()
 
@@ -886,6 +1376,63 @@ class domain(base_domain):
 
     #---------------------------------------------------------------------------
 
+    def measured_work(self, run_dir):
+        """
+        Return the work measured for this domain in a previous run
+        directory (in rank-seconds), or None if unknown.
+        """
+
+        if self.name != None:
+            run_dir = os.path.join(run_dir, self.name)
+
+        return performance_log_work(os.path.join(run_dir, 'performance.log'))
+
+    #---------------------------------------------------------------------------
+
+    def estimated_n_cells(self, run_dirs):
+        """
+        Return the number of cells of this domain, based on logs of
+        previous run directories or on its input mesh, or None if unknown.
+        """
+
+        # Mesh actually used by the solver, then preprocessor output
+
+        for r in run_dirs:
+            if self.name != None:
+                r = os.path.join(r, self.name)
+            # Serial element counts or (parallel) mesh information
+            n_cells = log_n_cells(os.path.join(r, 'run_solver.log'),
+                                  r'^ (?:    )?Number of cells:\s+(\d+)')
+            if n_cells != None:
+                return n_cells
+            if not os.path.isdir(r):
+                continue
+            logs = fnmatch.filter(os.listdir(r), 'preprocessor*.log')
+            if logs:
+                n_cells = 0
+                for l in logs:
+                    n = log_n_cells(os.path.join(r, l),
+                                    r'^\s*Number of cells\s*:\s*(\d+)')
+                    if n == None:
+                        n_cells = None
+                        break
+                    n_cells += n
+                if n_cells != None:
+                    return n_cells
+
+        # Preprocessed mesh input
+
+        if self.mesh_input:
+            mesh_input = os.path.expanduser(self.mesh_input)
+            if not os.path.isabs(mesh_input):
+                mesh_input = os.path.join(self.case_dir, mesh_input)
+            if os.path.exists(mesh_input):
+                return mesh_input_n_cells(mesh_input)
+
+        return None
+
+    #---------------------------------------------------------------------------
+
     def preprocess(self):
         """
         Runs the preprocessor in the execution directory
@@ -950,6 +1497,8 @@ class domain(base_domain):
 
         mesh_id = None
 
+        cache = get_mesh_cache(self.package)
+
         if len(self.meshes) > 1:
             mesh_id = 0
             destdir = 'mesh_input'
@@ -967,7 +1516,9 @@ class domain(base_domain):
             ld_library_path += ld_library_path_save
             os.environ['LD_LIBRARY_PATH'] = ld_library_path
 
-        # Run once per mesh
+        # Prepare one preprocessing job per mesh
+
+        jobs = []
 
         for m in self.meshes:
 
@@ -1012,8 +1563,6 @@ class domain(base_domain):
                 # code_saturne mesh, no need to run preprocessor
                 self.symlink(mesh_path,
                              os.path.join(self.exec_dir, _outputmesh))
-
-                retcode = 0
             else:
                 # run preprocessor if needed
 
@@ -1023,29 +1572,59 @@ class domain(base_domain):
                     for opt in m[1:]:
                         cmd.append(opt)
 
-                cmd = cmd + ['--out', _outputmesh]
-                if (mesh_id != None):
-                    cmd = cmd + ['--log', 'preprocessor_%02d.log' % (mesh_id)]
-                    cmd = cmd + ['--case', 'preprocessor_%02d' % (mesh_id)]
-                else:
-                    cmd = cmd + ['--log']
+                jobs.append((mesh_path, _outputmesh, mesh_id, cmd))
+
+        # Run preprocessor jobs, concurrently if there are several
 
-                cmd.append(mesh_path)
+        retcode = 0
 
-                # Run command
-                retcode = run_command(cmd, pkg=self.package)
+        n_workers = min(get_preprocess_jobs(self.package), len(jobs))
 
-            if retcode != 0:
+        if n_workers < 2:
+            retcodes = [self.__preprocess_mesh(job, cache, self.package)
+                        for job in jobs]
+
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            # Modify the PATH for relocatable installation once for all
+            # jobs, as run_command would do so for each command.
+
+            saved_path = None
+            if self.package.config.features['relocatable'] == "yes":
+                saved_path = os.environ['PATH']
+                os.environ['PATH'] = self.package.get_dir('bindir') \
+                    + os.pathsep + saved_path
+
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                retcodes = list(executor.map(lambda job:
+                                             self.__preprocess_mesh(job, cache),
+                                             jobs))
+
+            if saved_path != None:
+                os.environ['PATH'] = saved_path
+
+        failed = [jobs[i][0] for i in range(len(jobs)) if retcodes[i] != 0]
+        for r in retcodes:
+            if r != 0:
+                retcode = r
+                break
+
+        if retcode != 0:
+            if len(jobs) > 1:
+                err_str = \
+                    'Error running the preprocessor for mesh(es):\n  ' \
+                    + '\n  '.join(failed) + '\n' \
+                    'Check the preprocessor_*.log files for details.\n\n'
+            else:
                 err_str = \
                     'Error running the preprocessor.\n' \
                     'Check the preprocessor.log file for details.\n\n'
-                sys.stderr.write(err_str)
-
-                self.exec_solver = False
+            sys.stderr.write(err_str)
 
-                self.error = 'preprocess'
+            self.exec_solver = False
 
-                break
+            self.error = 'preprocess'
 
         # Restore environment
 
@@ -1061,6 +1640,61 @@ class domain(base_domain):
 
     #---------------------------------------------------------------------------
 
+    def __preprocess_mesh(self, job, cache, pkg=None):
+        """
+        Run the preprocessor for a given mesh, or use a cached result.
+        """
+
+        mesh_path, _outputmesh, mesh_id, cmd = job
+
+        if (mesh_id != None):
+            log_name = 'preprocessor_%02d.log' % (mesh_id)
+        else:
+            log_name = 'preprocessor.log'
+
+        # use cached mesh if available
+
+        key = None
+        lock = None
+
+        # The cache only holds the mesh and log, not postprocessing output
+        if '--post-volume' in cmd:
+            cache = None
+
+        if cache != None:
+            key = cache.key(self.package.version_full,
+                            cmd,
+                            cache.file_digest(mesh_path))
+            lock = cache.lock(key)
+            if cache.link(key, _outputmesh):
+                cache.get(cache.key(key, 'log'), log_name)
+                cache.unlock(lock)
+                return 0
+
+        cmd = cmd + ['--out', _outputmesh]
+        if (mesh_id != None):
+            cmd = cmd + ['--log', log_name]
+            cmd = cmd + ['--case', 'preprocessor_%02d' % (mesh_id)]
+        else:
+            cmd = cmd + ['--log']
+
+        cmd.append(mesh_path)
+
+        # Run command
+        retcode = run_command(cmd, pkg=pkg)
+
+        if retcode == 0 and key != None:
+            cache.put(key, _outputmesh)
+            if os.path.isfile(log_name):
+                cache.put(cache.key(key, 'log'), log_name)
+
+        if cache != None:
+            cache.unlock(lock)
+
+        return retcode
+
+    #---------------------------------------------------------------------------
+
     def solver_command(self, **kw):
         """
         Returns a tuple indicating the solver's working directory,
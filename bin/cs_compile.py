@@ -24,7 +24,10 @@
 #-------------------------------------------------------------------------------
 
 import fnmatch
+import hashlib
 import os
+import re
+import shutil
 import sys
 import tempfile
 
@@ -75,6 +78,11 @@ def process_cmd_line(argv, pkg):
                       metavar="<dest_dir>",
                       help="choose executable file directory")
 
+    parser.add_option("-j", "--jobs", dest="n_jobs", type="int",
+                      metavar="<n_jobs>",
+                      help="number of concurrent compilation jobs " \
+                           "(default: number of available cores)")
+
     parser.add_option("--version", dest="version", type="string",
                       metavar="<version>",
                       help="select installed version")
@@ -98,6 +106,7 @@ def process_cmd_line(argv, pkg):
     parser.set_defaults(test_mode=False)
     parser.set_defaults(force_link=False)
     parser.set_defaults(keep_going=False)
+    parser.set_defaults(n_jobs=None)
     parser.set_defaults(src_dir=os.getcwd())
     parser.set_defaults(dest_dir=os.getcwd())
     parser.set_defaults(version="")
@@ -129,7 +138,7 @@ def process_cmd_line(argv, pkg):
 
     return options.test_mode, options.force_link, options.keep_going, \
            src_dir, dest_dir, options.version, options.cflags, \
-           options.cxxflags, options.fcflags, options.libs
+           options.cxxflags, options.fcflags, options.libs, options.n_jobs
 
 #-------------------------------------------------------------------------------
 
@@ -147,6 +156,206 @@ def files_to_compile(src_dir):
 
     return src_files
 
+#-------------------------------------------------------------------------------
+
+def available_cores():
+    """
+    Return the number of cores available to the current process.
+    """
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except Exception:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+
+#-------------------------------------------------------------------------------
+
+def fortran_dependencies(f_files):
+    """
+    Return a dictionary associating to each Fortran file the set of
+    files defining the modules it uses.
+    """
+
+    re_module = re.compile(r'^\s*module\s+(\w+)\s*(!.*)?$', re.IGNORECASE)
+    re_use = re.compile(r'^\s*use\b\s*(,\s*\w+\s*)?(::)?\s*(\w+)',
+                        re.IGNORECASE)
+
+    modules = {}
+    uses = {}
+
+    for f in f_files:
+        uses[f] = set()
+        try:
+            lines = open(f, 'r', errors='replace').readlines()
+        except Exception:
+            continue
+        for l in lines:
+            m = re_module.match(l)
+            if m:
+                modules[m.group(1).lower()] = f
+                continue
+            m = re_use.match(l)
+            if m:
+                uses[f].add(m.group(3).lower())
+
+    # User modules are always compiled first
+
+    user_mod = fnmatch.filter(f_files, '*cs_user_modules.f90')
+
+    deps = {}
+    for f in f_files:
+        deps[f] = set([modules[m] for m in uses[f] if m in modules])
+        if f not in user_mod:
+            deps[f].update(user_mod)
+        deps[f].discard(f)
+
+    return deps
+
+#===============================================================================
+# Class used to cache compilation results
+#===============================================================================
+
+class compile_cache(object):
+    """
+    Persistent cache of object files and executables, indexed by a hash
+    of the sources and of the commands used to build them.
+
+    Entries are files named by their key, added atomically so that the
+    cache may be shared by concurrent runs; when the cache size exceeds
+    its maximum, least recently used entries are removed.
+    """
+
+    def __init__(self, path, max_size=2<<30):
+        """
+        Initialize cache object.
+        """
+        self.path = path
+        self.max_size = max_size
+
+    #---------------------------------------------------------------------------
+
+    def key(self, *items):
+        """
+        Build a cache key from strings and file contents
+        (items given as ('file', path) tuples).
+        """
+        h = hashlib.sha256()
+        for item in items:
+            if type(item) == tuple and item[0] == 'file':
+                with open(item[1], 'rb') as f:
+                    for b in iter(lambda: f.read(1<<20), b''):
+                        h.update(b)
+            else:
+                h.update(str(item).encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    #---------------------------------------------------------------------------
+
+    def entry(self, key):
+        """
+        Return path of the cache entry associated with a key.
+        """
+        return os.path.join(self.path, key[:2], key)
+
+    #---------------------------------------------------------------------------
+
+    def get(self, key, dest):
+        """
+        Copy a cached file to dest if present; return True in this case.
+        """
+        e = self.entry(key)
+        try:
+            shutil.copy2(e, dest)
+            os.utime(e, None)
+            return True
+        except Exception:
+            return False
+
+    #---------------------------------------------------------------------------
+
+    def put(self, key, src):
+        """
+        Add a file to the cache.
+        """
+        e = self.entry(key)
+        try:
+            d = os.path.dirname(e)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            fd, tmp_name = tempfile.mkstemp(dir=d, suffix='.tmp')
+            os.close(fd)
+            shutil.copy2(src, tmp_name)
+            os.replace(tmp_name, e)
+            os.utime(e, None)
+        except Exception:
+            return
+        self.trim()
+
+    #---------------------------------------------------------------------------
+
+    def trim(self):
+        """
+        Remove least recently used entries exceeding the cache size.
+        """
+        entries = []
+        size = 0
+        for d in os.listdir(self.path):
+            d = os.path.join(self.path, d)
+            if not os.path.isdir(d):
+                continue
+            for f in os.listdir(d):
+                if f[-5:] == '.lock':
+                    continue
+                try:
+                    st = os.stat(os.path.join(d, f))
+                except Exception:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(d, f)))
+                size += st.st_size
+        entries.sort()
+        for mtime, f_size, f in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(f)
+                size -= f_size
+            except Exception:
+                pass
+
+#-------------------------------------------------------------------------------
+
+def get_compile_cache(pkg):
+    """
+    Return the compilation cache defined by the CS_COMPILE_CACHE environment
+    variable or the "compile_cache" option of the "run" configuration
+    section (with optional "compile_cache_size", in MB), or None.
+    """
+
+    path = os.getenv('CS_COMPILE_CACHE')
+    max_size = os.getenv('CS_COMPILE_CACHE_SIZE')
+
+    if path == None:
+        try:
+            import configparser
+        except Exception:
+            import ConfigParser as configparser
+        config = configparser.ConfigParser()
+        config.read(pkg.get_configfiles())
+        if config.has_option('run', 'compile_cache'):
+            path = config.get('run', 'compile_cache')
+            if config.has_option('run', 'compile_cache_size'):
+                max_size = config.get('run', 'compile_cache_size')
+
+    if not path:
+        return None
+
+    path = os.path.expanduser(os.path.expandvars(path))
+    if max_size:
+        return compile_cache(path, int(max_size) << 20)
+    return compile_cache(path)
+
 #===============================================================================
 # Class used to manage compilation
 #===============================================================================
@@ -330,9 +539,16 @@ class cs_compile(object):
     def compile_src(self, base_name=None, src_list=None,
                     opt_cflags=None, opt_cxxflags=None, opt_fcflags=None,
                     keep_going=False,
-                    stdout=sys.stdout, stderr=sys.stderr):
+                    stdout=sys.stdout, stderr=sys.stderr, n_jobs=None,
+                    cache=None):
         """
         Compilation function.
+
+        Files are compiled by n_jobs concurrent processes (by default, the
+        number of available cores), Fortran files being compiled only
+        once the files defining the modules they use are compiled.
+        If a compile_cache is given, C and C++ object files are reused
+        from it when possible.
         """
         retval = 0
 
@@ -366,11 +582,11 @@ class cs_compile(object):
             f_include_dirs.append(os.path.dirname(f))
         f_include_dirs = sorted(set(cxx_include_dirs))
 
-        # Compile files
+        # Build compile commands
+
+        jobs = []
 
         for f in c_files:
-            if (retval != 0 and not keep_going):
-                break
             cmd = [self.get_compiler('cc')]
             if opt_cflags != None:
                 cmd += separate_args(opt_cflags)
@@ -383,14 +599,9 @@ class cs_compile(object):
             cmd += self.get_flags('cppflags', base_name=base_name)
             cmd += separate_args(pkg.config.flags['cflags'])
             cmd += ["-c", f]
-            if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
-                retval = 1
-            o_files.append(self.obj_name(f))
+            jobs.append((f, cmd, self.obj_name(f)))
 
         for f in cxx_files:
-            if (retval != 0 and not keep_going):
-                break
             cmd = [self.get_compiler('cxx')]
             if opt_cxxflags != None:
                 cmd += separate_args(opt_cxxflags)
@@ -402,14 +613,9 @@ class cs_compile(object):
             cmd += self.get_flags('cppflags', base_name=base_name)
             cmd += separate_args(pkg.config.flags['cxxflags'])
             cmd += ["-c", f]
-            if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
-                retval = 1
-            o_files.append(self.obj_name(f))
+            jobs.append((f, cmd, self.obj_name(f)))
 
         for f in f_files:
-            if (retval != 0 and not keep_going):
-                break
             cmd = [self.get_compiler('fc')]
             f_base = os.path.basename(f)
             o_name = self.obj_name(f)
@@ -439,16 +645,206 @@ class cs_compile(object):
             for d in f_include_dirs:
                 cmd += ["-I", d]
             if pkg.config.fcmodinclude != "-I":
-                cmd += [pkg.config.fcmodinclude, srcdir]
+                cmd += [pkg.config.fcmodinclude, os.path.dirname(f)]
             cmd += ["-I", pkg.get_dir('pkgincludedir')]
             if pkg.config.fcmodinclude != "-I":
                 cmd += [pkg.config.fcmodinclude, pkg.get_dir('pkgincludedir')]
             cmd += separate_args(pkg.config.flags['fcflags'])
             cmd += ["-c", f]
-            if run_command(cmd, pkg=pkg, echo=True,
-                           stdout=stdout, stderr=stderr) != 0:
-                retval = 1
-            o_files.append(o_name)
+            jobs.append((f, cmd, o_name))
+
+        # Reuse cached object files (Fortran files are always compiled,
+        # as the module files they generate are also needed)
+
+        cached = []
+        to_cache = []
+        if cache != None:
+            jobs, cached, to_cache \
+                = self.cached_objects(jobs, h_files + hxx_files, cache)
+            for o_name in cached:
+                stdout.write('Using cached object: ' + o_name + '\n')
+
+        # Compile files
+
+        if n_jobs == None:
+            n_jobs = available_cores()
+
+        if n_jobs < 2 or len(jobs) < 2:
+            for f, cmd, o_name in jobs:
+                if (retval != 0 and not keep_going):
+                    break
+                if run_command(cmd, pkg=pkg, echo=True,
+                               stdout=stdout, stderr=stderr) != 0:
+                    retval = 1
+                o_files.append(o_name)
+        else:
+            retval, o_names = self.compile_jobs(jobs,
+                                                fortran_dependencies(f_files),
+                                                n_jobs, keep_going,
+                                                stdout, stderr)
+            o_files += o_names
+
+        if retval == 0:
+            for o_name, key in to_cache:
+                if os.path.isfile(o_name):
+                    cache.put(key, o_name)
+        o_files = cached + o_files
+
+        return retval, o_files
+
+    #---------------------------------------------------------------------------
+
+    def cached_objects(self, jobs, header_files, cache):
+        """
+        Split compile jobs into those whose object is found in the cache
+        (copied to the current directory) and those which must be run.
+
+        Return the remaining jobs, the names of cached objects, and
+        (object name, key) tuples for objects to add to the cache.
+        """
+        # Sources and headers are in temporary directories, whose path
+        # should not influence the key.
+
+        src_dirs = sorted(set([os.path.dirname(j[0]) for j in jobs]),
+                          key=len, reverse=True)
+
+        base_items = [self.pkg_key()]
+        for f in sorted(header_files, key=os.path.basename):
+            base_items += [os.path.basename(f), ('file', f)]
+
+        remaining = []
+        cached = []
+        to_cache = []
+
+        for f, cmd, o_name in jobs:
+            if fnmatch.fnmatch(f, '*.[fF]90'):
+                remaining.append((f, cmd, o_name))
+                continue
+            c_args = []
+            for a in cmd:
+                for d in src_dirs:
+                    a = a.replace(d, '<src>')
+                c_args.append(a)
+            key = cache.key(*(base_items + c_args + [('file', f)]))
+            if cache.get(key, o_name):
+                cached.append(o_name)
+            else:
+                remaining.append((f, cmd, o_name))
+                to_cache.append((o_name, key))
+
+        return remaining, cached, to_cache
+
+    #---------------------------------------------------------------------------
+
+    def pkg_key(self):
+        """
+        Return a string identifying the package build, for cache keys.
+        """
+        pkg = self.pkg
+        return repr((getattr(pkg, 'version_full', ''),
+                     pkg.get_dir('prefix'),
+                     sorted(pkg.config.compilers.items()),
+                     sorted(pkg.config.flags.items())))
+
+    #---------------------------------------------------------------------------
+
+    def compile_jobs(self, jobs, deps, n_jobs, keep_going=False,
+                     stdout=sys.stdout, stderr=sys.stderr):
+        """
+        Run compile commands concurrently.
+
+        jobs is a list of (source, command, object name) tuples, and deps
+        a dictionary of the sources on which a given source depends.
+        The output of each command is buffered, and written to stdout and
+        stderr in the order of the jobs list.
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, \
+            FIRST_COMPLETED
+
+        pkg = self.pkg
+
+        # Modify the PATH for relocatable installation once for all
+        # commands, as run_command would for each one.
+
+        saved_path = None
+        if pkg.config.features['relocatable'] == "yes":
+            if sys.platform.startswith("win"):
+                sep = ";"
+            else:
+                sep = ":"
+            saved_path = os.environ['PATH']
+            os.environ['PATH'] = pkg.get_dir('bindir') + sep + saved_path
+
+        def run_job(i):
+            out = tempfile.TemporaryFile(mode='w+', buffering=1)
+            err = tempfile.TemporaryFile(mode='w+', buffering=1)
+            retcode = run_command(jobs[i][1], echo=True, stdout=out, stderr=err)
+            return retcode, out, err
+
+        def replay(logs, i):
+            for f, dest in zip(logs[i], (stdout, stderr)):
+                f.seek(0)
+                dest.write(f.read())
+                dest.flush()
+                f.close()
+            logs[i] = None
+
+        retval = 0
+        job_id = dict([(j[0], i) for i, j in enumerate(jobs)])
+        status = [None]*len(jobs)
+        logs = [None]*len(jobs)
+        waiting = list(range(len(jobs)))
+        running = {}
+        next_log = 0
+
+        executor = ThreadPoolExecutor(max_workers=n_jobs)
+
+        try:
+            while waiting or running:
+
+                if retval != 0 and not keep_going:
+                    waiting = []
+
+                for i in list(waiting):
+                    if len(running) >= n_jobs:
+                        break
+                    ready = True
+                    for d in deps.get(jobs[i][0], ()):
+                        if d in job_id and status[job_id[d]] == None:
+                            ready = False
+                    # Circular dependencies: run jobs in list order
+                    if not ready and running == {} and i == waiting[0]:
+                        ready = True
+                    if ready:
+                        waiting.remove(i)
+                        running[executor.submit(run_job, i)] = i
+
+                if running == {}:
+                    break
+
+                done, not_done = wait(list(running.keys()),
+                                      return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    status[i], out, err = future.result()
+                    logs[i] = (out, err)
+                    if status[i] != 0:
+                        retval = 1
+
+                while next_log < len(jobs) and status[next_log] != None:
+                    replay(logs, next_log)
+                    next_log += 1
+
+        finally:
+            executor.shutdown(wait=True)
+            if saved_path != None:
+                os.environ['PATH'] = saved_path
+
+        for i in range(next_log, len(jobs)):
+            if logs[i] != None:
+                replay(logs, i)
+
+        o_files = [jobs[i][2] for i in range(len(jobs)) if status[i] != None]
 
         return retval, o_files
 
@@ -564,9 +960,13 @@ class cs_compile(object):
     def compile_and_link(self, base_name, srcdir, destdir=None, src_list=None,
                          opt_cflags=None, opt_cxxflags=None, opt_fcflags=None,
                          opt_libs=None, force_link=False, keep_going=False,
-                         stdout=sys.stdout, stderr=sys.stderr):
+                         stdout=sys.stdout, stderr=sys.stderr, n_jobs=None,
+                         cache=None):
         """
         Compilation and link function.
+
+        If a compile_cache is given, the executable is reused from it when
+        sources and build options are unchanged.
         """
         retval = 0
 
@@ -595,14 +995,33 @@ class cs_compile(object):
         for f in dir_files:
             src_list.append(os.path.join(srcdir, f))
 
-        retval, obj_list = self.compile_src(base_name, src_list,
-                                            opt_cflags, opt_cxxflags, opt_fcflags,
-                                            keep_going, stdout, stderr)
-
-        if retval == 0 and (force_link or len(obj_list)) > 0:
-            retval = self.link_obj(exec_name, obj_files=obj_list,
-                                   opt_libs=opt_libs,
-                                   stdout=stdout, stderr=stderr)
+        exec_key = None
+        if cache != None and destdir != None:
+            items = [self.pkg_key(), base_name,
+                     opt_cflags, opt_cxxflags, opt_fcflags, opt_libs]
+            for f in sorted(dir_files):
+                f_path = os.path.join(srcdir, f)
+                if os.path.isfile(f_path):
+                    items += [f, ('file', f_path)]
+            exec_key = cache.key(*items)
+            if cache.get(exec_key, exec_name):
+                stdout.write('Using cached executable: ' + base_name + '\n')
+                src_list = []
+
+        if src_list:
+
+            retval, obj_list = self.compile_src(base_name, src_list,
+                                                opt_cflags, opt_cxxflags,
+                                                opt_fcflags, keep_going,
+                                                stdout, stderr, n_jobs, cache)
+
+            if retval == 0 and (force_link or len(obj_list)) > 0:
+                retval = self.link_obj(exec_name, obj_files=obj_list,
+                                       opt_libs=opt_libs,
+                                       stdout=stdout, stderr=stderr)
+
+            if retval == 0 and exec_key != None and os.path.isfile(exec_name):
+                cache.put(exec_key, exec_name)
 
         # Cleanup
 
@@ -621,7 +1040,8 @@ class cs_compile(object):
 def compile_and_link(pkg, base_name, srcdir, destdir=None,
                      opt_cflags=None, opt_cxxflags=None, opt_fcflags=None,
                      opt_libs=None, force_link=False, keep_going=False,
-                     stdout=sys.stdout, stderr=sys.stderr):
+                     stdout=sys.stdout, stderr=sys.stderr, n_jobs=None,
+                     cache=None):
     """
     Compilation and link function.
     """
@@ -637,7 +1057,9 @@ def compile_and_link(pkg, base_name, srcdir, destdir=None,
                                  force_link=force_link,
                                  keep_going=keep_going,
                                  stdout=stdout,
-                                 stderr=stderr)
+                                 stderr=stderr,
+                                 n_jobs=n_jobs,
+                                 cache=cache)
 
     return retcode
 
@@ -656,7 +1078,8 @@ def main(argv, pkg):
         from cs_exec_environment import set_modules, source_rcfile
 
     test_mode, force_link, keep_going, src_dir, dest_dir, \
-        version, cflags, cxxflags, fcflags, libs = process_cmd_line(argv, pkg)
+        version, cflags, cxxflags, fcflags, libs, n_jobs \
+        = process_cmd_line(argv, pkg)
 
     if (version):
         pkg = pkg.get_alternate_version(version)
@@ -676,7 +1099,8 @@ def main(argv, pkg):
                                opt_fcflags=fcflags,
                                opt_libs=libs,
                                force_link=force_link,
-                               keep_going=keep_going)
+                               keep_going=keep_going,
+                               n_jobs=n_jobs)
 
     sys.exit(retcode)
 
@@ -590,9 +590,10 @@ def full_os_environ_for_shell(env=None):
 #-------------------------------------------------------------------------------
 
 def run_command(args, pkg = None, echo = False,
-                stdout = sys.stdout, stderr = sys.stderr, env = None):
+                stdout = sys.stdout, stderr = sys.stderr, env = None,
+                cwd = None):
     """
-    Run a command.
+    Run a command (in directory cwd if specified).
     """
     if echo == True:
         if type(args) == str:
@@ -626,6 +627,8 @@ def run_command(args, pkg = None, echo = False,
         kwargs['stdout'] = stdout
     if (stderr != sys.stderr):
         kwargs['stderr'] = stderr
+    if cwd != None:
+        kwargs['cwd'] = cwd
 
     returncode = 1
     try:
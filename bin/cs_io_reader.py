@@ -0,0 +1,564 @@
+#!/usr/bin/env python
+
+#-------------------------------------------------------------------------------
+
+# This file is part of Code_Saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2021 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module provides a native reader for files using the kernel I/O format
+(checkpoint/restart, preprocessor and partitioner output), giving access
+to section headers and to section values as NumPy arrays, without
+calling the cs_io_dump utility.
+
+The file layout is the one handled by src/base/cs_io.c and
+src/apps/cs_io_dump.c: a 128-byte magic string and file type, followed
+by the header size and alignments, then a series of (aligned) section
+headers, each optionally followed by an (aligned) body. All values
+are stored in big-endian order.
+
+This module defines the following classes and functions:
+- section_header
+- io_file
+- checkpoint_time_info
+- compare_files
+- IoReaderTestCase
+"""
+
+#===============================================================================
+# Import required Python modules
+#===============================================================================
+
+import os, sys
+import struct
+import tempfile
+import unittest
+
+import numpy
+
+#-------------------------------------------------------------------------------
+# Global definitions
+#-------------------------------------------------------------------------------
+
+_base_header = b'Code_Saturne I/O, BE, R0'
+
+# Big-endian NumPy data types associated with each kernel I/O type name
+
+_dtypes = {'c ': numpy.dtype('u1'),
+           'i4': numpy.dtype('>i4'),
+           'i8': numpy.dtype('>i8'),
+           'u4': numpy.dtype('>u4'),
+           'u8': numpy.dtype('>u8'),
+           'r4': numpy.dtype('>f4'),
+           'r8': numpy.dtype('>f8')}
+
+# Maximum number of values handled at once when comparing sections,
+# so as to bound memory usage for large sections
+
+_block_size = 1 << 20
+
+#-------------------------------------------------------------------------------
+# Helper functions
+#-------------------------------------------------------------------------------
+
+def _align(offset, alignment):
+    """
+    Return offset padded to the next multiple of alignment.
+    """
+    if alignment > 0:
+        offset += (alignment - (offset % alignment)) % alignment
+    return offset
+
+#-------------------------------------------------------------------------------
+
+def _c_string(b):
+    """
+    Convert a NULL-terminated byte string to a Python string.
+    """
+    i = b.find(b'\0')
+    if i > -1:
+        b = b[:i]
+    return b.decode('utf-8', 'replace')
+
+#===============================================================================
+# Class describing a file section header
+#===============================================================================
+
+class section_header(object):
+    """
+    Section header metadata.
+    """
+
+    def __init__(self, name, n_vals, location_id, index_id, n_location_vals,
+                 type_name, offset, data=None):
+
+        self.name = name
+        self.n_vals = n_vals
+        self.location_id = location_id
+        self.index_id = index_id
+        self.n_location_vals = n_location_vals
+        self.type_name = type_name
+        self.offset = offset    # position of section body, or None if embedded
+        self.data = data        # embedded data bytes, or None
+
+    #---------------------------------------------------------------------------
+
+    def dtype(self):
+        """
+        Return the NumPy data type associated with this section.
+        """
+        try:
+            return _dtypes[self.type_name]
+        except KeyError:
+            raise ValueError('Type "%s" is not known\n'
+                             'Known types: %s' % (self.type_name,
+                                                  str(list(_dtypes.keys()))))
+
+#===============================================================================
+# Class describing a kernel I/O file
+#===============================================================================
+
+class io_file(object):
+    """
+    Read-only access to a kernel I/O file.
+
+    The section index is built when the file is opened, reading only
+    section headers. Section bodies are memory-mapped on demand.
+    """
+
+    def __init__(self, path):
+        """
+        Open file and build section index.
+        """
+
+        self.path = path
+        self.file_type = None
+        self.header_size = 0
+        self.header_align = 0
+        self.body_align = 0
+        self.sections = []
+
+        f = open(path, 'rb')
+        try:
+            self.__read_index(f)
+        finally:
+            f.close()
+
+    #---------------------------------------------------------------------------
+
+    def __read_index(self, f):
+        """
+        Read file and section headers.
+        """
+
+        f.seek(0, os.SEEK_END)
+        end_offset = f.tell()
+        f.seek(0, os.SEEK_SET)
+
+        buf = f.read(152)
+        if len(buf) < 152 or _c_string(buf[:64]) != _base_header.decode():
+            raise IOError('File format of "%s" is not recognized.' % self.path)
+
+        self.file_type = _c_string(buf[64:128])
+        self.header_size, self.header_align, self.body_align \
+            = struct.unpack('>3Q', buf[128:152])
+
+        offset = 152
+
+        while True:
+
+            offset = _align(offset, self.header_align)
+            if offset + self.header_size > end_offset:
+                break
+
+            f.seek(offset, os.SEEK_SET)
+            buf = f.read(self.header_size)
+
+            h_vals = struct.unpack('>6Q', buf[:48])
+            if h_vals[0] > self.header_size:
+                buf += f.read(h_vals[0] - self.header_size)
+
+            n_vals = h_vals[1]
+            type_field = buf[48:56]
+            type_name = _c_string(type_field[:7])
+            name = _c_string(buf[56:])
+
+            offset += max(self.header_size, h_vals[0])
+
+            sh = section_header(name, n_vals, h_vals[2], h_vals[3], h_vals[4],
+                                type_name, None)
+
+            if n_vals > 0:
+                data_size = n_vals * sh.dtype().itemsize
+                if type_field[7:8] == b'e':
+                    start = 56 + h_vals[5]
+                    sh.data = buf[start:start + data_size]
+                else:
+                    offset = _align(offset, self.body_align)
+                    sh.offset = offset
+                    offset += data_size
+
+            self.sections.append(sh)
+
+    #---------------------------------------------------------------------------
+
+    def find_section(self, name, location_id=None):
+        """
+        Return the first section header matching a given name
+        (and location id if given), or None.
+        """
+
+        for sh in self.sections:
+            if sh.name == name:
+                if location_id == None or sh.location_id == location_id:
+                    return sh
+
+        return None
+
+    #---------------------------------------------------------------------------
+
+    def read_section(self, sh):
+        """
+        Return section values as a NumPy array (memory-mapped for
+        non-embedded data), or None for sections with no values.
+        """
+
+        if sh.n_vals == 0:
+            return None
+
+        dtype = sh.dtype()
+
+        if sh.data != None:
+            return numpy.frombuffer(sh.data, dtype=dtype, count=sh.n_vals)
+
+        return numpy.memmap(self.path, dtype=dtype, mode='r',
+                            offset=sh.offset, shape=(sh.n_vals,))
+
+    #---------------------------------------------------------------------------
+
+    def read_values(self, name, location_id=None):
+        """
+        Return values of a section given its name, or None if not present.
+        """
+
+        sh = self.find_section(name, location_id)
+        if sh == None:
+            return None
+
+        return self.read_section(sh)
+
+#-------------------------------------------------------------------------------
+# Time step and time of a checkpoint file
+#-------------------------------------------------------------------------------
+
+def checkpoint_time_info(path):
+    """
+    Return the number of time steps and the physical time of a
+    checkpoint file (-1 for values which are not found), reading only
+    the section headers and those two values.
+    """
+
+    f = io_file(path)
+
+    nt = -1
+    for name in ('nbre_pas_de_temps', 'ntcabs'):
+        v = f.read_values(name)
+        if v is not None and len(v) > 0:
+            nt = int(v[0])
+            break
+
+    t = -1
+    for name in ('instant_precedent', 'ttcabs'):
+        v = f.read_values(name)
+        if v is not None and len(v) > 0:
+            t = float(v[0])
+            break
+
+    return nt, t
+
+#-------------------------------------------------------------------------------
+# Compare two sections
+#-------------------------------------------------------------------------------
+
+def _compare_real_values(v1, v2, threshold):
+    """
+    Compare real-valued arrays by blocks, returning the number of
+    differences and max, total, max relative and total relative differences.
+    """
+
+    n_diffs = 0
+    stats = [0.0, 0.0, 0.0, 0.0]
+
+    n_vals = len(v1)
+
+    for s in range(0, n_vals, _block_size):
+        e = min(s + _block_size, n_vals)
+        a = numpy.asarray(v1[s:e], dtype=numpy.float64)
+        b = numpy.asarray(v2[s:e], dtype=numpy.float64)
+        delta = numpy.abs(a - b)
+        mask = delta > threshold
+        n = int(numpy.count_nonzero(mask))
+        if n > 0:
+            d = delta[mask]
+            d_r = d / numpy.maximum(numpy.abs(a[mask]), numpy.abs(b[mask]))
+            n_diffs += n
+            stats[0] = max(stats[0], float(d.max()))
+            stats[1] += float(d.sum())
+            stats[2] = max(stats[2], float(d_r.max()))
+            stats[3] += float(d_r.sum())
+
+    return n_diffs, stats
+
+#-------------------------------------------------------------------------------
+
+def _compare_other_values(v1, v2):
+    """
+    Compare integer or character arrays by blocks, returning the number
+    of differences.
+    """
+
+    n_diffs = 0
+    n_vals = len(v1)
+
+    for s in range(0, n_vals, _block_size):
+        e = min(s + _block_size, n_vals)
+        a = numpy.asarray(v1[s:e], dtype=numpy.int64)
+        b = numpy.asarray(v2[s:e], dtype=numpy.int64)
+        n_diffs += int(numpy.count_nonzero(a != b))
+
+    return n_diffs
+
+#-------------------------------------------------------------------------------
+# Compare two files
+#-------------------------------------------------------------------------------
+
+def compare_files(path1, path2, threshold=1.e-30, section=None, location=None):
+    """
+    Compare sections with matching names and locations in two files,
+    using the same rules as "cs_io_dump --diff".
+
+    Returns a list of dictionaries describing the sections which differ,
+    with keys 'name', 'location', 'type', 'n_vals' and 'n_diffs'.
+    Sections whose sizes or types differ also have 'size_mismatch' and
+    'type_mismatch' keys; for other real-valued sections, 'max', 'mean',
+    'rel_max' and 'rel_mean' are also present.
+    """
+
+    f1 = io_file(path1)
+    f2 = io_file(path2)
+
+    diffs = []
+
+    for sh1 in f1.sections:
+
+        if section != None and sh1.name != section:
+            continue
+        if location != None and sh1.location_id != location:
+            continue
+
+        for sh2 in f2.sections:
+
+            if sh1.name != sh2.name or sh1.location_id != sh2.location_id:
+                continue
+
+            if sh1.n_vals == 0 and sh2.n_vals == 0:
+                continue
+
+            # Compare integer types as 64-bit signed integers
+
+            c_type1, c_type2 = sh1.type_name[:1], sh2.type_name[:1]
+            if c_type1 == 'u':
+                c_type1 = 'i'
+            if c_type2 == 'u':
+                c_type2 = 'i'
+
+            d = {'name': sh1.name,
+                 'location': sh1.location_id,
+                 'type': sh1.type_name,
+                 'n_vals': sh1.n_vals,
+                 'n_diffs': 0}
+
+            if sh1.n_vals != sh2.n_vals or c_type1 != c_type2:
+                d['size_mismatch'] = (sh1.n_vals != sh2.n_vals)
+                d['type_mismatch'] = (c_type1 != c_type2)
+                diffs.append(d)
+                continue
+
+            v1 = f1.read_section(sh1)
+            v2 = f2.read_section(sh2)
+
+            if c_type1 == 'r':
+                n_diffs, stats = _compare_real_values(v1, v2, threshold)
+                if n_diffs > 0:
+                    d['max'] = stats[0]
+                    d['mean'] = stats[1] / n_diffs
+                    d['rel_max'] = stats[2]
+                    d['rel_mean'] = stats[3] / n_diffs
+            else:
+                n_diffs = _compare_other_values(v1, v2)
+
+            if n_diffs > 0:
+                d['n_diffs'] = n_diffs
+                diffs.append(d)
+
+    return diffs
+
+#-------------------------------------------------------------------------------
+# Unit tests
+#-------------------------------------------------------------------------------
+
+def _write_test_file(path, sections):
+    """
+    Write a kernel I/O file with the given (name, type_name, values,
+    embedded) sections, using 64-byte headers and 8-byte alignment.
+    """
+
+    f = open(path, 'wb')
+
+    f.write(_base_header.ljust(64, b'\0'))
+    f.write(b'Checkpoint / restart, R0'.ljust(64, b'\0'))
+    f.write(struct.pack('>3Q', 64, 8, 8))
+    offset = 152
+
+    for name, type_name, values, embedded in sections:
+
+        data = numpy.asarray(values, dtype=_dtypes[type_name]).tobytes()
+        name_b = name.encode().ljust(_align(len(name) + 1, 8), b'\0')
+        h_size = 56 + len(name_b)
+        if embedded:
+            h_size = _align(h_size + len(data), 8)
+
+        type_field = type_name.encode().ljust(7, b'\0')
+        type_field += b'e' if embedded else b'\0'
+
+        buf = struct.pack('>6Q', h_size, len(values), 1, 0, 1,
+                          len(name_b)) + type_field + name_b
+        if embedded:
+            buf += data
+        buf = buf.ljust(max(h_size, 64), b'\0')
+
+        f.write(buf)
+        offset += len(buf)
+
+        if not embedded:
+            pad = _align(offset, 8) - offset
+            f.write(b'\0'*pad + data)
+            offset += pad + len(data)
+
+    f.close()
+
+#-------------------------------------------------------------------------------
+
+class IoReaderTestCase(unittest.TestCase):
+    """
+    Check reading and comparison of kernel I/O files.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ref = os.path.join(self.dir, 'ref.csc')
+        _write_test_file(self.ref,
+                         [('ntcabs', 'i4', [10], True),
+                          ('ttcabs', 'r8', [0.5], True),
+                          ('velocity', 'r8', [1., 2., 3., 4.], False)])
+
+    def tearDown(self):
+        for f in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, f))
+        os.rmdir(self.dir)
+
+    def checkHeader(self):
+        """Check file and section headers"""
+        f = io_file(self.ref)
+        assert f.file_type == 'Checkpoint / restart, R0', \
+            'Could not read file type'
+        assert [sh.name for sh in f.sections] \
+            == ['ntcabs', 'ttcabs', 'velocity'], \
+            'Could not read section names'
+        sh = f.find_section('velocity')
+        assert sh.type_name == 'r8' and sh.n_vals == 4, \
+            'Could not read section header'
+
+    def checkSectionValues(self):
+        """Check embedded and non-embedded section values"""
+        f = io_file(self.ref)
+        assert list(f.read_values('ntcabs')) == [10], \
+            'Could not read embedded section'
+        assert list(f.read_values('velocity')) == [1., 2., 3., 4.], \
+            'Could not read non-embedded section'
+        assert f.read_values('pressure') == None, \
+            'Missing section should not be found'
+        assert checkpoint_time_info(self.ref) == (10, 0.5), \
+            'Could not read checkpoint time info'
+
+    def checkCompareFiles(self):
+        """Check comparison statistics"""
+        dest = os.path.join(self.dir, 'dest.csc')
+        _write_test_file(dest,
+                         [('ntcabs', 'i4', [10], True),
+                          ('ttcabs', 'r8', [0.5], True),
+                          ('velocity', 'r8', [1., 2.5, 3., 5.], False)])
+        diffs = compare_files(self.ref, dest)
+        assert len(diffs) == 1 and diffs[0]['name'] == 'velocity', \
+            'Differing section not found'
+        d = diffs[0]
+        assert d['n_diffs'] == 2, 'Wrong number of differences'
+        assert d['max'] == 1. and d['mean'] == 0.75, \
+            'Wrong difference statistics'
+        assert compare_files(self.ref, dest, threshold=2.) == [], \
+            'Threshold not applied'
+
+        _write_test_file(dest,
+                         [('velocity', 'r8', [1., 2., 3.], False)])
+        diffs = compare_files(self.ref, dest)
+        assert len(diffs) == 1 and diffs[0]['size_mismatch'], \
+            'Size mismatch not detected'
+
+    def checkUnreadableFile(self):
+        """Check errors for missing or unrecognized files"""
+        dest = os.path.join(self.dir, 'dest.csc')
+        try:
+            compare_files(self.ref, dest)
+            assert False, 'Missing file not detected'
+        except IOError:
+            pass
+        f = open(dest, 'wb')
+        f.write(b'not a checkpoint file')
+        f.close()
+        try:
+            compare_files(self.ref, dest)
+            assert False, 'Unrecognized file not detected'
+        except IOError:
+            pass
+
+#-------------------------------------------------------------------------------
+
+def suite():
+    testSuite = unittest.makeSuite(IoReaderTestCase, "check")
+    return testSuite
+
+def runTest():
+    print("IoReaderTestCase")
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -26,6 +26,29 @@
 import os
 import re
 
+#===============================================================================
+# Global definitions
+#===============================================================================
+
+# Mathematical functions usable in expressions, with their number of arguments
+
+_math_functions = {'abs':1, 'acos':1, 'asin':1, 'atan':1, 'atan2':2,
+                   'ceil':1, 'cos':1, 'cosh':1, 'erf':1, 'exp':1, 'fabs':1,
+                   'floor':1, 'fmax':2, 'fmin':2, 'int':1, 'log':1,
+                   'log10':1, 'max':2, 'min':2, 'mod':2, 'pow':2, 'sin':1,
+                   'sinh':1, 'sqrt':1, 'tan':1, 'tanh':1}
+
+# C keywords and types usable in expressions
+
+_c_keywords = ('if', 'else', 'while', 'for', 'do', 'return', 'break',
+               'continue', 'const', 'int', 'double', 'cs_real_t', 'cs_lnum_t')
+
+_operators = ('<=', '>=', '!=', '==', '||', '&&', '+=', '-=', '*=', '/=', '**',
+              '=', ',', ':', '+', '-', '*', '/', '<', '>', '^', '%', '!', '?')
+
+_re_identifier = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\[[A-Za-z0-9_]+\])?$')
+_re_number = re.compile(r'^([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$')
+
 #===============================================================================
 # Utility functions
 #===============================================================================
@@ -929,4 +952,112 @@ class cs_math_parser:
 
         return usr_code, usr_defs
 
+    #---------------------------------------------------------------------------
+
+    def check_expression(self, expression, symbols):
+        """
+        Check an expression without generating code, detecting unbalanced
+        parentheses or braces, undefined symbols, wrong numbers of function
+        arguments, and missing operators or statement separators.
+        Symbols is the list of names defined for the expression.
+        Returns a list of (line, column, message) tuples, empty if no
+        error was detected.
+        """
+
+        errors = []
+
+        exp_lines = expression.split("\n")
+        segments = self.separate_segments(exp_lines)
+        tokens, comments = self.tokenize(segments)
+
+        if not tokens:
+            return errors
+
+        # Symbols assigned in the expression are defined locally
+
+        known = set(symbols)
+        for t_i, t in enumerate(tokens):
+            if t[0] in ('=', '+=', '-=', '*=', '/=') and t_i > 0:
+                known.add(tokens[t_i-1][0])
+
+        # Parentheses and braces
+
+        match = {')': '(', '}': '{'}
+        level_open = []
+        closing = {}
+        for t_i, t in enumerate(tokens):
+            if t[0] in ('(', '{'):
+                level_open.append(t_i)
+            elif t[0] in (')', '}'):
+                if level_open and tokens[level_open[-1]][0] == match[t[0]]:
+                    closing[level_open.pop()] = t_i
+                else:
+                    errors.append((t[1], t[2],
+                                   "'%s' does not have a matching '%s'"
+                                   % (t[0], match[t[0]])))
+                    return errors
+        if level_open:
+            t = tokens[level_open[-1]]
+            errors.append((t[1], t[2], "'%s' is not closed" % t[0]))
+            return errors
+
+        # Symbols, functions and operators
+
+        def is_operand(tk):
+            if _re_number.match(tk):
+                return True
+            return _re_identifier.match(tk) != None \
+                and tk not in _c_keywords and tk not in _math_functions
+
+        prev = None
+        for t_i, t in enumerate(tokens):
+            tk = t[0]
+            nxt = None
+            if t_i+1 < len(tokens):
+                nxt = tokens[t_i+1][0]
+
+            if tk in _math_functions and nxt == '(' and tk not in known:
+                n_args = 0
+                level = 0
+                for u in tokens[t_i+2:closing[t_i+1]]:
+                    if u[0] in ('(', '{'):
+                        level += 1
+                    elif u[0] in (')', '}'):
+                        level -= 1
+                    elif u[0] == ',' and level == 0:
+                        n_args += 1
+                if closing[t_i+1] > t_i+2:
+                    n_args += 1
+                if n_args != _math_functions[tk]:
+                    errors.append((t[1], t[2],
+                                   "'%s' expects %d argument(s), %d given"
+                                   % (tk, _math_functions[tk], n_args)))
+
+            elif _re_number.match(tk) or tk in _c_keywords:
+                pass
+
+            elif _re_identifier.match(tk):
+                if tk not in known and tk.split('[')[0] not in known:
+                    errors.append((t[1], t[2], "unknown symbol '%s'" % tk))
+
+            elif tk not in _operators and tk not in ('(', ')', '{', '}', ';'):
+                errors.append((t[1], t[2], "unexpected '%s'" % tk))
+
+            if prev != None and is_operand(prev):
+                if is_operand(tk):
+                    errors.append((t[1], t[2],
+                                   "missing operator or ';' before '%s'" % tk))
+                elif tk == '(':
+                    errors.append((t[1], t[2],
+                                   "'%s' is not a function" % prev))
+
+            prev = tk
+
+        t = tokens[-1]
+        if t[0] not in (';', '}'):
+            errors.append((t[1], t[2] + len(t[0]),
+                           "missing ';' at end of expression"))
+
+        return errors
+
 #-------------------------------------------------------------------------------
@@ -25,6 +25,9 @@
 
 import os
 import re
+import hashlib
+import json
+import tempfile
 
 from code_saturne.cs_math_parser import cs_math_parser
 
@@ -200,7 +203,186 @@ _base_tokens = {'dt':'const cs_real_t dt = cs_glob_time_step->dt[0];',
                 'uref':'const cs_real_t uref = cs_glob_turb_ref_values->uref;',
                 'almax':'const cs_real_t almax = cs_glob_turb_ref_values->almax;'}
 
-#---------------------------------------------------------------------------
+#===============================================================================
+# Translation cache
+#===============================================================================
+
+_meg_cache_name = '.meg_cache.json'
+
+_meg_caches = {}
+
+_translator_signature = None
+
+#-------------------------------------------------------------------------------
+
+def translator_signature():
+    """
+    Return a hash of the translator sources, so that cached translations
+    are discarded when the translator changes.
+    """
+
+    global _translator_signature
+
+    if _translator_signature == None:
+        h = hashlib.sha256()
+        from code_saturne import cs_math_parser as m
+        for f in (__file__, m.__file__):
+            try:
+                with open(f, 'rb') as fp:
+                    h.update(fp.read())
+            except Exception:
+                h.update(os.path.basename(f).encode('utf-8'))
+        _translator_signature = h.hexdigest()
+
+    return _translator_signature
+
+#-------------------------------------------------------------------------------
+
+class meg_cache:
+    """
+    Cache of MEG expression translations, indexed by a hash of the
+    expression and of all symbols and tokens used in its translation.
+
+    Entries are kept in memory, and may be saved to a file so as to be
+    reused by later sessions or runs; only entries used since the cache
+    was loaded are saved, so entries for removed formulas are dropped.
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize cache object, loading entries from path if given.
+        """
+
+        self.path = path
+        self.entries = {}
+        self.used = set()
+        self.modified = False
+
+        self.n_hits = 0
+        self.n_misses = 0
+
+        if self.path:
+            self.load()
+
+    #---------------------------------------------------------------------------
+
+    def load(self):
+        """
+        Load entries from the cache file, if present and valid.
+        """
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except Exception:
+            return
+
+        if data.get('signature') == translator_signature():
+            self.entries.update(data.get('entries', {}))
+
+    #---------------------------------------------------------------------------
+
+    def save(self):
+        """
+        Save used entries to the cache file, if they changed.
+        """
+
+        if not self.path:
+            return
+
+        if not self.modified and len(self.used) == len(self.entries):
+            return
+
+        entries = {}
+        for k in self.used:
+            entries[k] = self.entries[k]
+        data = {'signature': translator_signature(), 'entries': entries}
+
+        # Write to a unique temporary file, then rename it, so that
+        # concurrent runs on the same case never read a partial file
+        # (the last complete file written is kept).
+
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp',
+                                            dir=os.path.dirname(self.path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self.modified = False
+        except OSError:
+            # The cache is optional; translations will be done again
+            if tmp_path != None and os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    #---------------------------------------------------------------------------
+
+    def key(self, *args):
+        """
+        Return a key based on translation arguments.
+        """
+
+        s = json.dumps(args, sort_keys=True)
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    #---------------------------------------------------------------------------
+
+    def get(self, key):
+        """
+        Return a cached translation, or None.
+        """
+
+        e = self.entries.get(key)
+        if e == None:
+            self.n_misses += 1
+        else:
+            self.n_hits += 1
+            self.used.add(key)
+
+        return e
+
+    #---------------------------------------------------------------------------
+
+    def put(self, key, value):
+        """
+        Add a translation to the cache.
+        """
+
+        self.entries[key] = value
+        self.used.add(key)
+        self.modified = True
+
+    #---------------------------------------------------------------------------
+
+    def stats(self):
+        """
+        Return a dictionary of cache statistics.
+        """
+
+        return {'hits': self.n_hits,
+                'misses': self.n_misses,
+                'entries': len(self.entries)}
+
+#-------------------------------------------------------------------------------
+
+def get_meg_cache(cache_dir=None):
+    """
+    Return the translation cache shared by interpreters in this process,
+    saved in the given directory if not None.
+    """
+
+    path = None
+    if cache_dir:
+        path = os.path.join(os.path.abspath(cache_dir), _meg_cache_name)
+
+    if path not in _meg_caches:
+        _meg_caches[path] = meg_cache(path)
+
+    return _meg_caches[path]
+
+#===============================================================================
+# Expression translation
+#===============================================================================
 
 def parse_gui_expression(expression,
                          req,
@@ -210,7 +392,20 @@ def parse_gui_expression(expression,
                          loop_tokens,
                          need_for_loop = False,
                          indent_decl = 2,
-                         indent_main = 3):
+                         indent_main = 3,
+                         cache = None):
+
+    # Reuse cached translation if available (updating known symbols
+    # as the parser would)
+
+    if cache != None:
+        key = cache.key(expression, req, known_symbols, func_type,
+                        glob_tokens, loop_tokens, need_for_loop,
+                        indent_decl, indent_main)
+        e = cache.get(key)
+        if e != None:
+            known_symbols[:] = e[2]
+            return e[0], e[1]
 
     usr_code = ''
     usr_defs = ''
@@ -237,6 +432,9 @@ def parse_gui_expression(expression,
     for exp in expr_list:
         usr_code += ntabs*tab + exp
 
+    if cache != None:
+        cache.put(key, [usr_code, usr_defs, list(known_symbols)])
+
     return usr_code, usr_defs
 
 #===============================================================================
@@ -269,11 +467,15 @@ class meg_to_c_interpreter:
                  case,
                  create_functions=True,
                  module_name=None,
-                 wdir=None):
+                 wdir=None,
+                 cache_dir=None):
 
         self.case = case
         self.wdir = wdir
 
+        # Translation cache, saved in cache_dir if given
+        self.cache = get_meg_cache(cache_dir)
+
         if module_name:
             self.module_name = module_name
         else:
@@ -464,7 +666,8 @@ class meg_to_c_interpreter:
                                           known_symbols,
                                           'vol',
                                           glob_tokens,
-                                          loop_tokens)
+                                          loop_tokens,
+                                          cache=self.cache)
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
             usr_defs += parsed_exp[1]
@@ -612,7 +815,8 @@ class meg_to_c_interpreter:
                                           'bnd',
                                           glob_tokens,
                                           loop_tokens,
-                                          need_for_loop)
+                                          need_for_loop,
+                                          cache=self.cache)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
@@ -729,7 +933,8 @@ class meg_to_c_interpreter:
                                           known_symbols,
                                           'src',
                                           glob_tokens,
-                                          loop_tokens)
+                                          loop_tokens,
+                                          cache=self.cache)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
@@ -843,7 +1048,8 @@ class meg_to_c_interpreter:
                                           known_symbols,
                                           'ini',
                                           glob_tokens,
-                                          loop_tokens)
+                                          loop_tokens,
+                                          cache=self.cache)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
@@ -931,7 +1137,8 @@ class meg_to_c_interpreter:
                                           known_symbols,
                                           'ibm',
                                           glob_tokens,
-                                          loop_tokens)
+                                          loop_tokens,
+                                          cache=self.cache)
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
             usr_defs += parsed_exp[1]
@@ -996,7 +1203,8 @@ class meg_to_c_interpreter:
                                           'fsi',
                                           glob_tokens,
                                           loop_tokens,
-                                          indent_decl=3)
+                                          indent_decl=3,
+                                          cache=self.cache)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
@@ -1100,7 +1308,8 @@ class meg_to_c_interpreter:
                                           'pwa',
                                           glob_tokens,
                                           loop_tokens,
-                                          indent_decl=2)
+                                          indent_decl=2,
+                                          cache=self.cache)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
@@ -1176,7 +1385,8 @@ class meg_to_c_interpreter:
                                           'pwa',
                                           glob_tokens,
                                           loop_tokens,
-                                          indent_decl=3)
+                                          indent_decl=3,
+                                          cache=self.cache)
 
         usr_code += parsed_exp[0]
         if parsed_exp[1] != '':
@@ -2041,7 +2251,97 @@ class meg_to_c_interpreter:
 
     #---------------------------------------------------------------------------
 
-    def check_meg_code_syntax(self, function_name):
+    def check_meg_expression(self, func_type, key):
+        """
+        Check the expression of a given block without generating or
+        compiling code, returning a list of error messages.
+        """
+
+        func_params = self.funcs[func_type][key]
+
+        symbols = ['x', 'y', 'z', 'xyz']
+        symbols += list(_base_tokens.keys())
+        symbols += list(self.notebook.keys())
+        symbols += list(_pkg_fluid_prop_dict[self.module_name].keys())
+        if func_params['tpe'] == "momentum_source_term":
+            symbols += ['u', 'v', 'w', 'velocity']
+        for l in (func_params['req'], func_params['sym'], func_params['knf']):
+            for s in l:
+                if type(s) == tuple:
+                    s = s[0]
+                symbols.append(s)
+
+        parser = cs_math_parser()
+        errors = parser.check_expression(func_params['exp'], symbols)
+
+        zone, name = key.split('::')
+        msg = []
+        for e in errors:
+            msg.append('%s (%s), line %d, column %d: %s'
+                       % (name, zone, e[0]+1, e[1]+1, e[2]))
+
+        return msg
+
+    #---------------------------------------------------------------------------
+
+    def evaluate_expression(self, func_type, key, points, values=None):
+        """
+        Evaluate the expression of a given block at sample points using
+        NumPy, without generating or compiling code.
+        Points are given as a dictionary of 'x', 'y', and 'z' arrays, or
+        an array of coordinates. Values of other symbols may be given as
+        a dictionary (notebook variables default to their values).
+        Returns a dictionary of values of required symbols.
+        """
+
+        import numpy
+        from code_saturne.cs_meg_to_numpy import meg_to_numpy
+
+        func_params = self.funcs[func_type][key]
+
+        v = {}
+        for k in self.notebook.keys():
+            v[k] = float(self.notebook[k])
+        if isinstance(points, dict):
+            v.update(points)
+        else:
+            points = numpy.asarray(points).reshape(-1, 3)
+            for i, c in enumerate(('x', 'y', 'z')):
+                v[c] = points[:, i]
+        if values:
+            v.update(values)
+
+        m = meg_to_numpy(func_params['exp'])
+        outputs = m.evaluate(v)
+
+        results = {}
+        for r in func_params['req']:
+            if type(r) == tuple:
+                r = r[0]
+            if r in outputs:
+                results[r] = outputs[r]
+
+        return results
+
+    #---------------------------------------------------------------------------
+
+    def check_meg_code_syntax(self, function_name, deep=False):
+        """
+        Check the syntax of expressions of a given function type.
+        Expressions are first checked in-process; if no error is found
+        and deep is True, the generated code is also compiled.
+        """
+
+        msg = ''
+        n_errors = 0
+        if function_name in self.funcs:
+            for key in self.funcs[function_name]:
+                for m in self.check_meg_expression(function_name, key):
+                    msg += m + '\n'
+                    n_errors += 1
+
+        if n_errors > 0 or not deep:
+            return n_errors, msg, n_errors
 
         if not os.path.exists(self.tmp_path):
             os.makedirs(self.tmp_path)
@@ -2067,6 +2367,7 @@ class meg_to_c_interpreter:
                                                        solver,
                                                        self.tmp_path,
                                                        opt_cflags='-w',
+                                                       keep_going=True,
                                                        stdout=out,
                                                        stderr=err)
         out.close()
@@ -2163,12 +2464,11 @@ class meg_to_c_interpreter:
 
     def save_function(self, func_type, hard_path = None):
 
-        # Delete previous existing file
         file2write = _function_names[func_type]
-        self.delete_file(file2write)
 
         # Check if it is a standard computation
         if getRunType(self.case) != 'standard':
+            self.__remove_function_file__(func_type, hard_path)
             return 0
 
         # Generate the functions code if needed
@@ -2184,6 +2484,7 @@ class meg_to_c_interpreter:
                 w_block = self.write_block(func_type, key)
                 if w_block == None:
                     continue
+
                 zone_name, var_name = key.split('::')
                 var_name = var_name.replace("+", ", ")
                 m1 = _block_comments[func_type] % (var_name, zone_name)
@@ -2203,6 +2504,27 @@ class meg_to_c_interpreter:
 
             code_to_write += _file_footer
 
+        if code_to_write == '':
+            self.__remove_function_file__(func_type, hard_path)
+            return 0
+
+        # Do not rewrite an unchanged file, so as to preserve its
+        # modification time for tools comparing it. Compiling only the
+        # function families whose code changed is handled by the compile
+        # cache, which reuses object files by source contents (the solver
+        # is built in a new execution directory for each run).
+
+        fpath = self.__file_path__(file2write, hard_path=hard_path)
+        if os.path.isfile(fpath):
+            try:
+                f = open(fpath, 'r')
+                prev_code = f.read()
+                f.close()
+                if prev_code == code_to_write:
+                    return 1
+            except Exception:
+                pass
+
         # Write the C file if necessary
         save_status = self.save_file(file2write,
                                      code_to_write,
@@ -2212,6 +2534,15 @@ class meg_to_c_interpreter:
 
     #---------------------------------------------------------------------------
 
+    def __remove_function_file__(self, func_type, hard_path=None):
+
+        fpath = self.__file_path__(_function_names[func_type],
+                                   hard_path=hard_path)
+        if os.path.isfile(fpath):
+            os.remove(fpath)
+
+    #---------------------------------------------------------------------------
+
     def save_all_functions(self):
 
         save_status = 0
@@ -2235,9 +2566,12 @@ class meg_to_c_interpreter:
         if is_empty == 1:
             state = -1
 
+        self.cache.save()
+
         ret = {'state':save_status,
                'exps':empty_exps,
-               'nexps':len(empty_exps)}
+               'nexps':len(empty_exps),
+               'cache':self.cache.stats()}
 
         return ret
 
@@ -0,0 +1,743 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+
+# This file is part of Code_Saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2021 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module defines a NumPy evaluator for MEG expressions, allowing
+formulas to be evaluated on arrays of sample points without generating
+or compiling C code.
+
+Expressions are compiled to a vectorized Python function: mathematical
+functions are mapped to NumPy ufuncs, and conditionals (if/else blocks
+and ternary operators) to masked assignments using numpy.where, so that
+all points are handled at once.
+
+This module contains the following classes and functions:
+- MegError
+- meg_to_numpy
+- sample_grid
+- mesh_sample_points
+"""
+
+#===============================================================================
+# Import required Python modules
+#===============================================================================
+
+import math
+
+import numpy
+
+from code_saturne.cs_math_parser import cs_math_parser, \
+    _re_identifier, _re_number
+
+#-------------------------------------------------------------------------------
+# Global definitions
+#-------------------------------------------------------------------------------
+
+# Mathematical functions: NumPy expression, number of arguments,
+# and type of result
+
+_np_functions = {'abs':('_np.abs', 1, 'real'),
+                 'acos':('_np.arccos', 1, 'real'),
+                 'asin':('_np.arcsin', 1, 'real'),
+                 'atan':('_np.arctan', 1, 'real'),
+                 'atan2':('_np.arctan2', 2, 'real'),
+                 'ceil':('_np.ceil', 1, 'real'),
+                 'cos':('_np.cos', 1, 'real'),
+                 'cosh':('_np.cosh', 1, 'real'),
+                 'erf':('_erf', 1, 'real'),
+                 'exp':('_np.exp', 1, 'real'),
+                 'fabs':('_np.abs', 1, 'real'),
+                 'floor':('_np.floor', 1, 'real'),
+                 'fmax':('_np.fmax', 2, 'real'),
+                 'fmin':('_np.fmin', 2, 'real'),
+                 'int':('_np.trunc', 1, 'int'),
+                 'log':('_np.log', 1, 'real'),
+                 'log10':('_np.log10', 1, 'real'),
+                 'max':('_np.fmax', 2, 'real'),
+                 'min':('_np.fmin', 2, 'real'),
+                 'mod':('_mod', 2, 'int'),
+                 'pow':('_pow', 2, 'real'),
+                 'sin':('_np.sin', 1, 'real'),
+                 'sinh':('_np.sinh', 1, 'real'),
+                 'sqrt':('_np.sqrt', 1, 'real'),
+                 'tan':('_np.tan', 1, 'real'),
+                 'tanh':('_np.tanh', 1, 'real')}
+
+# Declaration types
+
+_c_types = {'cs_real_t':'real', 'double':'real', 'float':'real',
+            'int':'int', 'cs_lnum_t':'int', 'cs_gnum_t':'int'}
+
+# Symbols with integer values
+
+_int_symbols = ('iter',)
+
+# Default values of constants
+
+_constants = {'pi':math.pi}
+
+# Binary operators, by increasing precedence level
+
+_binary_levels = (('||',), ('&&',), ('==', '!='), ('<', '>', '<=', '>='),
+                  ('+', '-'), ('*', '/', '%'))
+
+#-------------------------------------------------------------------------------
+# Helper functions used by generated code
+#-------------------------------------------------------------------------------
+
+def _pow(a, b):
+    return numpy.power(numpy.asarray(a, dtype=float), b)
+
+def _idiv(a, b):
+    return numpy.trunc(numpy.true_divide(a, b))
+
+def _mod(a, b):
+    return numpy.fmod(numpy.trunc(a), numpy.trunc(b))
+
+def _num(a):
+    return numpy.asarray(a, dtype=int)
+
+try:
+    from scipy.special import erf as _erf
+except ImportError:
+    _erf = numpy.vectorize(math.erf, otypes=[float])
+
+_namespace = {'_np':numpy, '_nan':numpy.nan, '_pow':_pow, '_idiv':_idiv,
+              '_mod':_mod, '_num':_num, '_erf':_erf}
+
+#===============================================================================
+# Exceptions
+#===============================================================================
+
+class MegError(Exception):
+    """
+    Error in an expression which cannot be evaluated.
+    """
+    pass
+
+#===============================================================================
+# Expression compiler
+#===============================================================================
+
+class meg_to_numpy(object):
+    """
+    Compile a MEG expression to a vectorized function.
+
+    Symbols used before being assigned are inputs of the function;
+    all assigned symbols are outputs. Values of symbols assigned in
+    conditional blocks are NaN where no branch assigns them.
+    """
+
+    #---------------------------------------------------------------------------
+
+    def __init__(self, expression, int_symbols=_int_symbols):
+        """
+        Parse and compile expression.
+        """
+
+        self.expression = expression
+        self.int_symbols = int_symbols
+
+        parser = cs_math_parser()
+        segments = parser.separate_segments(expression.split('\n'))
+        self.tokens = parser.tokenize(segments)[0]
+        self.t_id = 0
+
+        self.inputs = []
+        self.outputs = []
+        self.kinds = {}
+        self.names = {}
+        self.lines = []
+        self.n_tmp = 0
+
+        while self.t_id < len(self.tokens):
+            self.__statement(None)
+
+        args = ', '.join([self.names[s] for s in self.inputs])
+        init = []
+        for s in self.outputs:
+            if s not in self.inputs:
+                init.append('    %s = _nan\n' % self.names[s])
+        ret = ', '.join([self.names[s] for s in self.outputs])
+        self.source = 'def _meg_eval(' + args + '):\n' \
+            + ''.join(init) + ''.join(self.lines) \
+            + '    return (' + ret + (',' if len(self.outputs) == 1 else '') \
+            + ')\n'
+
+        ns = dict(_namespace)
+        exec(compile(self.source, '<meg>', 'exec'), ns)
+        self.function = ns['_meg_eval']
+
+    #---------------------------------------------------------------------------
+
+    def __error(self, msg, t=None):
+        """
+        Raise an error relative to a given token (or the current one).
+        """
+
+        if t == None:
+            if self.t_id < len(self.tokens):
+                t = self.tokens[self.t_id]
+            elif self.tokens:
+                t = self.tokens[-1]
+        if t != None:
+            msg = 'line %d, column %d: %s' % (t[1]+1, t[2]+1, msg)
+
+        raise MegError(msg)
+
+    #---------------------------------------------------------------------------
+
+    def __peek(self, offset=0):
+        """
+        Return the current (or following) token string, or None.
+        """
+
+        if self.t_id + offset < len(self.tokens):
+            return self.tokens[self.t_id + offset][0]
+        return None
+
+    #---------------------------------------------------------------------------
+
+    def __next(self):
+        """
+        Return the current token and move to the next one.
+        """
+
+        if self.t_id >= len(self.tokens):
+            self.__error('unexpected end of expression')
+        t = self.tokens[self.t_id]
+        self.t_id += 1
+        return t
+
+    #---------------------------------------------------------------------------
+
+    def __expect(self, tk):
+        """
+        Check the current token and move to the next one.
+        """
+
+        if self.__peek() != tk:
+            self.__error("expected '%s'" % tk)
+        return self.__next()
+
+    #---------------------------------------------------------------------------
+
+    def __name(self, s):
+        """
+        Return the Python variable name associated with a symbol.
+        """
+
+        if s not in self.names:
+            self.names[s] = '_s%d' % len(self.names)
+        return self.names[s]
+
+    #---------------------------------------------------------------------------
+
+    def __tmp(self):
+        """
+        Return a new temporary variable name.
+        """
+
+        self.n_tmp += 1
+        return '_t%d' % self.n_tmp
+
+    #---------------------------------------------------------------------------
+
+    def __emit(self, line):
+        """
+        Add a line of code to the generated function.
+        """
+
+        self.lines.append('    ' + line + '\n')
+
+    #---------------------------------------------------------------------------
+
+    def __assign(self, s, value, kind, mask):
+        """
+        Generate code assigning a value to a symbol where mask is true.
+        """
+
+        if s not in self.kinds:
+            self.kinds[s] = 'real'
+        if self.kinds[s] == 'int' and kind != 'int':
+            value = '_np.trunc(' + value + ')'
+        elif kind == 'bool':
+            value = '_num(' + value + ')'
+        if s not in self.outputs:
+            self.outputs.append(s)
+
+        n = self.__name(s)
+        if mask == None:
+            self.__emit('%s = %s' % (n, value))
+        else:
+            self.__emit('%s = _np.where(%s, %s, %s)' % (n, mask, value, n))
+
+    #---------------------------------------------------------------------------
+
+    def __statement(self, mask):
+        """
+        Compile a statement, executed where mask is true.
+        """
+
+        tk = self.__peek()
+
+        if tk == ';':
+            self.__next()
+
+        elif tk == '{':
+            self.__next()
+            while self.__peek() != '}':
+                if self.__peek() == None:
+                    self.__error("'{' is not closed")
+                self.__statement(mask)
+            self.__next()
+
+        elif tk == 'if':
+            self.__next()
+            self.__expect('(')
+            c = self.__condition(self.__expression())
+            self.__expect(')')
+            c_name = self.__tmp()
+            self.__emit('%s = %s' % (c_name, c))
+            m_name = self.__tmp()
+            if mask == None:
+                self.__emit('%s = %s' % (m_name, c_name))
+            else:
+                self.__emit('%s = _np.logical_and(%s, %s)'
+                            % (m_name, mask, c_name))
+            self.__statement(m_name)
+            if self.__peek() == 'else':
+                self.__next()
+                m_name = self.__tmp()
+                if mask == None:
+                    self.__emit('%s = _np.logical_not(%s)' % (m_name, c_name))
+                else:
+                    self.__emit('%s = _np.logical_and(%s, _np.logical_not(%s))'
+                                % (m_name, mask, c_name))
+                self.__statement(m_name)
+
+        elif tk in ('const',) + tuple(_c_types.keys()):
+            if tk == 'const':
+                self.__next()
+            t = self.__next()
+            if t[0] not in _c_types:
+                self.__error("unknown type '%s'" % t[0], t)
+            kind = _c_types[t[0]]
+            while True:
+                t = self.__next()
+                if not _re_identifier.match(t[0]):
+                    self.__error("unexpected '%s'" % t[0], t)
+                self.kinds[t[0]] = kind
+                if self.__peek() == '=':
+                    self.__next()
+                    v, v_kind = self.__expression()
+                    self.__assign(t[0], v, v_kind, mask)
+                elif t[0] not in self.outputs:
+                    self.outputs.append(t[0])
+                    self.__name(t[0])
+                if self.__peek() != ',':
+                    break
+                self.__next()
+            self.__expect(';')
+
+        elif tk in ('while', 'for', 'do', 'return', 'break', 'continue',
+                    'else'):
+            self.__error("'%s' is not handled by this evaluator" % tk)
+
+        else:
+            t = self.__next()
+            if not _re_identifier.match(t[0]) or t[0] in _np_functions:
+                self.__error("unexpected '%s'" % t[0], t)
+            op = self.__peek()
+            if op not in ('=', '+=', '-=', '*=', '/='):
+                self.__error("expected assignment to '%s'" % t[0])
+            self.__next()
+            v, v_kind = self.__expression()
+            if op != '=':
+                v, v_kind = self.__binary(op[0], self.__symbol(t), (v, v_kind))
+            self.__assign(t[0], v, v_kind, mask)
+            self.__expect(';')
+
+    #---------------------------------------------------------------------------
+
+    def __condition(self, e):
+        """
+        Return code for an expression used as a boolean.
+        """
+
+        if e[1] == 'bool':
+            return e[0]
+        return '(' + e[0] + ' != 0)'
+
+    #---------------------------------------------------------------------------
+
+    def __numeric(self, e):
+        """
+        Return code for an expression used as a number.
+        """
+
+        if e[1] == 'bool':
+            return '_num(' + e[0] + ')', 'int'
+        return e
+
+    #---------------------------------------------------------------------------
+
+    def __binary(self, op, a, b):
+        """
+        Return code and type of a binary operation.
+        """
+
+        if op in ('&&', '||'):
+            f = {'&&':'_np.logical_and', '||':'_np.logical_or'}[op]
+            return f + '(' + self.__condition(a) + ', ' \
+                + self.__condition(b) + ')', 'bool'
+
+        a = self.__numeric(a)
+        b = self.__numeric(b)
+        is_int = (a[1] == 'int' and b[1] == 'int')
+
+        if op in ('==', '!=', '<', '>', '<=', '>='):
+            return '(' + a[0] + ' ' + op + ' ' + b[0] + ')', 'bool'
+        elif op == '/':
+            if is_int:
+                return '_idiv(' + a[0] + ', ' + b[0] + ')', 'int'
+            return '_np.true_divide(' + a[0] + ', ' + b[0] + ')', 'real'
+        elif op == '%':
+            return '_np.fmod(' + a[0] + ', ' + b[0] + ')', a[1]
+        elif op in ('^', '**'):
+            return '_pow(' + a[0] + ', ' + b[0] + ')', 'real'
+
+        kind = 'real'
+        if is_int:
+            kind = 'int'
+        return '(' + a[0] + ' ' + op + ' ' + b[0] + ')', kind
+
+    #---------------------------------------------------------------------------
+
+    def __expression(self):
+        """
+        Compile an expression, returning its code and type.
+        """
+
+        c = self.__binary_level(0)
+
+        if self.__peek() == '?':
+            self.__next()
+            a = self.__expression()
+            self.__expect(':')
+            b = self.__expression()
+            if a[1] == b[1]:
+                kind = a[1]
+            else:
+                a = self.__numeric(a)
+                b = self.__numeric(b)
+                kind = 'int' if a[1] == b[1] == 'int' else 'real'
+            c = '_np.where(' + self.__condition(c) + ', ' + a[0] + ', ' \
+                + b[0] + ')', kind
+
+        return c
+
+    #---------------------------------------------------------------------------
+
+    def __binary_level(self, level):
+        """
+        Compile binary operations of a given precedence level or higher.
+        """
+
+        if level >= len(_binary_levels):
+            return self.__unary()
+
+        a = self.__binary_level(level+1)
+        while self.__peek() in _binary_levels[level]:
+            op = self.__next()[0]
+            b = self.__binary_level(level+1)
+            a = self.__binary(op, a, b)
+
+        return a
+
+    #---------------------------------------------------------------------------
+
+    def __unary(self):
+        """
+        Compile unary operations and casts.
+        """
+
+        tk = self.__peek()
+
+        if tk in ('-', '+'):
+            self.__next()
+            e = self.__numeric(self.__unary())
+            return '(' + tk + e[0] + ')', e[1]
+
+        elif tk == '!':
+            self.__next()
+            e = self.__unary()
+            return '_np.logical_not(' + self.__condition(e) + ')', 'bool'
+
+        elif tk == '(' and self.__peek(1) in _c_types \
+             and self.__peek(2) == ')':
+            self.__next()
+            kind = _c_types[self.__next()[0]]
+            self.__next()
+            e = self.__numeric(self.__unary())
+            if kind == 'int':
+                return '_np.trunc(' + e[0] + ')', 'int'
+            return '_np.asarray(' + e[0] + ', dtype=float)', 'real'
+
+        return self.__power()
+
+    #---------------------------------------------------------------------------
+
+    def __power(self):
+        """
+        Compile power operations, binding more tightly than unary operators.
+        """
+
+        a = self.__primary()
+        if self.__peek() in ('^', '**'):
+            op = self.__next()[0]
+            b = self.__unary()
+            a = self.__binary(op, a, b)
+
+        return a
+
+    #---------------------------------------------------------------------------
+
+    def __symbol(self, t):
+        """
+        Return code and type of a symbol value.
+        """
+
+        s = t[0]
+        if s not in self.names:
+            self.inputs.append(s)
+            if s in self.int_symbols:
+                self.kinds[s] = 'int'
+            else:
+                self.kinds[s] = 'real'
+
+        return self.__name(s), self.kinds[s]
+
+    #---------------------------------------------------------------------------
+
+    def __primary(self):
+        """
+        Compile numbers, symbols, function calls, and parenthesized
+        expressions.
+        """
+
+        t = self.__next()
+        tk = t[0]
+
+        if tk == '(':
+            e = self.__expression()
+            self.__expect(')')
+            return '(' + e[0] + ')', e[1]
+
+        elif _re_number.match(tk):
+            if tk.isdigit():
+                return str(int(tk)), 'int'
+            return repr(float(tk)), 'real'
+
+        elif tk in _np_functions and self.__peek() == '(' \
+             and tk not in self.names:
+            f, n_args, kind = _np_functions[tk]
+            self.__next()
+            args = []
+            if self.__peek() != ')':
+                while True:
+                    args.append(self.__numeric(self.__expression())[0])
+                    if self.__peek() != ',':
+                        break
+                    self.__next()
+            self.__expect(')')
+            if len(args) != n_args:
+                self.__error("'%s' expects %d argument(s), %d given"
+                             % (tk, n_args, len(args)), t)
+            return f + '(' + ', '.join(args) + ')', kind
+
+        elif _re_identifier.match(tk) and tk not in _c_types:
+            if self.__peek() == '(':
+                self.__error("'%s' is not a function" % tk, t)
+            return self.__symbol(t)
+
+        self.__error("unexpected '%s'" % tk, t)
+
+    #---------------------------------------------------------------------------
+
+    def evaluate(self, values):
+        """
+        Evaluate the expression given a dictionary of input values
+        (scalars or arrays), using default values for constants.
+        Returns a dictionary of output values, as arrays of the
+        broadcast shape of inputs.
+        """
+
+        args = []
+        missing = []
+        for s in self.inputs:
+            if s in values:
+                args.append(numpy.asarray(values[s]))
+            elif s in _constants:
+                args.append(numpy.asarray(_constants[s]))
+            else:
+                missing.append(s)
+        if missing:
+            raise MegError('no value given for: ' + ', '.join(missing))
+
+        shape = ()
+        for a in args:
+            shape = numpy.broadcast(numpy.empty(shape), a).shape
+
+        with numpy.errstate(all='ignore'):
+            results = self.function(*args)
+
+        outputs = {}
+        for s, r in zip(self.outputs, results):
+            outputs[s] = numpy.broadcast_to(numpy.asarray(r, dtype=float),
+                                            shape).copy()
+
+        return outputs
+
+    #---------------------------------------------------------------------------
+
+    def __call__(self, **values):
+        """
+        Evaluate the expression given input values as keyword arguments.
+        """
+
+        return self.evaluate(values)
+
+#===============================================================================
+# Sample points
+#===============================================================================
+
+def sample_grid(bounds, n):
+    """
+    Return coordinates of a regular grid of points as a dictionary of
+    'x', 'y', and 'z' arrays, given bounds (x_min, x_max, y_min, y_max,
+    z_min, z_max) and a number of points per direction (a single value
+    or one per direction). Directions with equal bounds have one point.
+    """
+
+    if numpy.isscalar(n):
+        n = (n, n, n)
+
+    axes = []
+    for i in range(3):
+        b0, b1 = bounds[2*i], bounds[2*i+1]
+        if b0 == b1:
+            axes.append(numpy.array([float(b0)]))
+        else:
+            axes.append(numpy.linspace(b0, b1, n[i]))
+
+    x, y, z = numpy.meshgrid(*axes, indexing='ij')
+
+    return {'x':x.ravel(), 'y':y.ravel(), 'z':z.ravel()}
+
+#-------------------------------------------------------------------------------
+
+def _group_class_ids(f, groups):
+    """
+    Return the (1-based) ids of group classes containing one of the
+    given groups (or colors), based on a preprocessed mesh file.
+    """
+
+    gc_ids = []
+
+    n_gc = int(f.read_values('n_group_classes')[0])
+    n_props = int(f.read_values('n_group_class_props_max')[0])
+    props = f.read_values('group_class_properties')
+    if n_gc < 1 or n_props < 1 or props is None:
+        return gc_ids
+    props = props.reshape(n_props, n_gc)
+
+    names = []
+    g_idx = f.read_values('group_name_index')
+    if g_idx is not None:
+        g_chars = f.read_values('group_name').tobytes()
+        for i in range(len(g_idx) - 1):
+            names.append(g_chars[g_idx[i]-1:g_idx[i+1]-2].decode('utf-8'))
+
+    for i in range(n_gc):
+        for p in props[:, i]:
+            if p < 0 and names[-p-1] in groups:
+                gc_ids.append(i+1)
+            elif p > 0 and str(p) in groups:
+                gc_ids.append(i+1)
+
+    return gc_ids
+
+#-------------------------------------------------------------------------------
+
+def mesh_sample_points(path, location='boundary_faces', groups=None):
+    """
+    Return sample points of a preprocessed mesh (mesh_input.csm) file
+    as a dictionary of 'x', 'y', and 'z' arrays: boundary face or cell
+    centers (approximated by averages of vertices and face centers
+    respectively), optionally restricted to given group names.
+    """
+
+    from code_saturne.cs_io_reader import io_file
+
+    f = io_file(path)
+
+    coords = f.read_values('vertex_coords').astype(float).reshape(-1, 3)
+    f_idx = f.read_values('face_vertices_index').astype(numpy.int64)
+    f_vtx = f.read_values('face_vertices').astype(numpy.int64) - 1
+    face_cells = f.read_values('face_cells').astype(numpy.int64).reshape(-1, 2)
+
+    n_f_vtx = numpy.diff(f_idx)
+    f_cen = numpy.add.reduceat(coords[f_vtx], f_idx[:-1] - 1, axis=0)
+    f_cen /= n_f_vtx.reshape(-1, 1)
+
+    if location == 'boundary_faces':
+        sel = (face_cells[:, 0] == 0) | (face_cells[:, 1] == 0)
+        if groups:
+            gc_id = f.read_values('face_group_class_id')
+            sel &= numpy.isin(gc_id, _group_class_ids(f, groups))
+        pts = f_cen[sel]
+
+    elif location == 'cells':
+        n_cells = int(f.read_values('n_cells')[0])
+        c_sum = numpy.zeros((n_cells + 1, 3))
+        c_count = numpy.zeros(n_cells + 1)
+        for j in range(2):
+            numpy.add.at(c_sum, face_cells[:, j], f_cen)
+            numpy.add.at(c_count, face_cells[:, j], 1)
+        pts = c_sum[1:] / numpy.maximum(c_count[1:], 1).reshape(-1, 1)
+        if groups:
+            gc_id = f.read_values('cell_group_class_id')
+            pts = pts[numpy.isin(gc_id, _group_class_ids(f, groups))]
+
+    else:
+        raise ValueError('Location "%s" is not known\n'
+                         'Known locations: boundary_faces, cells' % location)
+
+    return {'x':pts[:, 0], 'y':pts[:, 1], 'z':pts[:, 2]}
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -91,6 +91,25 @@ def process_cmd_line(argv):
     parser.add_option("--blencv", dest="blencv", type="float",
                       help="Blencv")
 
+    parser.add_option("--sweep", dest="sweep", type="string",
+                      help="Design table (CSV file) of a parametric sweep: "
+                      "one variant of the parameters file is written and "
+                      "run per row. Columns are notebook variables, or "
+                      "'name', 'dt', 'n_iter', 'tmax', 'imrgra' and "
+                      "'blencv:<variable>'")
+
+    parser.add_option("--n-procs", dest="n_procs", type="int", default=1,
+                      help="Number of processes per run of a sweep "
+                      "(default: 1)")
+
+    parser.add_option("--n-procs-max", dest="n_procs_max", type="int",
+                      help="Total number of processes used by runs of a "
+                      "sweep (default: number of available cores)")
+
+    parser.add_option("--no-run", dest="no_run", default=False,
+                      action="store_true",
+                      help="Only write the parameters files of a sweep")
+
     (options, args) = parser.parse_args(argv)
 
     if args != []:
@@ -111,10 +130,12 @@ class cs_modify_xml(object):
     """
 
     # ---------------------------
-    def __init__(self, xml_file, pkg=None):
+    def __init__(self, xml_file, pkg=None, case=None):
         """
         Init method.
         @param xml_file: path to xml file
+        @param case    : already initialized case (see clone), in which
+                         case xml_file is only used when saving
         """
 
         # package
@@ -125,28 +146,32 @@ class cs_modify_xml(object):
             from code_saturne.cs_package import package
             self.pkg = package()
 
-        from code_saturne.model.XMLengine import Case
+        self.xml = xml_file
+
+        if case:
+            self.case = case
 
-        try:
-            case = Case(package = pkg, file_name = filepath)
-        except:
-            print("Error while reading parameters files.")
-            print("This file is not in accordance with XML specifications.")
-            sys.exit(1)
-
-        if self.pkg.name == 'code_saturne':
-            from code_saturne.model.XMLinitialize import XMLinit
         else:
-            from model.XMLinitializeNeptune import XMLinitNeptune as XMLinit
+            from code_saturne.model.XMLengine import Case
 
-        self.xml = xml_file
+            try:
+                self.case = Case(package = self.pkg, file_name = xml_file)
+            except:
+                print("Error while reading parameters files.")
+                print("This file is not in accordance with XML specifications.")
+                sys.exit(1)
+
+            if self.pkg.name == 'code_saturne':
+                from code_saturne.model.XMLinitialize import XMLinit
+            else:
+                from code_saturne.model.XMLinitializeNeptune import XMLinitNeptune as XMLinit
+
+            # internal functions of code_saturne to properly initialize the
+            # xml structure
+            self.case.xmlCleanAllBlank(self.case.xmlRootNode())
+            XMLinit(self.case).initialize()
 
-        # internal functions of code_saturne to properly initialize the
-        # xml structure
-        self.case = Case(file_name=xml_file)
         self.case['xmlfile'] = xml_file
-        self.case.xmlCleanAllBlank(self.case.xmlRootNode())
-        XMLinit(self.case).initialize()
 
         self.outputModel   = None
         self.bcModel       = None
@@ -156,6 +181,7 @@ class cs_modify_xml(object):
         self.meshModel     = None
         self.notebookModel = None
         self.numParamModel = None
+        self.numEqModel    = None
     # ---------------------------
 
     # ---------------------------
@@ -167,6 +193,17 @@ class cs_modify_xml(object):
         self.case.xmlSaveDocument()
     # ---------------------------
 
+    # ---------------------------
+    def clone(self, xml_file):
+        """
+        Return a controller for a copy of the current parameters,
+        to be saved to another file.
+        @param xml_file: path to the xml file of the copy
+        """
+
+        return cs_modify_xml(xml_file, pkg=self.pkg, case=self.case.clone())
+    # ---------------------------
+
     # ---------------------------
     def initMeshModel(self):
         """
@@ -254,6 +291,16 @@ class cs_modify_xml(object):
             self.numParamModel = NumericalParamGlobalModel(self.case)
     # ---------------------------
 
+    # ---------------------------
+    def initNumEqModel(self):
+        """
+        Initialize the numerical parameters model of equations
+        """
+        if self.numEqModel == None:
+            from code_saturne.model.NumericalParamEquationModel import NumericalParamEquationModel
+            self.numEqModel = NumericalParamEquationModel(self.case)
+    # ---------------------------
+
     # ---------------------------
     def cleanMeshList(self):
         """
@@ -517,7 +564,7 @@ class cs_modify_xml(object):
         """
         self.initNotebookModel()
 
-        if name not in self.notebookModel.getVarNamesList():
+        if name not in self.notebookModel.getVarNameList():
             raise Exception("%s is not in the notebook!" % name)
 
         self.notebookModel.setVariableValue(val=val, var=name)
@@ -541,9 +588,9 @@ class cs_modify_xml(object):
         @param varName : name of the variable
         @param blencv  : Blending factor value
         """
-        self.initNumParamModel()
+        self.initNumEqModel()
 
-        self.numParamModel.setBlendingFactor(varName, blencv)
+        self.numEqModel.setBlendingFactor(varName, blencv)
     # ---------------------------
 
     # ---------------------------
@@ -556,6 +603,8 @@ class cs_modify_xml(object):
         """
 
         from code_saturne.model.StartRestartModel import getRestartInfo
+        from code_saturne.model.StartRestartModel import checkpoint_index
+        from code_saturne.model.StartRestartModel import find_results_dir
         from glob import glob
 
         # Check where we are before launching
@@ -573,10 +622,15 @@ class cs_modify_xml(object):
         delta = 100000000000.0
         checkpoint = None
 
+        # Index of checkpoint times, shared by all dumps
+        index = checkpoint_index(find_results_dir('main.csc'))
+
         # Loop on all checkpoint dumps looking for closest dump done with a time
         # less or equal to the wished restart time
         for p in spaths:
-            ret = getRestartInfo(package=self.pkg, restart_path=p)
+            ret = getRestartInfo(package=self.pkg, restart_path=p, index=index)
+            if ret == None:
+                continue
 
             time_p = ret[2]
             if time_p <= restart_time:
@@ -585,6 +639,8 @@ class cs_modify_xml(object):
                     checkpoint = p
                     delta      = dt
 
+        index.save()
+
         # Return path to the found checkpoint. None if none found
         restart_checkpoint = None
         if checkpoint:
@@ -748,6 +804,210 @@ def update_xml_file(pkg, filepath, options):
     case.xmlSaveDocument()
 
 
+# ------------------------------------------------------------------------------
+# Parametric sweep
+# ------------------------------------------------------------------------------
+
+def read_design_table(path):
+    """
+    Read a design table (CSV file whose first line contains column names).
+    Returns a list of (variant name, {column: value}) tuples; empty values
+    are ignored, so that reference values are kept.
+    """
+
+    import csv
+
+    f = open(path, 'r')
+    reader = csv.DictReader(f, skipinitialspace=True)
+    rows = []
+    for i, r in enumerate(reader):
+        values = {}
+        for k, v in r.items():
+            if k != None and v != None and v.strip() != '':
+                values[k.strip()] = v.strip()
+        name = values.pop('name', 'sweep_%04d' % (i+1))
+        rows.append((name, values))
+    f.close()
+
+    return rows
+
+
+def apply_design_row(xml_controller, values):
+    """
+    Apply the values of a design table row to a parameters file.
+    """
+
+    for k, v in values.items():
+        if k == 'dt':
+            xml_controller.setTimeStep(float(v))
+        elif k == 'n_iter':
+            xml_controller.setTimeIterationsNumber(int(v))
+        elif k == 'tmax':
+            xml_controller.setMaxTime(float(v))
+        elif k == 'imrgra':
+            xml_controller.setGradientReconstruction(int(v))
+        elif k.startswith('blencv:'):
+            xml_controller.setBlendingFactor(k[7:], float(v))
+        else:
+            xml_controller.changeNotebookParameter(k, v)
+
+
+def read_uncertain_output(path):
+    """
+    Read a cs_uncertain_output.dat file, returning the list of
+    (name, value) pairs it contains, or an empty list.
+    """
+
+    if not os.path.isfile(path):
+        return []
+
+    f = open(path, 'r')
+    lines = [l.strip() for l in f.readlines() if l.strip()]
+    f.close()
+
+    names = []
+    if lines and lines[0].startswith('#'):
+        names = lines[0][1:].split()
+        lines = lines[1:]
+    if not lines:
+        return []
+
+    values = [v.strip() for v in lines[-1].split(',')]
+    for i in range(len(names), len(values)):
+        names.append('output_%d' % (i+1))
+
+    return list(zip(names, values))
+
+
+def run_sweep(pkg, filepath, options):
+    """
+    Write one variant of a parameters file per row of a design table,
+    derived from a single reading of the reference file, then run the
+    variants concurrently within a total number of processes, and collect
+    their cs_uncertain_output.dat values in a results table.
+    Runs whose results directory already exists are not run again.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from code_saturne.cs_exec_environment import run_command
+    from code_saturne.cs_compile import available_cores
+
+    if not os.path.isfile(filepath):
+        print("File %s does not exist!" % filepath)
+        sys.exit(1)
+
+    data_dir = os.path.dirname(os.path.abspath(filepath))
+    case_dir = os.path.dirname(data_dir)
+    resu_dir = os.path.join(case_dir, 'RESU')
+    sweep_dir = os.path.join(case_dir, 'sweep')
+    base = os.path.splitext(os.path.basename(filepath))[0]
+
+    rows = read_design_table(options.sweep)
+
+    # Read and initialize the reference parameters once; variants are
+    # derived from in-memory copies
+
+    ref = cs_modify_xml(filepath, pkg=pkg)
+
+    variants = []
+    for name, values in rows:
+        xml_file = os.path.join(data_dir, base + '_' + name + '.xml')
+        variant = ref.clone(xml_file)
+        apply_design_row(variant, values)
+        variant.saveXml()
+        variants.append((name, xml_file))
+
+    print("%d parameters files written in %s" % (len(variants), data_dir))
+
+    if options.no_run:
+        return 0
+
+    # Run variants within the processes budget
+
+    n_procs = max(options.n_procs or 1, 1)
+    n_procs_max = options.n_procs_max or available_cores()
+    n_jobs = max(n_procs_max // n_procs, 1)
+
+    if not os.path.isdir(sweep_dir):
+        os.makedirs(sweep_dir)
+
+    exe = os.path.join(pkg.get_dir('bindir'), pkg.name)
+
+    def run_variant(name, xml_file):
+        if os.path.isdir(os.path.join(resu_dir, name)):
+            return 0
+        cmd = [exe, 'run', '--param', os.path.basename(xml_file),
+               '--id', name, '--nprocs', str(n_procs)]
+        log = open(os.path.join(sweep_dir, name + '.log'), 'w')
+        try:
+            retcode = run_command(cmd, stdout=log, stderr=log,
+                                  cwd=data_dir)
+        finally:
+            log.close()
+        return retcode
+
+    print("Running %d variants, %d at a time on %d processes each"
+          % (len(variants), n_jobs, n_procs))
+
+    # Modify the PATH for relocatable installation once for all
+    # variants, as run_command would do so (not thread-safely) for each.
+
+    saved_path = None
+    if pkg.config.features['relocatable'] == "yes":
+        saved_path = os.environ['PATH']
+        os.environ['PATH'] = pkg.get_dir('bindir') + os.pathsep + saved_path
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(run_variant, name, xml_file)
+                       for name, xml_file in variants]
+            retcodes = [f.result() for f in futures]
+    finally:
+        if saved_path != None:
+            os.environ['PATH'] = saved_path
+
+    # Collect results
+
+    columns = []
+    for name, values in rows:
+        for k in values:
+            if k not in columns:
+                columns.append(k)
+    n_inputs = len(columns)
+
+    results = []
+    for (name, values), retcode in zip(rows, retcodes):
+        run_dir = os.path.join(resu_dir, name)
+        status = 'OK'
+        if retcode != 0 or os.path.isfile(os.path.join(run_dir, 'error')):
+            status = 'KO'
+        outputs = read_uncertain_output(os.path.join(run_dir,
+                                                     'cs_uncertain_output.dat'))
+        # uncertain inputs are also output; keep the design table value
+        for k, v in outputs:
+            if k not in columns:
+                columns.append(k)
+        results.append((name, status, values, dict(outputs)))
+
+    output = os.path.join(sweep_dir, 'results.csv')
+    f = open(output, 'w')
+    f.write(','.join(['name', 'status'] + columns) + '\n')
+    for name, status, values, outputs in results:
+        l = [name, status]
+        for i, k in enumerate(columns):
+            if i < n_inputs:
+                l.append(values.get(k, ''))
+            else:
+                l.append(outputs.get(k, ''))
+        f.write(','.join(l) + '\n')
+    f.close()
+
+    n_failed = len([r for r in results if r[1] != 'OK'])
+    print("Results of %d variants (%d failed) written to %s"
+          % (len(results), n_failed, output))
+
+    return n_failed
+
 # ------------------------------------------------------------------------------
 # Run main function which modifies the case parameters
 # ------------------------------------------------------------------------------
@@ -794,6 +1054,12 @@ def main(args, pkg):
         print("No case name nor parameters file provided")
         sys.exit(1)
 
+    # ---------------------------
+    # Run a parametric sweep if needed
+    # ---------------------------
+    if opts.sweep:
+        return run_sweep(pkg, fp, opts)
+
     # ---------------------------
     # Update xml if needed
     # ---------------------------
@@ -36,6 +36,8 @@ class master_script:
 
         self.commands = {'studymanager':self.studymanager,
                          'smgr':self.studymanager,
+                         'studymanagerdb':self.studymanager_db,
+                         'smgrdb':self.studymanager_db,
                          'bdiff':self.bdiff,
                          'bdump':self.bdump,
                          'compile':self.compile,
@@ -116,6 +118,8 @@ Topics:
   parametric
   studymanagergui
   smgrgui
+  studymanagerdb
+  smgrdb
   trackcvg
   update
   up
@@ -162,6 +166,10 @@ Options:
         from code_saturne import cs_studymanager_gui
         return cs_studymanager_gui.main(options, self.package)
 
+    def studymanager_db(self, options = None):
+        from code_saturne.studymanager import cs_studymanager_db
+        return cs_studymanager_db.main(options, self.package)
+
     def trackcvg(self, options = None):
         from code_saturne import cs_trackcvg
         return cs_trackcvg.main(options, self.package)
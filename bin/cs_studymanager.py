@@ -97,6 +97,12 @@ def process_cmd_line(argv, pkg):
     parser.add_option("--n-procs",  dest="n_procs", default=None, type="int",
                       help="Optional number of processors requested for the computations")
 
+    parser.add_option("--n-procs-max", dest="n_procs_max", default=None,
+                      type="int",
+                      help="run independent cases concurrently, using at most "
+                      "this total number of processes (default: run cases "
+                      "one after the other)")
+
     parser.add_option("-n", "--n-iterations", dest="n_iterations",
                       type="int", help="maximum number of iterations for cases of the study")
 
@@ -107,6 +113,17 @@ def process_cmd_line(argv, pkg):
     parser.add_option("-d", "--ref-dir", dest="reference", type="string",
                       help="absolute reference directory to compare dest with")
 
+    parser.add_option("-j", "--jobs", dest="n_jobs", default=1, type="int",
+                      help="number of comparisons, postprocessing scripts "
+                      "and figures run concurrently (default: 1)")
+
+    parser.add_option("--db", dest="db_path", default="", type="string",
+                      metavar="FILE",
+                      help="SQLite database in which run times, checkpoint "
+                      "differences and mesh sizes are stored across "
+                      "invocations; unchanged checkpoint files are not "
+                      "compared again (query it with the smgrdb command)")
+
     parser.add_option("-p", "--post",
                       action="store_true", dest="post", default=False,
                       help="postprocess results of computations")
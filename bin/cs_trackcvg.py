@@ -51,22 +51,24 @@ try:
 except Exception:
     pass
 
+# Qt is not required in headless mode
+
+have_qt = True
+
 try:
     from code_saturne.Base.QtCore    import *
     from code_saturne.Base.QtGui     import *
     from code_saturne.Base.QtWidgets import *
 except ImportError:
-    print("\n  Error: Unable to import QtCore or QtGui modules.")
-    print("  Please check your PyQt4 or PyQt5 installation.\n")
-    sys.exit(0)
+    have_qt = False
 
 
-if list(map(int, QT_VERSION_STR.split( "."))) < [4, 3, 0]:
+if have_qt and list(map(int, QT_VERSION_STR.split( "."))) < [4, 3, 0]:
     raise SystemExit("Graphical user interface requires Qt 4.3 or later "\
                      "(found %s)." % QT_VERSION_STR)
 
 
-if list(map(int, PYQT_VERSION_STR.split("."))) < [4, 3, 0]:
+if have_qt and list(map(int, PYQT_VERSION_STR.split("."))) < [4, 3, 0]:
     raise SystemExit("Graphical user interface requires PyQt 4.3 or later "\
                      "(found %s)." % PYQT_VERSION_STR)
 
@@ -96,6 +98,30 @@ def process_cmd_line(argv):
                       metavar="<directory>",
                       help="open a result directory at the interface start")
 
+    parser.add_option("--headless", dest="headless",
+                      action="store_true",
+                      help="track convergence without display, writing " \
+                      + "summary statistics and PNG snapshots")
+
+    parser.add_option("-o", "--output", dest="output", type="string",
+                      metavar="<directory>",
+                      help="output directory in headless mode " \
+                      + "(default: <result directory>/trackcvg)")
+
+    parser.add_option("--period", dest="period", type="float",
+                      metavar="<seconds>",
+                      help="minimum time between outputs in headless mode " \
+                      + "(default: 30)")
+
+    parser.add_option("--once", dest="once",
+                      action="store_true",
+                      help="in headless mode, write outputs once and exit")
+
+    parser.set_defaults(headless=False)
+    parser.set_defaults(output=None)
+    parser.set_defaults(period=30.)
+    parser.set_defaults(once=False)
+
     (options, args) = parser.parse_args(argv)
 
     if len(args) > 0:
@@ -104,7 +130,10 @@ def process_cmd_line(argv):
         else:
             options.file_name = args[0]
 
-    return options.file_name
+    if options.headless and not options.file_name:
+        parser.error("A result directory is required in headless mode")
+
+    return options
 
 #-------------------------------------------------------------------------------
 # Main
@@ -122,7 +151,17 @@ def main(argv, pkg):
     # Test the package name to know which modules have to be imported
     images_path = os.path.join(pkg.get_dir('pkgdatadir'), 'images')
 
-    case = process_cmd_line(argv)
+    options = process_cmd_line(argv)
+    case = options.file_name
+
+    if options.headless:
+        from code_saturne.trackcvg.HeadlessView import run
+        return run(case, options.output, options.period, options.once)
+
+    if not have_qt:
+        print("\n  Error: Unable to import QtCore or QtGui modules.")
+        print("  Please check your PyQt4 or PyQt5 installation.\n")
+        sys.exit(0)
 
     app = QApplication(sys.argv)
     app.setOrganizationName(pkg.code_name) # Defines the name of subdirectory under .config
@@ -25,7 +25,10 @@
 """
 This module defines the 'Start/Restart' page.
 
-This module defines the following classes:
+This module defines the following classes and functions:
+- checkpoint_index
+- find_results_dir
+- getRestartInfo
 - StartRestartModel
 - StartRestartTestCase
 """
@@ -35,6 +38,7 @@ This module defines the following classes:
 #-------------------------------------------------------------------------------
 
 import os, sys, types
+import json
 import unittest
 
 #-------------------------------------------------------------------------------
@@ -46,22 +50,159 @@ from code_saturne.model.XMLvariables import Model, Variables
 from code_saturne.model.XMLmodel import ModelTest
 
 #-------------------------------------------------------------------------------
-# Get info on a given restart path
+# Index of checkpoint time steps and times
 #-------------------------------------------------------------------------------
 
-def getRestartInfo(package, results_dir=None, restart_path='*'):
+class checkpoint_index(object):
     """
-    Return a tuple (path, number of time steps, time value) or None
-    describing the current restart selection.
+    Number of time steps and time of checkpoint files of a results
+    directory, stored in a hidden file of that directory so that they
+    are read only once per checkpoint file. Entries are invalidated
+    when the size or modification time of a checkpoint file changes.
     """
 
-    restart_input = None
+    index_name = '.checkpoint_index'
+
+    def __init__(self, results_dir=None):
+        """
+        Load the index of a given directory (in memory only if None).
+        """
+        self.results_dir = results_dir
+        self.entries = {}
+        self.modified = False
+
+        if results_dir:
+            try:
+                f = open(os.path.join(results_dir, self.index_name))
+                self.entries = json.load(f)
+                f.close()
+            except Exception:
+                self.entries = {}
+
+
+    def __key(self, path):
+        """
+        Return the key of a checkpoint file in the index.
+        """
+        path = os.path.abspath(path)
+        if self.results_dir:
+            path = os.path.relpath(path, os.path.abspath(self.results_dir))
+        return path
+
+
+    def time_info(self, path, package=None):
+        """
+        Return the number of time steps and time of a checkpoint file.
+        """
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+
+        key = self.__key(path)
+        e = self.entries.get(key)
+        if e and e[:2] == stamp:
+            return e[2], e[3]
+
+        try:
+            from code_saturne.cs_io_reader import checkpoint_time_info
+            nt, t = checkpoint_time_info(path)
+        except ImportError:
+            nt, t = _io_dump_time_info(package, path)
+
+        self.entries[key] = stamp + [nt, t]
+        self.modified = True
+
+        return nt, t
+
+
+    def save(self):
+        """
+        Write the index if it was modified (errors are ignored,
+        as results directories may be read-only).
+        """
+        if not (self.results_dir and self.modified):
+            return
+
+        path = os.path.join(self.results_dir, self.index_name)
+        tmp_path = path + '.' + str(os.getpid())
+        try:
+            f = open(tmp_path, 'w')
+            json.dump(self.entries, f)
+            f.close()
+            os.replace(tmp_path, path)
+            self.modified = False
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+
+#-------------------------------------------------------------------------------
 
+def _io_dump_time_info(package, path):
+    """
+    Return the number of time steps and time of a checkpoint file
+    using the cs_io_dump utility (if NumPy is not available).
+    """
     from code_saturne.cs_exec_environment import get_command_output, assemble_args
 
     nt_names = ('nbre_pas_de_temps', 'ntcabs')
     t_names = ('instant_precedent', 'ttcabs')
 
+    io_dump = package.get_io_dump()
+
+    nt = -1
+    for name in nt_names:
+        cmd = [io_dump, '-e', '--section', name, path]
+        res = get_command_output(assemble_args(cmd))
+        if res:
+            nt = -1
+            try:
+                nt = int(res.strip())
+                break
+            except Exception:
+                pass
+    t = -1
+    for name in t_names:
+        cmd = [io_dump, '-e', '--section', name, path]
+        res = get_command_output(assemble_args(cmd))
+        if res:
+            t = -1
+            try:
+                t = float(res.strip())
+                break
+            except Exception:
+                pass
+
+    return nt, t
+
+#-------------------------------------------------------------------------------
+
+def find_results_dir(path):
+    """
+    Return the RESU or RESU_COUPLING directory containing a given
+    checkpoint file, or None.
+    """
+    d = os.path.dirname(os.path.abspath(path))
+    for i in range(4):
+        d, name = os.path.split(d)
+        if name in ('RESU', 'RESU_COUPLING'):
+            return os.path.join(d, name)
+        if not name:
+            break
+    return None
+
+#-------------------------------------------------------------------------------
+# Get info on a given restart path
+#-------------------------------------------------------------------------------
+
+def getRestartInfo(package, results_dir=None, restart_path='*', index=None):
+    """
+    Return a tuple (path, number of time steps, time value) or None
+    describing the current restart selection.
+    A checkpoint_index may be given when this function is called for
+    several paths; otherwise, the index of the RESU directory is used.
+    """
+
     results = []
 
     if results_dir and restart_path == '*':
@@ -70,8 +211,6 @@ def getRestartInfo(package, results_dir=None, restart_path='*'):
     elif restart_path:
         results = [restart_path,]
 
-    io_dump = package.get_io_dump()
-
     for r in results:
         if restart_path == '*':
             m = os.path.join(results_dir, r, 'checkpoint', 'main')
@@ -80,44 +219,19 @@ def getRestartInfo(package, results_dir=None, restart_path='*'):
         if not os.path.isfile(m):
             m += '.csc'
         if os.path.isfile(m):
-            if True: # try:
-                nt = -1
-                for name in nt_names:
-                    cmd = [io_dump, '-e', '--section']
-                    cmd.append(name)
-                    cmd.append(m)
-                    cmd_str = assemble_args(cmd)
-                    res = get_command_output(cmd_str)
-                    if res:
-                        nt = -1
-                        try:
-                            nt = int(res.strip())
-                            break
-                        except Exception:
-                            pass
-                t = -1
-                for name in t_names:
-                    cmd = [io_dump, '-e', '--section']
-                    cmd.append(name)
-                    cmd.append(m)
-                    cmd_str = assemble_args(cmd)
-                    res = get_command_output(cmd_str)
-                    if res:
-                        t = -1
-                        try:
-                            t = float(res.strip())
-                            break
-                        except Exception:
-                            pass
-
-                return (os.path.split(m)[0], nt, t)
-
-            elif False: # except Exception:
+            cp_index = index
+            if cp_index == None:
+                cp_index = checkpoint_index(find_results_dir(m))
+            try:
+                nt, t = cp_index.time_info(m, package)
+            except Exception:
                 d = os.path.split(m)[0]
                 print('checkpoint: ' + d + ' does not seem usable')
                 continue
-            restart_input = os.path.join(results_dir, r, 'checkpoint')
-            break
+            if index == None:
+                cp_index.save()
+
+            return (os.path.split(m)[0], nt, t)
 
     return None
 
@@ -31,6 +31,8 @@ This module defines the following classes:
 - XMLElement
 - XMLDocument
 - Case
+- XMLIndex
+- UndoJournal
 - XMLDocumentTestCase
 """
 
@@ -38,7 +40,7 @@ This module defines the following classes:
 # Library modules import
 #-------------------------------------------------------------------------------
 
-import os, sys, unittest, logging
+import os, sys, tempfile, unittest, logging
 from xml.dom.minidom import Document, parse, parseString, Node
 
 #-------------------------------------------------------------------------------
@@ -186,6 +188,20 @@ else:
         return v
 
 
+def _nodeMatch(node, attrList, kwargs):
+    """
+    Return True if an Element node has all attributes of attrList,
+    and attributes values given by kwargs (as XMLElement._nodeList).
+    """
+    for attr in attrList:
+        if not node.hasAttribute(str(attr)):
+            return False
+    for k, v in list(kwargs.items()):
+        if node.getAttribute(str(k)) != str(v):
+            return False
+    return True
+
+
 class XMLElement:
     """
     XML element base class
@@ -300,6 +316,26 @@ class XMLElement:
         return XMLElement(self.doc, el, self.ca)
 
 
+    def _record(self, op, node, *args):
+        """
+        Notify the associated case of a modification of the document.
+        """
+        if self.ca:
+            self.ca.xmlModified(op, node, *args)
+
+
+    def _setAttribute(self, attr, value):
+        """
+        Set an attribute, recording its previous value.
+        """
+        old = None
+        if self.el.hasAttribute(attr):
+            old = self.el.getAttribute(attr)
+        if old != value:
+            self._record('attr', self.el, attr, old, value)
+        self.el.setAttribute(attr, value)
+
+
     def xmlCreateAttribute(self, **kwargs):
         """
         Set attributes to a XMLElement node, only if these attributes
@@ -307,7 +343,7 @@ class XMLElement:
         """
         for attr, value in list(kwargs.items()):
             if not self.el.hasAttribute(attr):
-                self.el.setAttribute(attr, _encode(str(value)))
+                self._setAttribute(attr, _encode(str(value)))
 
         log.debug("xmlCreateAttribute-> %s" % self.__xmlLog())
 
@@ -352,7 +388,7 @@ class XMLElement:
         Set several attribute (key=value) to a node
         """
         for attr, value in list(kwargs.items()):
-            self.el.setAttribute(attr, _encode(str(value)))
+            self._setAttribute(attr, _encode(str(value)))
 
         log.debug("xmlSetAttribute-> %s" % self.__xmlLog())
 
@@ -362,6 +398,7 @@ class XMLElement:
         Delete the XMLElement node attribute
         """
         if self.el.hasAttribute(attr):
+            self._record('attr', self.el, attr, self.el.getAttribute(attr), None)
             self.el.removeAttribute(attr)
 
         log.debug("xmlDelAttribute-> %s %s" % (attr, self.__xmlLog()))
@@ -384,7 +421,7 @@ class XMLElement:
         Set a XMLElement attribute an its value
         with a dictionary syntax: node['attr'] = value
         """
-        self.el.setAttribute(attr, _encode(str(value)))
+        self._setAttribute(attr, _encode(str(value)))
 
         log.debug("__setitem__-> %s" % self.__xmlLog())
 
@@ -525,6 +562,13 @@ class XMLElement:
         """
         Return a list of Element (and not XMLElement)!
         """
+        if self.ca:
+            index = self.ca.xmlGetIndex()
+            if index != None:
+                nodeList = index.nodeList(self.el, tag, attrList, kwargs)
+                if nodeList != None:
+                    return nodeList
+
         nodeList = []
 
         # Get the nodes list
@@ -565,13 +609,19 @@ class XMLElement:
         """
         Return a list of first child Element node from the explored XMLElement node.
         """
-        nodeList = self._nodeList(tag, *attrList, **kwargs)
+        if self.ca:
+            index = self.ca.xmlGetIndex()
+            if index != None:
+                nodeList = index.nodeList(self.el, tag, attrList, kwargs,
+                                          children=True)
+                if nodeList != None:
+                    return nodeList
 
         childNodeList = []
         if self.el.hasChildNodes():
             for node in self.el.childNodes:
                 if node.nodeType == Node.ELEMENT_NODE:
-                    if node.nodeName == tag and node in nodeList:
+                    if node.nodeName == tag and _nodeMatch(node, attrList, kwargs):
                         childNodeList.append(node)
 
         return childNodeList
@@ -617,7 +667,10 @@ class XMLElement:
 
         log.debug("xmlAddChild-> %s %s" % (tag, self.__xmlLog()))
 
-        return self._inst(self.el.insertBefore(el, nn))
+        self.el.insertBefore(el, nn)
+        self._record('insert', el)
+
+        return self._inst(el)
 
 
     def xmlSetTextNode(self, newTextNode):
@@ -633,11 +686,12 @@ class XMLElement:
         if self.el.hasChildNodes():
             for n in self.el.childNodes:
                 if n.nodeType == Node.TEXT_NODE:
+                    if n.data != _encode(newTextNode):
+                        self._record('text', n, n.data, _encode(newTextNode))
                     n.data = _encode(newTextNode)
         else:
-            self._inst(
-                self.el.appendChild(
-                    self.doc.createTextNode(_encode(newTextNode))))
+            n = self.el.appendChild(self.doc.createTextNode(_encode(newTextNode)))
+            self._record('insert', n)
 
         log.debug("xmlSetTextNode-> %s" % self.__xmlLog())
 
@@ -853,6 +907,7 @@ class XMLElement:
         Create a comment XMLElement node.
         """
         elt = self._inst( self.el.appendChild(self.doc.createComment(data)) )
+        self._record('insert', elt.el)
         log.debug("xmlAddComment-> %s" % self.__xmlLog())
         return elt
 
@@ -1020,7 +1075,7 @@ class XMLElement:
         """
         if oldNode.el.hasChildNodes():
             for n in oldNode.el.childNodes:
-                self._inst(self.el.appendChild(n.cloneNode(deep)))
+                self._record('insert', self.el.appendChild(n.cloneNode(deep)))
 
         log.debug("xmlChildsCopy-> %s" % self.__xmlLog())
 
@@ -1029,6 +1084,7 @@ class XMLElement:
         """
         Destroy a single node.
         """
+        self._record('remove', self.el)
         oldChild = self.el.parentNode.removeChild(self.el)
         oldChild.unlink()
 
@@ -1052,6 +1108,7 @@ class XMLElement:
         """
         childNodeList = []
         while self.el.hasChildNodes():
+            self._record('remove', self.el.firstChild)
             oldChild = self.el.removeChild(self.el.firstChild)
             oldChild.unlink()
 
@@ -1249,6 +1306,9 @@ class Case(Dico, XMLDocument):
         Instantiate a new dico and a new xml doc
         """
         Dico.__init__(self)
+        self.generation = 0
+        self.journal = None
+        self.xml_index = None
         XMLDocument.__init__(self, case=self)
 
         if package:
@@ -1281,8 +1341,7 @@ class Case(Dico, XMLDocument):
         self.record_argument_prev = None
         self.record_local = False
         self.record_global = True
-        self.xml_prev = ""
-        self.xml_saved = self.toString()
+        self.saved_state = self.__xmlState()
 
 
     def module_name(self):
@@ -1301,17 +1360,43 @@ class Case(Dico, XMLDocument):
         return self.doc.documentElement
 
 
-    def isModified(self):
+    def clone(self):
         """
-        Return True if the xml doc is modified.
+        Return a copy of the case, with a deep copy of its xml document,
+        so that variants of a case may be built without reading and
+        initializing the file again. The undo/redo journal and node
+        index are not copied.
         """
-        # return self['saved'] == "no"
+        c = Case(package=self['package'], module=self.module_name())
+        c.doc.unlink()
+        c.doc = c.el = self.doc.cloneNode(True)
 
-        s = self.toIOString()
-        if s == self.xml_saved:
-            return False
-        else:
-            return True
+        for k in self.data:
+            if isinstance(self.data[k], list):
+                c.data[k] = []
+            else:
+                c.data[k] = self.data[k]
+
+        return c
+
+
+    def __xmlState(self):
+        """
+        Return the state of the xml doc: the number of modifications
+        not recorded in the undo journal, and the position in the journal.
+        """
+        position = 0
+        if self.journal != None:
+            position = self.journal.position()
+        return (self.generation, position)
+
+
+    def isModified(self):
+        """
+        Return True if the xml doc is modified since it was last saved
+        (undoing modifications back to the saved state is not one).
+        """
+        return self.__xmlState() != self.saved_state
 
 
     def __del__(self):
@@ -1340,7 +1425,9 @@ class Case(Dico, XMLDocument):
         """
         d = XMLDocument().parseString(self.toPrettyString())
         d.xmlCleanHighLevelBlank(d.root())
-        return d.toString()
+        s = d.toString()
+        d.doc.unlink()
+        return s
 
 
     def xmlSaveDocument(self, prettyString=True):
@@ -1350,17 +1437,15 @@ class Case(Dico, XMLDocument):
         """
         try:
             if prettyString:
-                d = XMLDocument().parseString(self.toPrettyString())
+                s = self.toIOString()
             else:
-                d = self
-            d.xmlCleanHighLevelBlank(d.root())
-            s = d.toString()
+                self.xmlCleanHighLevelBlank(self.root())
+                s = self.toString()
             file = open(self['xmlfile'], 'w')
             file.write(s)
             file.close()
-            self.xml_saved = s
+            self.saved_state = self.__xmlState()
             self['saved'] = "yes"
-            d.doc.unlink()
         except IOError as e:
             msg = "Error: unable to save the XML document file."
             print(msg)
@@ -1561,6 +1646,456 @@ class Case(Dico, XMLDocument):
         return
 
 
+    def xmlModified(self, op, node, *args):
+        """
+        Record a modification of the document in the undo journal if
+        one is associated with the case, or count it otherwise.
+        """
+        if self.xml_index != None:
+            self.xml_index.update(op, node, *args)
+        if self.journal == None or not self.journal.record(op, node, *args):
+            self.generation += 1
+
+
+    def xmlEnableIndex(self, enable=True):
+        """
+        Enable (or disable) the index of the document nodes used to
+        speed up node queries.
+        """
+        if enable:
+            self.xml_index = XMLIndex(self.doc)
+        else:
+            self.xml_index = None
+
+
+    def xmlGetIndex(self):
+        """
+        Return the index of the document nodes, or None if not enabled.
+        """
+        if self.xml_index != None and self.xml_index.doc is not self.doc:
+            self.xml_index = XMLIndex(self.doc)
+        return self.xml_index
+
+#-------------------------------------------------------------------------------
+# Index of document nodes
+#-------------------------------------------------------------------------------
+
+class XMLIndex:
+    """
+    Index of the Element nodes of a document by tag name, and by
+    (tag name, attribute name, attribute value), maintained incrementally
+    when the document is modified through XMLElement methods.
+
+    Queries return the same nodes as XMLElement._nodeList and
+    XMLElement._childNodeList, in document order.
+    """
+
+    def __init__(self, doc):
+        """
+        Constructor: index all nodes of a document.
+        """
+        self.doc = doc
+        self.tags = {}
+        self.attrs = {}
+        self.__addTree(doc)
+
+
+    def __addTree(self, node):
+        """
+        Add a node (if it is an Element) and its descendants to the index.
+        """
+        if node.nodeType == Node.ELEMENT_NODE:
+            tag = node.tagName
+            self.tags.setdefault(tag, {})[node] = None
+            for k, v in list(node.attributes.items()):
+                self.attrs.setdefault((tag, k, v), {})[node] = None
+        for n in node.childNodes:
+            if n.nodeType == Node.ELEMENT_NODE:
+                self.__addTree(n)
+
+
+    def __removeTree(self, node):
+        """
+        Remove a node (if it is an Element) and its descendants from the index.
+        """
+        if node.nodeType != Node.ELEMENT_NODE:
+            return
+        tag = node.tagName
+        self.tags.get(tag, {}).pop(node, None)
+        for k, v in list(node.attributes.items()):
+            self.attrs.get((tag, k, v), {}).pop(node, None)
+        for n in node.childNodes:
+            self.__removeTree(n)
+
+
+    def __isIndexed(self, node):
+        """
+        Return True if a node is indexed.
+        """
+        if node.nodeType != Node.ELEMENT_NODE:
+            return False
+        return node in self.tags.get(node.tagName, {})
+
+
+    def __isAttached(self, node):
+        """
+        Return True if a node belongs to the indexed document tree.
+        """
+        return node is self.doc or self.__isIndexed(node)
+
+
+    def update(self, op, node, *args):
+        """
+        Update the index for a modification of the document: called
+        after insertions and before removals or attribute changes.
+        """
+        if op == 'attr':
+            if self.__isIndexed(node):
+                tag, name, old, new = node.tagName, args[0], args[1], args[2]
+                if old != None:
+                    self.attrs.get((tag, name, old), {}).pop(node, None)
+                if new != None:
+                    self.attrs.setdefault((tag, name, new), {})[node] = None
+        elif op == 'insert':
+            if self.__isAttached(node.parentNode):
+                self.__addTree(node)
+        elif op == 'remove':
+            if self.__isIndexed(node):
+                self.__removeTree(node)
+
+
+    def __sort(self, nodes):
+        """
+        Sort nodes in document order.
+        """
+        positions = {}
+
+        def key(node):
+            k = []
+            while node.parentNode != None:
+                parent = node.parentNode
+                if parent not in positions:
+                    positions[parent] = dict([(c, i) for i, c
+                                              in enumerate(parent.childNodes)])
+                k.append(positions[parent][node])
+                node = parent
+            k.reverse()
+            return k
+
+        return sorted(nodes, key=key)
+
+
+    def nodeList(self, el, tag, attrList, kwargs, children=False):
+        """
+        Return the list of Element nodes with a given tag and attributes
+        below (or directly below if children is True) a given node,
+        or None if the node is not indexed.
+        """
+        if not self.__isAttached(el):
+            return None
+
+        # Use the smallest set of candidates (attributes whose expected
+        # value is empty also match missing attributes)
+
+        candidates = self.tags.get(tag, {})
+        for k, v in list(kwargs.items()):
+            if str(v) != "":
+                c = self.attrs.get((tag, str(k), str(v)), {})
+                if len(c) < len(candidates):
+                    candidates = c
+
+        nodeList = []
+        for node in candidates:
+            if not _nodeMatch(node, attrList, kwargs):
+                continue
+            if children:
+                if node.parentNode is not el:
+                    continue
+            elif el is not self.doc:
+                p = node.parentNode
+                while p != None and p is not el:
+                    p = p.parentNode
+                if p == None:
+                    continue
+            nodeList.append(node)
+
+        if len(nodeList) > 1:
+            nodeList = self.__sort(nodeList)
+
+        return nodeList
+
+#-------------------------------------------------------------------------------
+# Undo/redo journal
+#-------------------------------------------------------------------------------
+
+def _nodePath(node):
+    """
+    Return the path of a node from the document, as a tuple of child
+    indexes, or None if the node is not attached to a document.
+    """
+    path = []
+    while node.parentNode != None:
+        parent = node.parentNode
+        path.append(parent.childNodes.index(node))
+        node = parent
+    if node.nodeType != Node.DOCUMENT_NODE:
+        return None
+    path.reverse()
+    return tuple(path)
+
+
+def _pathNode(doc, path):
+    """
+    Return the node of a document matching a given path.
+    """
+    node = doc
+    for i in path:
+        node = node.childNodes[i]
+    return node
+
+
+class UndoJournal:
+    """
+    Journal of the modifications of the XML document of a case, used
+    for undo/redo.
+
+    Rather than a snapshot of the whole document, each undo step stores
+    the list of elementary operations performed on the document,
+    identified by the path of the modified node:
+    - ('attr', path, name, old, new): attribute change (None if absent)
+    - ('text', path, old, new): text node change
+    - ('insert', parent_path, index, node_type, data): node insertion
+    - ('remove', parent_path, index, node_type, data): node removal
+    Steps are stored in case['undo'] and case['redo'] as
+    [page, operations, index, tab, state_before, state_after] lists,
+    where states identify the successive states of the document (so
+    that they remain comparable if the undo/redo stacks are cleared).
+    The total size of recorded operations is bounded by discarding
+    the oldest steps.
+    """
+
+    def __init__(self, case, max_size=1<<24):
+        """
+        Constructor.
+        """
+        self.case = case
+        self.ops = None
+        self.size = 0
+        self.max_size = max_size
+        self.state = 0
+        self.n_states = 0
+
+
+    def isOpen(self):
+        """
+        Return True if the top undo step records new operations.
+        """
+        undo = self.case['undo']
+        return self.ops != None and undo != [] and undo[-1][1] is self.ops
+
+
+    def hasChanges(self):
+        """
+        Return True if the document was modified since the last step
+        was opened (or if no step is open).
+        """
+        return not self.isOpen() or self.ops != []
+
+
+    def openStep(self, page, index, tab):
+        """
+        Open a new undo step, reusing the top one if it is empty.
+        """
+        if self.isOpen() and self.ops == []:
+            self.case['undo'][-1] = [page, self.ops, index, tab,
+                                     self.state, None]
+            return
+
+        self.ops = []
+        self.case['undo'].append([page, self.ops, index, tab,
+                                  self.state, None])
+        self.case['redo'] = []
+        self.case['python_redo'] = []
+
+
+    def closeStep(self):
+        """
+        Close the current undo step.
+        """
+        self.ops = None
+
+
+    def position(self):
+        """
+        Return the identifier of the current state of the document.
+        """
+        return self.state
+
+
+    def record(self, op, node, *args):
+        """
+        Record an operation on the document in the current undo step.
+        Modifications made outside a step are recorded in a new step,
+        unless no step was ever recorded.
+        Return True if the operation was recorded.
+        """
+        if not self.isOpen():
+            if self.case['undo'] == [] and self.case['redo'] == []:
+                return False
+            self.openStep(self.case['current_page'],
+                          self.case['current_index'],
+                          self.case['current_tab'])
+
+        if op in ('insert', 'remove'):
+            parent = node.parentNode
+            path = _nodePath(parent)
+            if path == None:
+                return False
+            index = parent.childNodes.index(node)
+            if node.nodeType == Node.ELEMENT_NODE:
+                data = node.toxml()
+            else:
+                data = node.data
+            record = (op, path, index, node.nodeType, data)
+            size = len(path) + len(data)
+        else:
+            path = _nodePath(node)
+            if path == None:
+                return False
+            record = (op, path) + args
+            size = len(path)
+            for a in args:
+                if a != None:
+                    size += len(a)
+
+        self.ops.append(record)
+        self.size += size
+        self.n_states += 1
+        self.state = self.n_states
+        if self.size > self.max_size:
+            self.__trim()
+
+        return True
+
+
+    def __stepSize(self, step):
+        """
+        Return the size of the operations of a step.
+        """
+        size = 0
+        for record in step[1]:
+            size += len(record[1])
+            for a in record[2:]:
+                if type(a) == str:
+                    size += len(a)
+        return size
+
+
+    def __trim(self):
+        """
+        Discard the oldest undo steps so as to bound the journal size.
+        """
+        steps = self.case['undo'] + self.case['redo']
+        self.size = sum([self.__stepSize(step) for step in steps])
+        while self.size > self.max_size and len(self.case['undo']) > 1:
+            step = self.case['undo'].pop(0)
+            self.size -= self.__stepSize(step)
+
+
+    def __insert(self, record):
+        """
+        Insert a node described by an operation.
+        """
+        doc = self.case.doc
+        parent = _pathNode(doc, record[1])
+        node_type, data = record[3], record[4]
+        if node_type == Node.ELEMENT_NODE:
+            node = doc.importNode(parseString(_encode(data)).documentElement, True)
+        elif node_type == Node.COMMENT_NODE:
+            node = doc.createComment(data)
+        else:
+            node = doc.createTextNode(data)
+        ref = None
+        if record[2] < len(parent.childNodes):
+            ref = parent.childNodes[record[2]]
+        parent.insertBefore(node, ref)
+
+
+    def __remove(self, record):
+        """
+        Remove a node described by an operation.
+        """
+        parent = _pathNode(self.case.doc, record[1])
+        old_child = parent.removeChild(parent.childNodes[record[2]])
+        old_child.unlink()
+
+
+    def __apply(self, record, reverse):
+        """
+        Apply an operation (or its inverse) to the document.
+        """
+        op = record[0]
+        if op == 'attr':
+            node = _pathNode(self.case.doc, record[1])
+            value = record[3] if reverse else record[4]
+            if value == None:
+                if node.hasAttribute(record[2]):
+                    node.removeAttribute(record[2])
+            else:
+                node.setAttribute(record[2], value)
+        elif op == 'text':
+            node = _pathNode(self.case.doc, record[1])
+            node.data = record[2] if reverse else record[3]
+        elif (op == 'insert') != reverse:
+            self.__insert(record)
+        else:
+            self.__remove(record)
+
+
+    def __resetIndex(self):
+        """
+        Rebuild the index of the document nodes, if enabled, as operations
+        are applied directly to the document.
+        """
+        if self.case.xml_index != None:
+            self.case.xmlEnableIndex()
+
+
+    def undoStep(self):
+        """
+        Revert the last non-empty undo step, and move it to the redo
+        stack. Return the step, or None if there is nothing to undo.
+        """
+        self.ops = None
+        while self.case['undo']:
+            step = self.case['undo'].pop()
+            if step[1]:
+                for record in reversed(step[1]):
+                    self.__apply(record, True)
+                self.__resetIndex()
+                step[5] = self.state
+                self.state = step[4]
+                self.case['redo'].append(step)
+                return step
+        return None
+
+
+    def redoStep(self):
+        """
+        Apply again the last undone step, and move it back to the undo
+        stack. Return the step, or None if there is nothing to redo.
+        """
+        self.ops = None
+        if self.case['redo']:
+            step = self.case['redo'].pop()
+            for record in step[1]:
+                self.__apply(record, False)
+            self.__resetIndex()
+            self.state = step[5]
+            self.case['undo'].append(step)
+            return step
+        return None
+
 #-------------------------------------------------------------------------------
 # XMLengine test case
 #-------------------------------------------------------------------------------
@@ -1911,6 +2446,8 @@ class XMLengineTestCase(unittest.TestCase):
         """Check whether a Case could be save on the file system"""
         case = Case()
         case.parseString(u'<fruits color="red" taste="ok"><c a="2é">to</c></fruits>')
+        case.root()['size'] = 'big'
+        assert case.isModified(), 'Could not use the isModified method'
         case['xmlfile'] = os.path.dirname(os.getcwd()) + "/ToTo"
         if os.path.isfile(case['xmlfile']):
             os.remove(case['xmlfile'])
@@ -1920,6 +2457,9 @@ class XMLengineTestCase(unittest.TestCase):
             assert False, \
             'Could not save the file ' + case['xmlfile']
 
+        assert not case.isModified(), \
+               'Could not use the isModified method'
+
         d= case.parse(case['xmlfile'])
         os.remove(case['xmlfile'])
         d.xmlCleanAllBlank(d.root())
@@ -1927,6 +2467,118 @@ class XMLengineTestCase(unittest.TestCase):
                'Could not use the xmlSaveDocument method'
 
 
+    def checkToIOString(self):
+        """Check whether blanks of text nodes are cleaned for IO"""
+        case = Case()
+        case.parseString(u'<a><b><formula/></b><v/></a>')
+        case.xmlGetNode('formula').xmlSetTextNode('\n  a = 1;\n')
+        case.xmlGetNode('v').xmlSetTextNode(' 3.5\n')
+        s = case.toIOString()
+        assert '<formula>a = 1;</formula>' in s and '<v>3.5</v>' in s, \
+               'Could not use the toIOString method'
+
+
+    def checkUndoJournal(self):
+        """Check whether modifications could be undone and redone."""
+        case = Case()
+        case.parseString(self.xmlNewFile())
+        case.journal = UndoJournal(case)
+        case.xmlEnableIndex()
+        initial = case.toString()
+
+        case.journal.openStep('page', None, -1)
+        node = case.xmlGetNode('fruits')
+        node['color'] = 'green'
+        node.xmlSetAttribute(taste='ok')
+        node.xmlSetTextNode('apple')
+        node.xmlAddChild('seed', name='s1')
+        case.xmlGetNode('cucumber').xmlRemoveNode()
+        case.xmlGetNode('first').xmlDelAttribute('none')
+        modified = case.toString()
+
+        assert case.isModified(), 'Could not use the isModified method'
+
+        case.journal.undoStep()
+        assert case.toString() == initial, 'Could not undo modifications'
+        assert not case.isModified(), \
+               'Undo back to the saved state is not a modification'
+        case.journal.redoStep()
+        assert case.toString() == modified, 'Could not redo modifications'
+        assert case.isModified(), 'Could not use the isModified method'
+        case.journal.undoStep()
+        assert case.toString() == initial, 'Could not undo modifications'
+        assert not case.isModified(), \
+               'Undo back to the saved state is not a modification'
+
+
+    def checkSaveWithUndoJournal(self):
+        """Check whether saving resets the modification state."""
+        case = Case()
+        case.parseString(self.xmlNewFile())
+        case.journal = UndoJournal(case)
+        case['xmlfile'] = os.path.join(tempfile.mkdtemp(), 'case.xml')
+
+        case.journal.openStep('page', None, -1)
+        case.xmlGetNode('fruits')['color'] = 'green'
+        assert case.isModified(), 'Could not use the isModified method'
+
+        # Save as done by the GUI, which also clears the undo/redo stacks
+        case.xmlSaveDocument()
+        case['undo'] = []
+        case['redo'] = []
+        assert not case.isModified(), \
+               'Clearing the undo journal after a save is not a modification'
+
+        case.xmlGetNode('fruits')['color'] = 'red'
+        assert case.isModified(), 'Could not use the isModified method'
+
+        # Saved state is no longer reachable after undo and a new edit
+        case.xmlSaveDocument()
+        case.journal.openStep('page', None, -1)
+        case.xmlGetNode('fruits')['color'] = 'blue'
+        case.xmlSaveDocument()
+        case.journal.undoStep()
+        assert case.isModified(), 'Could not use the isModified method'
+        case.journal.openStep('page', None, -1)
+        case.xmlGetNode('fruits')['color'] = 'white'
+        assert case.isModified(), \
+               'Different edit from the saved state is a modification'
+
+        os.remove(case['xmlfile'])
+        os.rmdir(os.path.dirname(case['xmlfile']))
+
+
+    def checkXmlIndex(self):
+        """Check whether indexed node queries match non-indexed ones."""
+        def zones(case):
+            labels = []
+            for node in case.xmlGetNodeList('zone'):
+                label = node['label']
+                labels.append(label)
+                case.xmlGetNode('zone', label=label)
+                b = case.xmlGetNode('boundary_conditions')
+                b.xmlInitChildNode('wall', label=label)
+            labels.append(len(case.xmlGetNodeList('wall', 'label')))
+            return labels
+
+        results = []
+        for indexed in (False, True):
+            case = Case()
+            if indexed:
+                case.xmlEnableIndex()
+            root = case.root()
+            zones_node = root.xmlInitNode('boundary_zones')
+            root.xmlInitNode('boundary_conditions')
+            for i in range(500):
+                zones_node.xmlAddChild('zone', label='BC_%d' % i, name=str(i))
+            zones_node.xmlGetChildNode('zone', label='BC_250').xmlRemoveNode()
+            results.append(zones(case))
+            results.append(zones(case))
+
+        assert results[0] == results[2] == results[3], \
+               'Indexed node queries differ from non-indexed ones'
+
+
 ##    def checkFailUnless(self):
 ##        """Test"""
 ##        self.failUnless(1==1, "One should be one.")
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+
+# This file is part of Code_Saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2021 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module defines a persistent database of studymanager results
+(run times, checkpoint differences and mesh sizes), stored using SQLite,
+so that results may be followed across studymanager invocations.
+
+This module contains the following classes and functions:
+- checkpoint_mesh_sizes
+- results_db
+- process_cmd_line
+- main
+"""
+
+#-------------------------------------------------------------------------------
+# Standard modules import
+#-------------------------------------------------------------------------------
+
+import os, sys
+import socket
+import sqlite3
+import threading
+from datetime import datetime
+
+#-------------------------------------------------------------------------------
+# Application modules import
+#-------------------------------------------------------------------------------
+
+try:
+    from code_saturne import cs_io_reader
+except Exception:
+    cs_io_reader = None
+
+#-------------------------------------------------------------------------------
+# Global definitions
+#-------------------------------------------------------------------------------
+
+_schema = """
+CREATE TABLE IF NOT EXISTS invocations (
+  id INTEGER PRIMARY KEY,
+  date TEXT,
+  host TEXT,
+  version TEXT,
+  destination TEXT);
+
+CREATE TABLE IF NOT EXISTS runs (
+  invocation_id INTEGER,
+  study TEXT,
+  case_label TEXT,
+  run_id TEXT,
+  n_procs TEXT,
+  wall_time REAL,
+  status TEXT);
+
+CREATE INDEX IF NOT EXISTS runs_case ON runs (study, case_label);
+
+CREATE TABLE IF NOT EXISTS mesh_sizes (
+  invocation_id INTEGER,
+  study TEXT,
+  case_label TEXT,
+  run_id TEXT,
+  location TEXT,
+  n_elts INTEGER);
+
+CREATE TABLE IF NOT EXISTS comparisons (
+  id INTEGER PRIMARY KEY,
+  invocation_id INTEGER,
+  study TEXT,
+  case_label TEXT,
+  repo_file TEXT,
+  repo_key TEXT,
+  dest_file TEXT,
+  dest_key TEXT,
+  threshold TEXT,
+  args TEXT,
+  mesh_size_eq INTEGER,
+  reused INTEGER);
+
+CREATE INDEX IF NOT EXISTS comparisons_files
+  ON comparisons (repo_file, dest_file);
+
+CREATE TABLE IF NOT EXISTS diffs (
+  comparison_id INTEGER,
+  field TEXT,
+  max_diff REAL,
+  mean_diff REAL,
+  threshold TEXT);
+"""
+
+#-------------------------------------------------------------------------------
+# Mesh sizes of a checkpoint file
+#-------------------------------------------------------------------------------
+
+def checkpoint_mesh_sizes(path):
+    """
+    Return the list of (location name, number of elements) pairs
+    declared in a checkpoint file, reading only section headers.
+    As in cs_restart.c, a location is declared by the first section
+    referring to a location id beyond those already known.
+    """
+    sizes = []
+
+    f = cs_io_reader.io_file(path)
+    for sh in f.sections:
+        if sh.location_id > len(sizes) and sh.n_vals == 1:
+            v = f.read_section(sh)
+            sizes.append((sh.name, int(v[0])))
+
+    return sizes
+
+#-------------------------------------------------------------------------------
+# Results database
+#-------------------------------------------------------------------------------
+
+class results_db(object):
+    """
+    Persistent storage of studymanager results. Methods may be called
+    from several threads.
+    """
+
+    def __init__(self, path):
+        """
+        Open (and create if needed) the database.
+        """
+        self.path = path
+        self.invocation_id = None
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout=60.,
+                                    check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.executescript(_schema)
+
+    #---------------------------------------------------------------------------
+
+    def close(self):
+        """
+        Close the database.
+        """
+        if self.conn != None:
+            self.conn.close()
+            self.conn = None
+
+    #---------------------------------------------------------------------------
+
+    def __query(self, sql, args=()):
+        """
+        Return all rows matching a query.
+        """
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    #---------------------------------------------------------------------------
+
+    def start_invocation(self, version, destination):
+        """
+        Record the start of a studymanager invocation, to which
+        results added later are associated.
+        """
+        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            c = self.conn.execute("INSERT INTO invocations "
+                                  "(date, host, version, destination) "
+                                  "VALUES (?, ?, ?, ?)",
+                                  (date, socket.gethostname(), version,
+                                   destination))
+            self.invocation_id = c.lastrowid
+
+    #---------------------------------------------------------------------------
+
+    def add_run(self, study, case, run_id, n_procs, wall_time, status):
+        """
+        Record the run time of a case.
+        """
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (self.invocation_id, study, case, run_id,
+                               n_procs, wall_time, status))
+
+    #---------------------------------------------------------------------------
+
+    def add_mesh_sizes(self, study, case, run_id, sizes):
+        """
+        Record mesh sizes of a case, given as (location, size) pairs.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO mesh_sizes "
+                                  "VALUES (?, ?, ?, ?, ?, ?)",
+                                  [(self.invocation_id, study, case, run_id,
+                                    l, n) for l, n in sizes])
+
+    #---------------------------------------------------------------------------
+
+    def wall_times(self, study, case, n_max=None, n_procs=None):
+        """
+        Return wall times of successful runs of a case, most recent first,
+        only for a given number of processes if specified.
+        """
+        sql = "SELECT wall_time FROM runs " \
+              "WHERE study = ? AND case_label = ? AND status = 'OK'"
+        args = [study, case]
+        if n_procs != None:
+            sql += " AND n_procs = ?"
+            args.append(str(n_procs))
+        sql += " ORDER BY rowid DESC"
+        if n_max:
+            sql += " LIMIT %d" % n_max
+        return [r[0] for r in self.__query(sql, args)]
+
+    #---------------------------------------------------------------------------
+
+    def __file_key(self, path):
+        """
+        Return a key identifying the current version of a file,
+        or None if it does not exist.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return "%d:%d" % (st.st_size, st.st_mtime_ns)
+
+    #---------------------------------------------------------------------------
+
+    def find_comparison(self, repo, dest, threshold, args):
+        """
+        Return the differences and mesh size equality found by the last
+        comparison of the same versions of two files with the same
+        settings, or None if these files were not compared yet.
+        Differences are (field, max, mean, threshold) tuples.
+        """
+        repo_key = self.__file_key(repo)
+        dest_key = self.__file_key(dest)
+        if repo_key == None or dest_key == None:
+            return None
+
+        rows = self.__query("SELECT id, mesh_size_eq FROM comparisons "
+                            "WHERE repo_file = ? AND repo_key = ? "
+                            "AND dest_file = ? AND dest_key = ? "
+                            "AND threshold = ? AND args = ? "
+                            "ORDER BY id DESC LIMIT 1",
+                            (repo, repo_key, dest, dest_key,
+                             str(threshold), str(args or '')))
+        if not rows:
+            return None
+
+        diffs = self.__query("SELECT field, max_diff, mean_diff, threshold "
+                             "FROM diffs WHERE comparison_id = ? "
+                             "ORDER BY rowid", (rows[0][0],))
+
+        return diffs, bool(rows[0][1])
+
+    #---------------------------------------------------------------------------
+
+    def add_comparison(self, study, case, repo, dest, threshold, args,
+                       diffs, mesh_size_eq, reused=False):
+        """
+        Record the result of a comparison of two checkpoint files,
+        with differences given as (field, max, mean, threshold) tuples.
+        """
+        with self.lock, self.conn:
+            c = self.conn.execute("INSERT INTO comparisons "
+                                  "(invocation_id, study, case_label, "
+                                  "repo_file, repo_key, dest_file, dest_key, "
+                                  "threshold, args, mesh_size_eq, reused) "
+                                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  (self.invocation_id, study, case,
+                                   repo, self.__file_key(repo),
+                                   dest, self.__file_key(dest),
+                                   str(threshold), str(args or ''),
+                                   int(mesh_size_eq), int(reused)))
+            self.conn.executemany("INSERT INTO diffs VALUES (?, ?, ?, ?, ?)",
+                                  [(c.lastrowid,) + tuple(d) for d in diffs])
+
+    #---------------------------------------------------------------------------
+
+    def query(self, table, study=None, case=None, field=None, last=None):
+        """
+        Return column names and rows of a given results table
+        ('runs', 'diffs' or 'meshes'), oldest first.
+        """
+        if table == 'runs':
+            columns = ['date', 'study', 'case', 'run_id', 'n_procs',
+                       'wall_time', 'status']
+            sql = "SELECT i.date, r.study, r.case_label, r.run_id, " \
+                  "r.n_procs, r.wall_time, r.status " \
+                  "FROM runs r JOIN invocations i ON r.invocation_id = i.id"
+            prefix = 'r'
+        elif table == 'diffs':
+            columns = ['date', 'study', 'case', 'field', 'max', 'mean',
+                       'threshold', 'reused']
+            sql = "SELECT i.date, c.study, c.case_label, d.field, " \
+                  "d.max_diff, d.mean_diff, d.threshold, c.reused " \
+                  "FROM diffs d JOIN comparisons c ON d.comparison_id = c.id " \
+                  "JOIN invocations i ON c.invocation_id = i.id"
+            prefix = 'c'
+        elif table == 'meshes':
+            columns = ['date', 'study', 'case', 'run_id', 'location',
+                       'n_elts']
+            sql = "SELECT i.date, m.study, m.case_label, m.run_id, " \
+                  "m.location, m.n_elts " \
+                  "FROM mesh_sizes m JOIN invocations i " \
+                  "ON m.invocation_id = i.id"
+            prefix = 'm'
+        else:
+            raise ValueError("unknown table: %s" % table)
+
+        conditions = []
+        args = []
+        if study:
+            conditions.append(prefix + ".study = ?")
+            args.append(study)
+        if case:
+            conditions.append(prefix + ".case_label = ?")
+            args.append(case)
+        if field and table == 'diffs':
+            conditions.append("d.field = ?")
+            args.append(field)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY " + prefix + ".rowid DESC"
+        if last:
+            sql += " LIMIT %d" % last
+
+        rows = self.__query(sql, args)
+        rows.reverse()
+
+        return columns, rows
+
+    #---------------------------------------------------------------------------
+
+    def trend(self, study=None, case=None, n_ref=5, ratio=None):
+        """
+        Compare the last wall time of each case with the median of its
+        n_ref previous successful runs. If ratio is given, only cases
+        whose time increased by at least that factor are returned.
+        """
+        columns = ['study', 'case', 'n_runs', 'last', 'median', 'ratio']
+
+        rows = []
+        pairs = self.__query("SELECT DISTINCT study, case_label FROM runs "
+                             "ORDER BY study, case_label")
+        for s, c in pairs:
+            if (study and s != study) or (case and c != case):
+                continue
+            times = self.wall_times(s, c, n_ref + 1)
+            if len(times) < 1:
+                continue
+            ref = sorted(times[1:])
+            median = None
+            r = None
+            if ref:
+                n = len(ref)
+                median = 0.5*(ref[(n-1)//2] + ref[n//2])
+                if median > 0:
+                    r = times[0] / median
+            if ratio != None and (r == None or r < ratio):
+                continue
+            rows.append((s, c, len(times), times[0], median, r))
+
+        return columns, rows
+
+#-------------------------------------------------------------------------------
+# Query command line
+#-------------------------------------------------------------------------------
+
+def process_cmd_line(argv, pkg):
+    """
+    Process the passed command line arguments.
+    """
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Query a studymanager results "
+                            "database (see the studymanager --db option).")
+
+    parser.add_argument("query", choices=['runs', 'diffs', 'meshes', 'trend'],
+                        help="results to list: run times, checkpoint "
+                        "differences, mesh sizes, or last run times "
+                        "compared to previous ones")
+
+    parser.add_argument("--db", dest="db_path", type=str,
+                        default="studymanager.db",
+                        help="path of the database "
+                        "(default: studymanager.db)")
+
+    parser.add_argument("--study", dest="study", type=str,
+                        help="select a given study")
+
+    parser.add_argument("--case", dest="case", type=str,
+                        help="select a given case")
+
+    parser.add_argument("--field", dest="field", type=str,
+                        help="select a given field (diffs only)")
+
+    parser.add_argument("--last", dest="last", type=int,
+                        help="list only the last LAST results")
+
+    parser.add_argument("--n-ref", dest="n_ref", type=int, default=5,
+                        help="number of previous runs used as reference "
+                        "(trend only, default: 5)")
+
+    parser.add_argument("--ratio", dest="ratio", type=float,
+                        help="list only cases whose time increased by "
+                        "at least this factor (trend only)")
+
+    parser.add_argument("--csv", dest="csv", action="store_true",
+                        help="output in CSV format")
+
+    return parser.parse_args(argv)
+
+#-------------------------------------------------------------------------------
+
+def main(argv, pkg):
+    """
+    Main function.
+    """
+    options = process_cmd_line(argv, pkg)
+
+    if not os.path.isfile(options.db_path):
+        sys.stderr.write("Error: database %s not found.\n" % options.db_path)
+        return 1
+
+    db = results_db(options.db_path)
+
+    if options.query == 'trend':
+        columns, rows = db.trend(options.study, options.case,
+                                 options.n_ref, options.ratio)
+    else:
+        columns, rows = db.query(options.query, options.study, options.case,
+                                 options.field, options.last)
+
+    db.close()
+
+    def fmt(v):
+        if v == None:
+            return ''
+        elif isinstance(v, float):
+            return '%g' % v
+        return str(v)
+
+    lines = [columns] + [[fmt(v) for v in r] for r in rows]
+
+    if options.csv:
+        for l in lines:
+            sys.stdout.write(','.join(l) + '\n')
+    else:
+        widths = [max([len(l[i]) for l in lines]) for i in range(len(columns))]
+        for l in lines:
+            sys.stdout.write('  '.join([s.ljust(w) for s, w in zip(l, widths)])
+                             .rstrip() + '\n')
+
+    return 0
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -27,6 +27,7 @@
 #-------------------------------------------------------------------------------
 
 import os, sys, string, logging
+import pickle
 from string import *
 
 #-------------------------------------------------------------------------------
@@ -41,6 +42,8 @@ except ImportError:
 
 matplotlib.use("Agg")
 
+import numpy
+
 #-------------------------------------------------------------------------------
 # matplotlib config
 #-------------------------------------------------------------------------------
@@ -83,6 +86,85 @@ log = logging.getLogger(__file__)
 log.setLevel(logging.NOTSET)
 #log.setLevel(logging.DEBUG)
 
+#===============================================================================
+# Data files loading
+#===============================================================================
+
+# Parsed data files, by path, modification time, and size
+
+_data_cache = {}
+
+#-------------------------------------------------------------------------------
+
+def load_data(file_name):
+    """
+    Load a data file (whitespace or comma separated columns, with optional
+    comment lines starting with '#' and optional header line).
+    Files are parsed only once as long as they are not modified.
+    @type file_name: C{String}
+    @param file_name: path of the data file
+    @rtype: C{Tuple}
+    @return: array of values (one row per column of the file), and
+             1 if a header line was skipped, 0 otherwise
+    """
+    st = os.stat(file_name)
+    key = (os.path.abspath(file_name), st.st_mtime_ns, st.st_size)
+    if key in _data_cache:
+        return _data_cache[key]
+
+    f = open(file_name, 'r')
+    text = f.read()
+    f.close()
+
+    lines = [l.lstrip() for l in text.splitlines()]
+    lines = [l.replace(',', ' ') for l in lines if l and l[0] != '#']
+
+    # try to detect a header to skip it
+    n_skip = 0
+    if lines:
+        try:
+            float(lines[0].split()[0])
+        except ValueError:
+            n_skip = 1
+            lines = lines[1:]
+
+    rows = [l.split() for l in lines]
+    n_cols = max([len(r) for r in rows] + [0])
+
+    values = None
+    if rows and min([len(r) for r in rows]) == n_cols:
+        try:
+            values = numpy.array(rows, dtype=numpy.float64).transpose()
+        except ValueError:
+            pass
+
+    if values is None:
+        # irregular rows or non-numeric values: missing or unparseable
+        # values are set to NaN (converting each column separately)
+        values = numpy.full((n_cols, len(rows)), numpy.nan)
+        for j in range(n_cols):
+            col = [r[j] if j < len(r) else 'nan' for r in rows]
+            try:
+                values[j] = numpy.array(col, dtype=numpy.float64)
+            except ValueError:
+                for i, v in enumerate(col):
+                    try:
+                        values[j, i] = float(v)
+                    except ValueError:
+                        pass
+
+    _data_cache[key] = (values, n_skip)
+
+    return values, n_skip
+
+#-------------------------------------------------------------------------------
+
+def clear_data_cache():
+    """
+    Free data loaded by load_data.
+    """
+    _data_cache.clear()
+
 #===============================================================================
 # Plot class
 #===============================================================================
@@ -105,9 +187,7 @@ class Plot(object):
         self.ismesure = False
         self.cmd      = []
 
-        # Open file of data
-
-        self.f = open(file, 'r')
+        self.file_name = file
 
         # Read mandatory attributes
         self.subplots = [int(s) for s in parser.getAttribute(node,"spids").split()]
@@ -145,16 +225,9 @@ class Plot(object):
         except:
             yerrp = None
 
-        self.f.close()
-
         # Error Bar
-        self.f = open(file, 'r')
         self.xerr = self.uploadErrorBar(xerr, xerrp, xcol)
-        self.f.close()
-
-        self.f = open(file, 'r')
         self.yerr = self.uploadErrorBar(yerr, yerrp, ycol)
-        self.f.close()
 
         # List of additional matplotlib commands
         for k, v in parser.getAttributes(node).items():
@@ -183,29 +256,14 @@ class Plot(object):
         """
         Upload and parse data
         """
-        j = 0
-
-        for line in self.f.readlines():
-            line = line.lstrip()
-            if line and line[0] != '#':
-                j += 1
-                line = line.replace(", ", " ") # compatibility with CSV
-                line = line.lstrip()
+        values, n_skip = load_data(self.file_name)
 
-                # for CSV files, try to detect a header to skip it
-                if j == 1:
-                    try:
-                        val = float(line.split()[0])
-                    # if it can not be converted to float
-                    except ValueError as not_float:
-                        continue
-
-                if xcol:
-                    self.xspan.append(float(line.split()[xcol-1])*xscale + xplus)
-                else:
-                    self.xspan.append(j)
+        if xcol:
+            self.xspan = values[xcol-1]*xscale + xplus
+        else:
+            self.xspan = numpy.arange(1, values.shape[1] + 1) + n_skip
 
-                self.yspan.append(float(line.split()[ycol-1])*yscale + yplus)
+        self.yspan = values[ycol-1]*yscale + yplus
 
     #---------------------------------------------------------------------------
 
@@ -216,47 +274,21 @@ class Plot(object):
         if errorbar == None and errorp == None:
             return None
 
-        elif errorbar:
+        values, n_skip = load_data(self.file_name)
+
+        if errorbar:
             if errorp:
                 print("Warning: ambiguous definitions of error bars for "
                       "one data set, percentage and set of error values.\n"
                       "The error definition by percentage will be ignored.")
 
             if len(errorbar) == 2:
-                error = [ [], [] ]
-                j = 0
-                for line in self.f.readlines():
-                    line = line.lstrip()
-                    if line and line[0] != '#':
-                        j += 1
-                        line = line.replace(", ", " ") # compatibility with CSV
-                        line = line.lstrip()
-                        # for CSV files, try to detect a header to skip it
-                        if j == 1:
-                            try:
-                                val = float(line.split()[0])
-                            except ValueError as not_float:
-                                continue
-                        error[0].append(float(line.split()[errorbar[0]-1]))
-                        error[1].append(float(line.split()[errorbar[1]-1]))
+                error = [values[errorbar[0]-1].tolist(),
+                         values[errorbar[1]-1].tolist()]
                 return error
 
             elif len(errorbar) == 1:
-                error = []
-                j = 0
-                for line in self.f.readlines():
-                    line = line.lstrip()
-                    if line and line[0] != '#':
-                        j += 1
-                        line = line.replace(", ", " ") # compatibility with CSV
-                        line = line.lstrip()
-                        # for CSV files, try to detect a header to skip it
-                        if j == 1:
-                            try:
-                                val = float(line.split()[0])
-                            except ValueError as not_float:
-                                continue
-                        error.append(float(line.split()[errorbar[0]-1]))
+                error = values[errorbar[0]-1].tolist()
                 return error
         elif errorp:
             if col == 0:
@@ -264,21 +296,7 @@ class Plot(object):
                       "unspecified data set (column number missing).\n")
                 sys.exit(1)
             else:
-                error = []
-                j = 0
-                for line in self.f.readlines():
-                    line = line.lstrip()
-                    if line and line[0] != '#':
-                        j += 1
-                        line = line.replace(", ", " ") # compatibility with CSV
-                        line = line.lstrip()
-                        # for CSV files, try to detect a header to skip it
-                        if j == 1:
-                            try:
-                                val = float(line.split()[0])
-                            except ValueError as not_float:
-                                continue
-                        error.append(errorp/100.*float(line.split()[col-1]))
+                error = (errorp/100.*values[col-1]).tolist()
                 return error
 
 #===============================================================================
@@ -306,29 +324,10 @@ class Probes(object):
 
         xcol = 1
 
-        f = open(file_name, 'r')
+        values, n_skip = load_data(file_name)
 
-        j = 0
-
-        for line in f.readlines():
-            line = line.lstrip()
-            if line and line[0] != '#':
-                j += 1
-                line = line.replace(", ", " ") # compatibility with CSV
-                line = line.lstrip()
-
-                # for CSV files, try to detect a header to skip it
-                if j == 1:
-                    try:
-                        val = float(line.split()[0])
-                    # if it can not be converted to float
-                    except ValueError as not_float:
-                        continue
-
-                self.xspan.append(float(line.split()[xcol - 1]))
-                self.yspan.append(float(line.split()[ycol - 1]))
-
-        f.close()
+        self.xspan = values[xcol - 1]
+        self.yspan = values[ycol - 1]
 
     #---------------------------------------------------------------------------
 
@@ -530,24 +529,19 @@ class Plotter(object):
         """
         Compute the number of column of the data file.
         """
-        nbr = 0
-        f = open(file_name, 'r')
-        for line in f.readlines():
-            line = line.lstrip()
-            if line and line[0] != '#':
-                nbr = len(line.split())
-                break
-        f.close()
-        return nbr
+        values, n_skip = load_data(file_name)
+        return values.shape[0]
 
     #---------------------------------------------------------------------------
 
-    def plot_study(self, study_label, study_object, disable_tex, default_fmt):
+    def plot_study(self, study_label, study_object, disable_tex, default_fmt,
+                   n_jobs=1):
         """
         Method used to plot all plots from a I{study_label} (all cases).
         @type study_label: C{String}
         @param study_label: label of a study
-
+        @type n_jobs: C{int}
+        @param n_jobs: number of figures rendered concurrently
         """
         # disable tex in Matplotlib (use Mathtext instead)
         rcParams['text.usetex'] = not disable_tex
@@ -650,14 +644,8 @@ class Plotter(object):
                                        subplots,
                                        default_fmt))
 
-        # create one figure and use it for all figures
-        # this figure is the current figure
-        fig = plt.figure()
-
+        tasks = []
         for figure in self.figures:
-            # Plot curve
-            self.plot_figure(figure)
-
             f = os.path.join(self.parser.getDestination(),
                              study_label,
                              "POST",
@@ -667,11 +655,55 @@ class Plotter(object):
             # the detailed report without the png or pdf extension.
             study_object.matplotlib_figures.append(f)
 
-            # save the figure
-            self.__save(f, figure)
+            tasks.append((figure, f))
+
+        # render figures, using a pool of processes if requested
+        n_procs = min(n_jobs, len(tasks))
+        if n_procs > 1:
+            try:
+                self.__render_figures_parallel(tasks, n_procs, disable_tex)
+                tasks = []
+            except (OSError, ImportError, pickle.PicklingError) as e:
+                print("Warning: figures will be rendered sequentially (%s)." % e)
+
+        for figure, f in tasks:
+            self.render_figure(figure, f)
+
+        # free data read for this study
+        clear_data_cache()
+
+    #---------------------------------------------------------------------------
+
+    def __render_figures_parallel(self, tasks, n_procs, disable_tex):
+        """
+        Render figures in a pool of processes. Figures carry their curves'
+        data as arrays, so data files are not read again by workers.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        # check that all figures may be sent to workers before starting
+        for figure, f in tasks:
+            pickle.dumps(figure)
 
-        # close current figure
-        plt.close()
+        with ProcessPoolExecutor(max_workers=n_procs) as executor:
+            futures = [executor.submit(_render_figure, figure, f, disable_tex)
+                       for figure, f in tasks]
+            for future in futures:
+                future.result()
+
+    #---------------------------------------------------------------------------
+
+    def render_figure(self, figure, f):
+        """
+        Plot a single figure in a new matplotlib figure, and save it
+        to f (without extension).
+        """
+        plt.figure()
+        try:
+            self.plot_figure(figure)
+            self.__save(f, figure)
+        finally:
+            plt.close()
 
     #---------------------------------------------------------------------------
 
@@ -840,3 +872,14 @@ class Plotter(object):
             plt.savefig(f, format=fmt)
 
 #-------------------------------------------------------------------------------
+# Render a figure in a worker process
+#-------------------------------------------------------------------------------
+
+def _render_figure(figure, f, disable_tex):
+    """
+    Render and save a single figure; used by worker processes.
+    """
+    rcParams['text.usetex'] = not disable_tex
+    Plotter(None).render_figure(figure, f)
+
+#-------------------------------------------------------------------------------
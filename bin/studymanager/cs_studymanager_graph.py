@@ -25,9 +25,12 @@
 """
 This module contains the creation of the dependancy graph between CASES.
 
-This module contains the following classes:
+This module contains the following classes and functions:
+- wtime_seconds
 - node_case
 - dependency_graph
+- case_scheduler
+- SchedulerTestCase
 """
 
 #-------------------------------------------------------------------------------
@@ -36,6 +39,13 @@ This module contains the following classes:
 
 import os, sys
 import logging
+import threading
+import time
+import unittest
+try:
+    import queue            # Python3
+except ImportError:
+    import Queue as queue   # Python2
 
 #-------------------------------------------------------------------------------
 # Application modules import
@@ -51,6 +61,20 @@ log = logging.getLogger(__file__)
 #log.setLevel(logging.DEBUG)
 log.setLevel(logging.NOTSET)
 
+#-------------------------------------------------------------------------------
+
+def wtime_seconds(wtime):
+    """ converts a wall time given either in seconds or in [[h:]m:]s
+        format to seconds (0 if not defined)
+    """
+    try:
+        t = 0.
+        for v in str(wtime).split(':'):
+            t = t*60. + float(v)
+        return t
+    except (TypeError, ValueError):
+        return 0.
+
 #-------------------------------------------------------------------------------
 # class node_case
 #-------------------------------------------------------------------------------
@@ -74,6 +98,20 @@ class node_case:
         # level is modified in add_node
         self.level       = None
 
+    def weight(self):
+        """ returns the number of processes used by the case
+        """
+        try:
+            return max(int(self.n_procs), 1)
+        except (TypeError, ValueError):
+            return 1
+
+    def wtime(self):
+        """ returns the estimated wall time of the case in seconds
+            (given either in seconds or in [[h:]m:]s format), or 0
+        """
+        return wtime_seconds(self.estim_wtime)
+
     def __str__(self):
         res  = '\nCase ' + self.name
         res += ' on ' + str(self.n_procs) + ' procs'
@@ -155,6 +193,13 @@ class dependency_graph(object):
                 sub_graph.add_node(node)
         return sub_graph
 
+    def parent(self, node):
+        """ returns the node a given node depends on, or None """
+        for neighbor in self.graph_dict.get(node, []):
+            if neighbor.name != 'root':
+                return neighbor
+        return None
+
     def root_node(self):
         """ returns the root node of the graph """
         for node in self.graph_dict:
@@ -172,4 +217,261 @@ class dependency_graph(object):
         return res
 
 #-------------------------------------------------------------------------------
+# class case_scheduler
+#-------------------------------------------------------------------------------
+
+class case_scheduler(object):
+
+    def __init__(self, graph, n_procs_max, run_case, end_case=None,
+                 start_case=None, skip_case=None):
+        """ Initializes a scheduler running the cases of a dependency graph
+            concurrently on the local node, within a budget of n_procs_max
+            processes.
+            run_case is called in a worker thread with a node_case, and
+            returns an error code; the following optional functions are
+            called in the calling thread:
+            start_case with the node_case just before the case is run;
+            end_case with the node_case and error code when the case
+            has finished;
+            skip_case with the node_case and the failed node_case it
+            depends on (directly or not) when the case is not run.
+        """
+        self.graph       = graph
+        self.n_procs_max = max(int(n_procs_max), 1)
+        self.run_case    = run_case
+        self.end_case    = end_case
+        self.start_case  = start_case
+        self.skip_case   = skip_case
+
+    def __priority(self, node):
+        """ sort key for ready cases: longest chain of dependent cases
+            first, then longest estimated wall time, then widest case
+        """
+        return (-self.path_wtime[node], -node.wtime(), -node.weight())
+
+    def __path_wtimes(self, nodes):
+        """ returns the estimated wall time of the longest chain of cases
+            starting with each node (the node and the cases depending
+            on it, directly or not)
+        """
+        children = {}
+        for n in nodes:
+            parent = self.graph.parent(n)
+            if parent is not None:
+                children.setdefault(parent, []).append(n)
+
+        path_wtime = {}
+
+        # Handle nodes by decreasing level, so that children come first
+
+        for n in sorted(nodes, key=lambda n: -(n.level or 0)):
+            t = 0.
+            for c in children.get(n, []):
+                t = max(t, path_wtime[c])
+            path_wtime[n] = n.wtime() + t
+
+        return path_wtime
+
+    def __worker(self, node, done):
+        """ runs a case in a worker thread and signals its end """
+        error = 1
+        try:
+            error = self.run_case(node)
+        finally:
+            done.put((node, error))
+
+    def __skip_dependents(self, failed, pending):
+        """ removes the cases depending (directly or not) on a failed
+            case from the pending cases, and returns them
+        """
+        skipped = []
+        failed_nodes = set([failed])
+
+        # Handle nodes by increasing level, so that parents come first
+
+        for n in sorted(pending, key=lambda n: n.level or 0):
+            if self.graph.parent(n) in failed_nodes:
+                failed_nodes.add(n)
+                skipped.append(n)
+
+        for n in skipped:
+            pending.remove(n)
+
+        return skipped
+
+    def run(self):
+        """ runs all cases of the graph, starting a case only once the case
+            it depends on (if any) has finished successfully; cases
+            depending on a failed case are not run. Returns the number of
+            cases which failed or were not run.
+        """
+        root = self.graph.root_node()
+        pending = [n for n in self.graph.nodes() if n is not root]
+        self.path_wtime = self.__path_wtimes(pending)
+        finished = set()
+        running = []
+        done = queue.Queue()
+        n_procs_free = self.n_procs_max
+        n_errors = 0
 
+        while pending or running:
+
+            # Start ready cases as long as they fit in the remaining budget;
+            # a case wider than the whole budget is run alone
+
+            ready = []
+            for n in pending:
+                parent = self.graph.parent(n)
+                if parent is None or parent in finished:
+                    ready.append(n)
+            ready.sort(key=self.__priority)
+
+            for node in ready:
+                w = min(node.weight(), self.n_procs_max)
+                if w <= n_procs_free:
+                    pending.remove(node)
+                    running.append(node)
+                    n_procs_free -= w
+                    if self.start_case:
+                        self.start_case(node)
+                    t = threading.Thread(target=self.__worker,
+                                         args=(node, done))
+                    t.daemon = True
+                    t.start()
+
+            if not running:
+                # Should not happen with a valid graph
+                msg = "Problem in case scheduling: no case can be started."
+                raise RuntimeError(msg)
+
+            # Wait for a case to finish
+
+            node, error = done.get()
+            running.remove(node)
+            finished.add(node)
+            n_procs_free += min(node.weight(), self.n_procs_max)
+            if error:
+                n_errors += 1
+
+            if self.end_case:
+                self.end_case(node, error)
+
+            if error:
+                for n in self.__skip_dependents(node, pending):
+                    n_errors += 1
+                    if self.skip_case:
+                        self.skip_case(n, node)
+
+        return n_errors
+
+#-------------------------------------------------------------------------------
+# Unit tests
+#-------------------------------------------------------------------------------
+
+class SchedulerTestCase(unittest.TestCase):
+    """
+    Check the concurrent case scheduler.
+    """
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.n_procs = 0
+        self.n_procs_peak = 0
+        self.events = []
+
+    def __graph(self, cases):
+        """ builds a graph from (name, n_procs, estim_wtime, depends) tuples """
+        graph = dependency_graph()
+        for name, n_procs, wtime, depends in cases:
+            graph.add_node(node_case(name, n_procs, 0, wtime, None, depends))
+        return graph
+
+    def __run_case(self, node):
+        # a case wider than the whole budget is run alone
+        w = min(node.weight(), self.n_procs_max)
+        with self.lock:
+            self.n_procs += w
+            self.n_procs_peak = max(self.n_procs_peak, self.n_procs)
+        time.sleep(0.01)
+        with self.lock:
+            self.n_procs -= w
+        if node.name.endswith('fail'):
+            return 1
+        return 0
+
+    def __scheduler(self, graph, n_procs_max):
+        self.n_procs_max = n_procs_max
+        def start_case(node):
+            self.events.append(('start', node.name))
+        def end_case(node, error):
+            self.events.append(('end', node.name))
+        def skip_case(node, failed):
+            self.events.append(('skip', node.name, failed.name))
+        return case_scheduler(graph, n_procs_max, self.__run_case,
+                              end_case, start_case, skip_case)
+
+    def checkProcsBudget(self):
+        """Check that running cases fit in the process budget"""
+        graph = self.__graph([('S/A/1', 2, 1, None),
+                              ('S/B/1', 2, 1, None),
+                              ('S/C/1', 1, 1, None),
+                              ('S/D/1', 8, 1, None)])
+        n_errors = self.__scheduler(graph, 3).run()
+        assert n_errors == 0, 'Unexpected errors'
+        assert self.n_procs_peak <= 3, 'Process budget exceeded'
+        assert len([e for e in self.events if e[0] == 'end']) == 4, \
+            'Not all cases were run'
+
+    def checkDependencyOrder(self):
+        """Check that cases start after the case they depend on"""
+        graph = self.__graph([('S/A/1', 1, 1, None),
+                              ('S/B/1', 1, 5, 'S/A/1'),
+                              ('S/C/1', 1, 1, None)])
+        self.__scheduler(graph, 4).run()
+        assert self.events.index(('end', 'S/A/1')) \
+            < self.events.index(('start', 'S/B/1')), \
+            'Dependency started too early'
+        assert self.events[0] == ('start', 'S/A/1'), \
+            'Longest chain of cases not started first'
+
+    def checkFailedDependency(self):
+        """Check that dependents of a failed case are skipped"""
+        graph = self.__graph([('S/A/fail', 1, 1, None),
+                              ('S/B/1', 1, 1, 'S/A/fail'),
+                              ('S/C/1', 1, 1, 'S/B/1'),
+                              ('S/D/1', 1, 1, None)])
+        n_errors = self.__scheduler(graph, 2).run()
+        assert n_errors == 3, 'Wrong number of errors'
+        assert ('skip', 'S/B/1', 'S/A/fail') in self.events \
+            and ('skip', 'S/C/1', 'S/A/fail') in self.events, \
+            'Dependents of failed case not skipped'
+        assert ('start', 'S/B/1') not in self.events, \
+            'Dependent of failed case was run'
+        assert ('end', 'S/D/1') in self.events, \
+            'Independent case was not run'
+
+    def checkNoStartableCase(self):
+        """Check that an invalid graph raises an error"""
+        graph = self.__graph([('S/A/1', 1, 1, None)])
+        node = graph.nodes()[1]
+        graph.graph_dict[node] = [node_case('S/X/1', 1, 0, 0, None, None)]
+        try:
+            self.__scheduler(graph, 2).run()
+            assert False, 'Invalid graph not detected'
+        except RuntimeError:
+            pass
+
+#-------------------------------------------------------------------------------
+
+def suite():
+    testSuite = unittest.makeSuite(SchedulerTestCase, "check")
+    return testSuite
+
+def runTest():
+    print("SchedulerTestCase")
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
@@ -27,8 +27,10 @@
 #-------------------------------------------------------------------------------
 
 import os, sys
+import shutil
 import string
 import subprocess
+import tempfile
 import time
 import logging
 
@@ -51,9 +53,9 @@ log.setLevel(logging.NOTSET)
 
 #-------------------------------------------------------------------------------
 
-def run_studymanager_command(_c, _log, pythondir = None):
+def run_studymanager_command(_c, _log, pythondir = None, cwd = None):
     """
-    Run command with arguments.
+    Run command with arguments (in directory cwd if specified).
     Redirection of the stdout or stderr of the command.
     """
     assert type(_c) == str or type(_c) == unicode
@@ -69,7 +71,7 @@ def run_studymanager_command(_c, _log, pythondir = None):
         return "\n\nExecution failed --> %s: %s" \
                 "\n - command: %s"                \
                 "\n - directory: %s\n\n" %        \
-                (_t, str(retcode), _c, os.getcwd())
+                (_t, str(retcode), _c, cwd or os.getcwd())
 
     _l = ""
 
@@ -84,7 +86,7 @@ def run_studymanager_command(_c, _log, pythondir = None):
 
     try:
         t1 = time.time()
-        retcode = run_command(cmd, stdout=_log, stderr=_log, env=env)
+        retcode = run_command(cmd, stdout=_log, stderr=_log, env=env, cwd=cwd)
         t2 = time.time()
 
         if retcode < 0:
@@ -112,3 +114,83 @@ def run_studymanager_command(_c, _log, pythondir = None):
     return retcode, "%.2f" % (t2 - t1)
 
 #-------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------
+
+class buffered_reporter(object):
+    """
+    Record the report messages and log output of a task run in a worker
+    thread, so that they may be replayed in a deterministic order.
+    """
+    def __init__(self):
+        self.messages = []
+        self.log = tempfile.TemporaryFile(mode='w+')
+
+
+    def reporting(self, msg, stdout=True, report=True, status=False):
+        """
+        Record a message (same arguments as Studies.reporting).
+        """
+        self.messages.append((msg, stdout, report, status))
+
+
+    def replay(self, reporter, log):
+        """
+        Append buffered log output to log, and send recorded
+        messages to reporter (only once).
+        """
+        if self.log.closed:
+            return
+
+        try:
+            self.log.seek(0)
+            shutil.copyfileobj(self.log, log)
+        finally:
+            self.log.close()
+        log.flush()
+
+        for msg, stdout, report, status in self.messages:
+            reporter.reporting(msg, stdout=stdout, report=report, status=status)
+
+#-------------------------------------------------------------------------------
+
+def run_ordered_tasks(tasks, n_jobs, reporter, log):
+    """
+    Run tasks, each being a function taking a reporter (an object with a
+    reporting method) and a log file as arguments.
+    If n_jobs > 1, tasks are run in a pool of n_jobs threads, with their
+    messages and log output buffered and replayed in the order of the
+    tasks list; otherwise, they are run one after the other.
+    If a task fails, the output of all tasks is still replayed, and the
+    first error is raised once all tasks have finished.
+    """
+    if n_jobs == None or n_jobs < 2 or len(tasks) < 2:
+        for task in tasks:
+            task(reporter, log)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    buffers = [buffered_reporter() for task in tasks]
+
+    error = None
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(task, b, b.log) \
+                       for task, b in zip(tasks, buffers)]
+            for f, b in zip(futures, buffers):
+                try:
+                    f.result()
+                except BaseException as e:
+                    if error == None:
+                        error = e
+                b.replay(reporter, log)
+    finally:
+        for b in buffers:
+            b.replay(reporter, log)
+
+    if error != None:
+        raise error
+
+#-------------------------------------------------------------------------------
@@ -29,6 +29,7 @@
 import os, sys
 import shutil, re
 import subprocess
+import tempfile
 import threading
 import string
 import time
@@ -51,6 +52,8 @@ from code_saturne.studymanager.cs_studymanager_pathes_model import PathesModel
 from code_saturne.studymanager.cs_studymanager_parser import Parser
 from code_saturne.studymanager.cs_studymanager_texmaker import Report1, Report2
 from code_saturne.studymanager.cs_studymanager_graph import node_case, dependency_graph
+from code_saturne.studymanager.cs_studymanager_graph import case_scheduler
+from code_saturne.studymanager.cs_studymanager_graph import wtime_seconds
 
 try:
     from code_saturne.studymanager.cs_studymanager_drawing import Plotter
@@ -58,7 +61,15 @@ except Exception:
     print("Warning: import studymanager Plotter failed. Plotting disabled.\n")
     pass
 
+try:
+    from code_saturne import cs_io_reader
+except Exception:
+    cs_io_reader = None
+
+from code_saturne.studymanager.cs_studymanager_db import results_db
+from code_saturne.studymanager.cs_studymanager_db import checkpoint_mesh_sizes
 from code_saturne.studymanager.cs_studymanager_run import run_studymanager_command
+from code_saturne.studymanager.cs_studymanager_run import run_ordered_tasks
 from code_saturne.studymanager.cs_studymanager_xml_init import smgr_xml_init
 
 #-------------------------------------------------------------------------------
@@ -189,6 +200,7 @@ class Case(object):
         self.threshold   = "default"
         self.diff_value  = [] # list of differences (in case of comparison)
         self.m_size_eq   = True # mesh sizes equal (in case of comparison)
+        self.compare_errors = [] # comparisons which could not be done
         self.subdomains  = None
         self.run_dir     = ""
 
@@ -361,7 +373,8 @@ class Case(object):
                              executable=get_shell_type(),
                              stdout=subprocess.PIPE,
                              stderr=subprocess.PIPE,
-                             universal_newlines=True)
+                             universal_newlines=True,
+                             cwd=os.path.join(self.__dest, self.label))
         i = p.communicate()[0]
         run_id = " ".join(i.split())
 
@@ -369,13 +382,17 @@ class Case(object):
 
     #---------------------------------------------------------------------------
 
-    def run(self):
+    def run(self, log=None):
         """
         Check if a run with same result subdirectory name exists
         and launch run if not.
+        The working directory is not changed, so that several cases
+        may be run concurrently (with a separate log for each).
         """
-        home = os.getcwd()
-        os.chdir(os.path.join(self.__dest, self.label))
+        if log == None:
+            log = self.__log
+
+        case_dir = os.path.join(self.__dest, self.label)
 
         if self.run_id:
             run_id = self.run_id
@@ -388,7 +405,6 @@ class Case(object):
                 else:
                     self.is_run = "OK"
                     error = 0
-                os.chdir(home)
 
                 return error
 
@@ -407,22 +423,26 @@ class Case(object):
         if n_procs:
             run_cmd += " -n " + n_procs
 
-        error, self.is_time = run_studymanager_command(run_cmd, self.__log)
+        error, self.is_time = run_studymanager_command(run_cmd, log,
+                                                       cwd=case_dir)
 
         if not error:
             self.is_run = "OK"
         else:
             self.is_run = "KO"
 
-        os.chdir(home)
-
         return error
 
     #---------------------------------------------------------------------------
 
-    def runCompare(self, studies, r, d, threshold, args, reference=None):
-        home = os.getcwd()
-
+    def runCompare(self, studies, r, d, threshold, args, reference=None,
+                   db=None):
+        """
+        Compare checkpoint files of the repository and destination.
+        studies only needs to provide a reporting method.
+        If a results database is given, comparisons are recorded, and
+        not run again if both files are unchanged since a previous one.
+        """
         node = None
 
         if reference:
@@ -444,15 +464,11 @@ class Case(object):
             studies.reporting(msg)
         dest = os.path.join(result, dest, 'checkpoint', 'main.csc')
 
-        cmd = self.__diff + ' ' + repo + ' ' + dest
-
         self.threshold = "default"
         if threshold != None:
-            cmd += ' --threshold ' + threshold
             self.threshold = threshold
 
         if args != None:
-            cmd += (" " + args)
             l = args.split()
             try:
                 i = l.index('--threshold')
@@ -460,6 +476,54 @@ class Case(object):
             except:
                 pass
 
+        if db:
+            prev = db.find_comparison(repo, dest, self.threshold, args)
+            if prev != None:
+                diffs, m_size_eq = prev
+                db.add_comparison(self.__study, self.label, repo, dest,
+                                  self.threshold, args, diffs, m_size_eq,
+                                  reused=True)
+                studies.reporting('    - compare %s: files unchanged, '
+                                  'previous results reused' % self.label)
+                tab = [[f.replace("_", "\_"), "%g" % v_max, "%g" % v_mean, t]
+                       for f, v_max, v_mean, t in diffs]
+                return tab, m_size_eq
+
+        n_errors = len(self.compare_errors)
+
+        tab, m_size_eq = self.__diff_checkpoints(repo, dest, threshold, args)
+
+        # failed comparisons or values which can not be parsed are not
+        # recorded, so that this comparison is not reused later
+        if db and len(self.compare_errors) == n_errors:
+            try:
+                diffs = [(name.replace("\_", "_"), float(v_max),
+                          float(v_mean), t) for name, v_max, v_mean, t in tab]
+                db.add_comparison(self.__study, self.label, repo, dest,
+                                  self.threshold, args, diffs, m_size_eq)
+            except ValueError:
+                pass
+
+        return tab, m_size_eq
+
+    #---------------------------------------------------------------------------
+
+    def __diff_checkpoints(self, repo, dest, threshold, args):
+        """
+        Compare two checkpoint files, using the native reader if
+        available, or the cs_io_dump utility otherwise.
+        """
+        if cs_io_reader:
+            return self.__compare_checkpoints(repo, dest, args)
+
+        cmd = self.__diff + ' ' + repo + ' ' + dest
+
+        if threshold != None:
+            cmd += ' --threshold ' + threshold
+
+        if args != None:
+            cmd += (" " + args)
+
         l = subprocess.Popen(cmd,
                              shell=True,
                              executable=get_shell_type(),
@@ -498,7 +562,59 @@ class Case(object):
                                     vals[2][1],
                                     self.threshold])
 
-        os.chdir(home)
+        return tab, m_size_eq
+
+    #---------------------------------------------------------------------------
+
+    def __compare_checkpoints(self, repo, dest, args):
+        """
+        Compare checkpoint files directly using the native kernel I/O
+        file reader, with the same filtering rules as cs_io_dump --diff.
+        """
+        section = None
+        location = None
+        f_threshold = 1.e-30
+
+        if self.threshold != "default":
+            f_threshold = float(self.threshold)
+
+        if args != None:
+            l = args.split()
+            for i in range(len(l) - 1):
+                if l[i] == '--section':
+                    section = l[i+1]
+                elif l[i] == '--location':
+                    location = int(l[i+1])
+
+        # list of field differences
+        tab = []
+        # meshes have same sizes
+        m_size_eq = True
+
+        # missing, truncated, or unrecognized files are reported as
+        # a failed comparison for this case only
+        try:
+            diffs = cs_io_reader.compare_files(repo, dest,
+                                               threshold=f_threshold,
+                                               section=section,
+                                               location=location)
+        except (IOError, ValueError) as e:
+            self.compare_errors.append(str(e))
+            return tab, m_size_eq
+
+        # studymanager compare log only for field of real values
+        for d in diffs:
+            if d['type'] not in ['r4', 'r8']:
+                continue
+            if d.get('size_mismatch'):
+                m_size_eq = False
+                break
+            elif d.get('type_mismatch'):
+                continue
+            tab.append([d['name'].replace("_", "\_"),
+                        "%g" % d['max'],
+                        "%g" % d['mean'],
+                        self.threshold])
 
         return tab, m_size_eq
 
@@ -1137,11 +1253,21 @@ class Studies(object):
         self.__ref         = options.reference
         self.__postpro     = options.post
         self.__default_fmt = options.default_fmt
+        self.__n_procs_max = options.n_procs_max
+        self.__n_jobs      = options.n_jobs
         # do not use tex in matplotlib (built-in mathtext is used instead)
         self.__dis_tex     = options.disable_tex
         # tex reports compilation with pdflatex
         self.__pdflatex    = not options.disable_pdflatex
 
+        # persistent results database
+
+        self.__db = None
+        if options.db_path and not self.__xmlupdate:
+            db_path = os.path.abspath(options.db_path)
+            self.__db = results_db(db_path)
+            self.__db.start_invocation(pkg.version, self.__dest)
+
         # in case of restart
 
         iok = 0
@@ -1382,12 +1508,125 @@ class Studies(object):
 
     #---------------------------------------------------------------------------
 
+    def __set_iteration_limit(self, s, case):
+        """
+        Create a control_file limiting the number of iterations in
+        the DATA directory of a case (if not already present).
+        """
+        if case.subdomains:
+            case_dir = os.path.join(self.__dest, s.label, case.label,
+                                    case.subdomains[0], "DATA")
+        else:
+            case_dir = os.path.join(self.__dest, s.label, case.label, "DATA")
+
+        control_path = os.path.join(case_dir, 'control_file')
+        if not os.path.exists(control_path):
+            control_file = open(control_path, 'w')
+            control_file.write("time_step_limit " + str(self.__n_iter) + "\n")
+            # Flush to ensure that control_file content is seen
+            # when control_file is copied to the run directory on all systems
+            control_file.flush()
+            control_file.close()
+
+    #---------------------------------------------------------------------------
+
+    def __report_run(self, study_label, case, error):
+        """
+        Report the status of a run, and update the file of parameters
+        with its run_id if it succeeded.
+        """
+        if self.__db and case.is_time:
+            self.__record_run(study_label, case, error)
+
+        if case.is_time:
+            is_time = "%s s" % case.is_time
+        else:
+            is_time = "existed already"
+
+        if not error:
+            if not case.run_id:
+                self.reporting("    - run %s --> Warning suffix"
+                               " is not read" % case.label)
+
+            self.reporting('    - run %s --> OK (%s) in %s' \
+                           % (case.label, \
+                              is_time, \
+                              case.run_id))
+            self.__parser.setAttribute(case.node,
+                                       "compute",
+                                       "off")
+
+            # update dest="" attribute
+            n1 = self.__parser.getChildren(case.node, "compare")
+            n2 = self.__parser.getChildren(case.node, "script")
+            n3 = self.__parser.getChildren(case.node, "data")
+            n4 = self.__parser.getChildren(case.node, "probe")
+            n5 = self.__parser.getChildren(case.node, "resu")
+            n6 = self.__parser.getChildren(case.node, "input")
+            for n in n1 + n2 + n3 + n4 + n5 + n6:
+                if self.__parser.getAttribute(n, "dest") == "":
+                    self.__parser.setAttribute(n, "dest", case.run_id)
+        else:
+            if not case.run_id:
+                self.reporting('    - run %s --> FAILED (%s)' \
+                               % (case.label, is_time))
+            else:
+                self.reporting('    - run %s --> FAILED (%s) in %s' \
+                               % (case.label, \
+                                  is_time, \
+                                  case.run_id))
+
+        self.__log.flush()
+
+    #---------------------------------------------------------------------------
+
+    def __record_run(self, study_label, case, error):
+        """
+        Store the run time and mesh sizes of a case in the results database.
+        """
+        status = "OK"
+        if error:
+            status = "KO"
+        self.__db.add_run(study_label, case.label, case.run_id,
+                          case.n_procs, float(case.is_time), status)
+
+        if error or not cs_io_reader:
+            return
+
+        if case.subdomains:
+            domains = case.subdomains
+        else:
+            domains = [""]
+
+        sizes = []
+        for d in domains:
+            f = os.path.join(case.run_dir, d, 'checkpoint', 'main.csc')
+            if not os.path.isfile(f):
+                continue
+            try:
+                for location, n in checkpoint_mesh_sizes(f):
+                    if d:
+                        location = d + ':' + location
+                    sizes.append((location, n))
+            except Exception:
+                pass
+
+        if sizes:
+            self.__db.add_mesh_sizes(study_label, case.label, case.run_id,
+                                     sizes)
+
+    #---------------------------------------------------------------------------
+
     def run(self):
         """
         Update and run all cases.
         Warning, if the markup of the case is repeated in the xml file of parameters,
         the run of the case is also repeated.
         """
+        if self.__n_procs_max:
+            self.run_concurrent()
+            return
+
         for l, s in self.studies:
             self.reporting("  o Prepro scripts and runs for study: " + l)
             for case in s.cases:
@@ -1396,68 +1635,151 @@ class Studies(object):
                     if case.compute == 'on' and case.is_compiled != "KO":
 
                         if self.__n_iter is not None:
-                            if case.subdomains:
-                                case_dir = os.path.join(self.__dest, s.label, case.label,
-                                                        case.subdomains[0], "DATA")
-                            else:
-                                case_dir = os.path.join(self.__dest, s.label, case.label, "DATA")
-                            os.chdir(case_dir)
-                            # Create a control_file in each case DATA
-                            if not os.path.exists('control_file'):
-                                control_file = open('control_file','w')
-                                control_file.write("time_step_limit " + str(self.__n_iter) + "\n")
-                                # Flush to ensure that control_file content is seen
-                                # when control_file is copied to the run directory on all systems
-                                control_file.flush()
-                                control_file.close
+                            self.__set_iteration_limit(s, case)
 
                         self.reporting('    - running %s ...' % case.label,
                                        stdout=True, report=False, status=True)
                         error = case.run()
-                        if case.is_time:
-                            is_time = "%s s" % case.is_time
-                        else:
-                            is_time = "existed already"
-
-                        if not error:
-                            if not case.run_id:
-                                self.reporting("    - run %s --> Warning suffix"
-                                               " is not read" % case.label)
-
-                            self.reporting('    - run %s --> OK (%s) in %s' \
-                                           % (case.label, \
-                                              is_time, \
-                                              case.run_id))
-                            self.__parser.setAttribute(case.node,
-                                                       "compute",
-                                                       "off")
-
-                            # update dest="" attribute
-                            n1 = self.__parser.getChildren(case.node, "compare")
-                            n2 = self.__parser.getChildren(case.node, "script")
-                            n3 = self.__parser.getChildren(case.node, "data")
-                            n4 = self.__parser.getChildren(case.node, "probe")
-                            n5 = self.__parser.getChildren(case.node, "resu")
-                            n6 = self.__parser.getChildren(case.node, "input")
-                            for n in n1 + n2 + n3 + n4 + n5 + n6:
-                                if self.__parser.getAttribute(n, "dest") == "":
-                                    self.__parser.setAttribute(n, "dest", case.run_id)
-                        else:
-                            if not case.run_id:
-                                self.reporting('    - run %s --> FAILED (%s)' \
-                                               % (case.label, is_time))
-                            else:
-                                self.reporting('    - run %s --> FAILED (%s) in %s' \
-                                               % (case.label, \
-                                                  is_time, \
-                                                  case.run_id))
+                        self.__report_run(l, case, error)
+
+        self.reporting('')
 
-                        self.__log.flush()
+    #---------------------------------------------------------------------------
+
+    def run_concurrent(self):
+        """
+        Run all cases concurrently, within the total number of processes
+        given by the --n-procs-max option.
+        Cases are started as soon as the case they depend on (if any)
+        has finished successfully and enough processes are available,
+        cases on the longest chain of dependent cases first; prepro
+        scripts of a case are run just before it is started. Cases
+        depending on a failed case are not run, and reported as failed.
+        Wall times are predicted from previous runs recorded in the
+        results database if available, or from the estimated wall time
+        given in the file of parameters.
+        Each case's output is buffered, and appended to the log file
+        when it ends.
+        """
+        run_cases = []
+
+        for l, s in self.studies:
+            prepro_cases = []
+            for case in s.cases:
+                if self.__running and case.compute == 'on' \
+                   and case.is_compiled != "KO":
+                    run_cases.append((l, s, case))
+                else:
+                    prepro_cases.append(case)
+            if prepro_cases:
+                self.reporting("  o Prepro scripts for study: " + l)
+                for case in prepro_cases:
+                    self.prepro(l, s, case)
+
+        if not run_cases:
+            self.reporting('')
+            return
+
+        # Graph nodes are used as keys, as names (used to resolve
+        # dependencies) are not unique if a case is repeated.
+
+        names = set()
+        for l, s, case in run_cases:
+            names.add(l + '/' + case.label + '/' + case.run_id)
+
+        # Predicted wall times; cases with no measure or estimate are
+        # assumed to last as long as the average of the other cases
+
+        cases = {}
+        nodes = []
+        n_measured = 0
+
+        for l, s, case in run_cases:
+            wtime, measured = self.__predict_wtime(l, case)
+            if measured:
+                n_measured += 1
+
+            # Dependencies on cases which are not run here are
+            # already satisfied
+
+            depends = case.depends
+            if depends not in names:
+                depends = None
+
+            node = node_case(l + '/' + case.label + '/' + case.run_id,
+                             case.n_procs, case.n_iter, wtime,
+                             case.tags, depends)
+            cases[node] = (l, s, case)
+            nodes.append(node)
+
+        known = [n.estim_wtime for n in nodes if n.estim_wtime > 0]
+        graph = dependency_graph()
+        for node in nodes:
+            if known and node.estim_wtime <= 0:
+                node.estim_wtime = sum(known) / len(known)
+            graph.add_node(node)
+
+        self.reporting("  o Runs on %d processes for all studies" \
+                       % self.__n_procs_max)
+        if n_measured:
+            self.reporting("    (wall times of %d of %d cases predicted "
+                           "from previous runs)" % (n_measured, len(nodes)))
+
+        logs = {}
+
+        def start_case(node):
+            l, s, case = cases[node]
+            self.prepro(l, s, case)
+            if self.__n_iter is not None:
+                self.__set_iteration_limit(s, case)
+            logs[node] = tempfile.TemporaryFile(mode='w+')
+
+        def run_case(node):
+            return cases[node][2].run(log=logs[node])
+
+        def end_case(node, error):
+            f = logs.pop(node)
+            f.seek(0)
+            shutil.copyfileobj(f, self.__log)
+            f.close()
+            self.__report_run(cases[node][0], cases[node][2], error)
+
+        def skip_case(node, failed):
+            case = cases[node][2]
+            case.is_run = "KO"
+            self.reporting('    - run %s --> FAILED (not run, as %s failed)' \
+                           % (case.label, failed.name))
+
+        scheduler = case_scheduler(graph, self.__n_procs_max,
+                                   run_case, end_case,
+                                   start_case, skip_case)
+        scheduler.run()
 
         self.reporting('')
 
     #---------------------------------------------------------------------------
 
+    def __predict_wtime(self, study_label, case):
+        """
+        Return the predicted wall time (in seconds) of a case, and whether
+        it is based on previous runs: the median of the last successful
+        runs recorded in the results database (with the same number of
+        processes if possible), or the estimated wall time otherwise.
+        """
+        if self.__db:
+            times = self.__db.wall_times(study_label, case.label, 5,
+                                         n_procs=case.n_procs)
+            if not times:
+                times = self.__db.wall_times(study_label, case.label, 5)
+            if times:
+                times.sort()
+                n = len(times)
+                return 0.5*(times[(n-1)//2] + times[n//2]), True
+
+        return wtime_seconds(case.estim_wtime), False
+
+    #---------------------------------------------------------------------------
+
     def check_compare(self, destination=True):
         """
         Check coherency between xml file of parameters and repository.
@@ -1509,15 +1831,21 @@ class Studies(object):
 
     #---------------------------------------------------------------------------
 
-    def compare_case_and_report(self, case, repo, dest, threshold, args, reference=None):
+    def compare_case_and_report(self, case, repo, dest, threshold, args,
+                                reference=None, reporter=None):
         """
         Compare the results for one computation and report
         """
+        if reporter == None:
+            reporter = self
+
         case.is_compare = "done"
-        diff_value, m_size_eq = case.runCompare(self,
+        n_errors = len(case.compare_errors)
+        diff_value, m_size_eq = case.runCompare(reporter,
                                                 repo, dest,
                                                 threshold, args,
-                                                reference=reference)
+                                                reference=reference,
+                                                db=self.__db)
 
         case.diff_value += diff_value
         case.m_size_eq = case.m_size_eq and m_size_eq
@@ -1527,12 +1855,14 @@ class Studies(object):
         else:
             s_args = 'default mode'
 
-        if not m_size_eq:
-            self.reporting('    - compare %s (%s) --> DIFFERENT MESH SIZES FOUND' % (case.label, s_args))
+        if len(case.compare_errors) > n_errors:
+            reporter.reporting('    - compare %s (%s) --> COMPARISON FAILED: %s' % (case.label, s_args, case.compare_errors[-1]))
+        elif not m_size_eq:
+            reporter.reporting('    - compare %s (%s) --> DIFFERENT MESH SIZES FOUND' % (case.label, s_args))
         elif diff_value:
-            self.reporting('    - compare %s (%s) --> DIFFERENCES FOUND' % (case.label, s_args))
+            reporter.reporting('    - compare %s (%s) --> DIFFERENCES FOUND' % (case.label, s_args))
         else:
-            self.reporting('    - compare %s (%s) --> NO DIFFERENCES FOUND' % (case.label, s_args))
+            reporter.reporting('    - compare %s (%s) --> NO DIFFERENCES FOUND' % (case.label, s_args))
 
 
     #---------------------------------------------------------------------------
@@ -1550,34 +1880,52 @@ class Studies(object):
                 ref = None
                 if self.__ref:
                     ref = os.path.join(self.__ref, s.label)
+
+                # one task per case, so comparisons of a given case
+                # remain in order
+
+                tasks = []
                 for case in s.cases:
                     if case.compare == 'on' and case.is_run != "KO":
-                        is_compare, nodes, repo, dest, t, args = self.__parser.getCompare(case.node)
-                        if is_compare:
-                            for i in range(len(nodes)):
-                                if is_compare[i]:
-                                    self.compare_case_and_report(case,
-                                                                 repo[i],
-                                                                 dest[i],
-                                                                 t[i],
-                                                                 args[i],
-                                                                 reference=ref)
-                        if not is_compare or case.is_compare != "done":
-                            repo = ""
-                            dest = ""
-                            t    = None
-                            args = None
-                            self.compare_case_and_report(case,
-                                                         repo,
-                                                         dest,
-                                                         t,
-                                                         args,
-                                                         reference=ref)
+                        compare = self.__parser.getCompare(case.node)
+                        tasks.append(self.__compare_task(case, compare, ref))
+
+                run_ordered_tasks(tasks, self.__n_jobs, self, self.__log)
 
         self.reporting('')
 
     #---------------------------------------------------------------------------
 
+    def __compare_task(self, case, compare, ref):
+        """
+        Return a task comparing the results of a given case.
+        """
+        is_compare, nodes, repo, dest, t, args = compare
+
+        def task(reporter, log):
+            if is_compare:
+                for i in range(len(nodes)):
+                    if is_compare[i]:
+                        self.compare_case_and_report(case,
+                                                     repo[i],
+                                                     dest[i],
+                                                     t[i],
+                                                     args[i],
+                                                     reference=ref,
+                                                     reporter=reporter)
+            if not is_compare or case.is_compare != "done":
+                self.compare_case_and_report(case,
+                                             "",
+                                             "",
+                                             None,
+                                             None,
+                                             reference=ref,
+                                             reporter=reporter)
+
+        return task
+
+    #---------------------------------------------------------------------------
+
     def check_script(self, destination=True):
         """
         Check coherency between xml file of parameters and repository.
@@ -1633,13 +1981,17 @@ class Studies(object):
         """
         for l, s in self.studies:
             self.reporting("  o Run scripts of study: " + l)
+
+            # one task per case, so scripts of a given case remain in order
+
+            tasks = []
             for case in s.cases:
                 script, label, nodes, args, repo, dest = self.__parser.getScript(case.node)
+                cmds = []
                 for i in range(len(label)):
                     if script[i] and case.is_run != "KO":
                         cmd = os.path.join(self.__dest, l, "POST", label[i])
                         if os.path.isfile(cmd):
-                            sc_name = os.path.basename(cmd)
                             # ensure script is executable
                             set_executable(cmd)
 
@@ -1650,25 +2002,47 @@ class Studies(object):
                             if dest[i]:
                                 d = os.path.join(self.__dest, l, case.label, "RESU", dest[i])
                                 cmd += " -d " + d
-                            retcode, t = run_studymanager_command(cmd, self.__log)
-                            stat = "FAILED" if retcode != 0 else "OK"
-
-                            self.reporting('    - script %s --> %s (%s s)' % (stat, sc_name, t),
-                                           stdout=True, report=False)
-
-                            self.reporting('    - script %s --> %s (%s s)' % (stat, cmd, t),
-                                           stdout=True, report=False)
+                            cmds.append((os.path.basename(label[i]), cmd))
                         else:
-                            self.reporting('    - script %s not found' % cmd)
+                            cmds.append((None, cmd))
+                if cmds:
+                    tasks.append(self.__script_task(cmds))
+
+            run_ordered_tasks(tasks, self.__n_jobs, self, self.__log)
 
         self.reporting('')
 
     #---------------------------------------------------------------------------
 
+    def __script_task(self, cmds):
+        """
+        Return a task running a list of script commands in order.
+        """
+        def task(reporter, log):
+            for sc_name, cmd in cmds:
+                if not sc_name:
+                    reporter.reporting('    - script %s not found' % cmd)
+                    continue
+
+                retcode, t = run_studymanager_command(cmd, log)
+                stat = "FAILED" if retcode != 0 else "OK"
+
+                reporter.reporting('    - script %s --> %s (%s s)' % (stat, sc_name, t),
+                                   stdout=True, report=False)
+
+                reporter.reporting('    - script %s --> %s (%s s)' % (stat, cmd, t),
+                                   stdout=True, report=False)
+
+        return task
+
+    #---------------------------------------------------------------------------
+
     def postpro(self):
         """
         Launch external additional scripts with arguments.
         """
+        tasks = []
+
         for l, s in self.studies:
             # fill results directories and ids for the cases of the current study
             # that were not run by the current studymanager command
@@ -1688,36 +2062,58 @@ class Studies(object):
             if not label:
                 continue
 
-            self.reporting('  o Postprocessing cases of study: ' + l)
+            # one task per study, as postprocessing scripts of a study
+            # may depend on each other
+
+            cmds = []
             for i in range(len(label)):
                 if script[i]:
                     cmd = os.path.join(self.__dest, l, "POST", label[i])
                     if os.path.isfile(cmd):
-                        sc_name = os.path.basename(cmd)
                         # ensure script is executable
                         set_executable(cmd)
 
                         list_cases, list_dir = s.getRunDirectories()
                         cmd += ' ' + args[i] + ' -c "' + list_cases + '" -d "' \
                                + list_dir + '" -s ' + l
+                        cmds.append((os.path.basename(label[i]), cmd))
+                    else:
+                        cmds.append((None, cmd))
 
-                        self.reporting('    - running postpro %s' % sc_name,
-                                       stdout=True, report=False, status=True)
+            tasks.append(self.__postpro_task(l, cmds))
 
-                        retcode, t = run_studymanager_command(cmd, self.__log)
-                        stat = "FAILED" if retcode != 0 else "OK"
+        run_ordered_tasks(tasks, self.__n_jobs, self, self.__log)
 
-                        self.reporting('    - postpro %s --> %s (%s s)' \
-                                       % (stat, sc_name, t),
-                                       stdout=True, report=False)
+        self.reporting('')
 
-                        self.reporting('    - postpro %s --> %s (%s s)' \
-                                       % (stat, cmd, t),
-                                       stdout=False, report=True)
-                    else:
-                        self.reporting('    - postpro %s not found' % cmd)
+    #---------------------------------------------------------------------------
 
-        self.reporting('')
+    def __postpro_task(self, l, cmds):
+        """
+        Return a task running the postprocessing scripts of a study in order.
+        """
+        def task(reporter, log):
+            reporter.reporting('  o Postprocessing cases of study: ' + l)
+            for sc_name, cmd in cmds:
+                if not sc_name:
+                    reporter.reporting('    - postpro %s not found' % cmd)
+                    continue
+
+                reporter.reporting('    - running postpro %s' % sc_name,
+                                   stdout=True, report=False, status=True)
+
+                retcode, t = run_studymanager_command(cmd, log)
+                stat = "FAILED" if retcode != 0 else "OK"
+
+                reporter.reporting('    - postpro %s --> %s (%s s)' \
+                                   % (stat, sc_name, t),
+                                   stdout=True, report=False)
+
+                reporter.reporting('    - postpro %s --> %s (%s s)' \
+                                   % (stat, cmd, t),
+                                   stdout=False, report=True)
+
+        return task
 
     #---------------------------------------------------------------------------
 
@@ -1818,7 +2214,8 @@ class Studies(object):
                 self.reporting('  o Plot study: ' + l)
                 self.__plotter.plot_study(l, s,
                                           self.__dis_tex,
-                                          self.__default_fmt)
+                                          self.__default_fmt,
+                                          self.__n_jobs)
 
         self.reporting('')
 
@@ -1879,7 +2276,8 @@ class Studies(object):
 
         for l, s in self.studies:
             for case in s.cases:
-                if case.diff_value or not case.m_size_eq:
+                if case.diff_value or not case.m_size_eq \
+                   or case.compare_errors:
                     is_nodiff = "KO"
                 else:
                     is_nodiff = "OK"
@@ -1922,6 +2320,9 @@ class Studies(object):
                         doc2.appendLine("\\subsection{Comparison for case "
                                         "%s (run_id: %s)}"
                                         % (case.label, run_id))
+                        for e in case.compare_errors:
+                            doc2.appendLine("Comparison failed: %s\n"
+                                            % e.replace("_", "\\_"))
                         if not case.m_size_eq:
                             doc2.appendLine("Repository and destination "
                                             "have apparently not been run "
@@ -1466,7 +1466,8 @@ class MainView(object):
         """
         state = 0
         if self.case['run_type'] == 'standard':
-            mci = meg_to_c_interpreter(self.case)
+            mci = meg_to_c_interpreter(self.case,
+                                       cache_dir=self.case['case_path'])
 
             mci_state = mci.save_all_functions()
 
@@ -1878,15 +1879,12 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
                                              python_record[1],
                                              python_record[2]])
 
-            last_record = self.case['undo'].pop()
             self.case.record_func_prev = None
-            self.case.xml_prev = ""
-            self.case['redo'].append([last_record[0],
-                                      self.case.toString(),
-                                      last_record[2],
-                                      last_record[3]])
+            last_record = self.case.journal.undoStep()
+            if last_record == None:
+                self.slotUndoRedoView()
+                return
 
-            self.case.parseString(last_record[1])
             self.Browser.activeSelectedPage(last_record[2])
             self.Browser.configureTree(self.case)
             self.case['current_index'] = last_record[2]
@@ -1912,15 +1910,9 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
                                              python_record[1],
                                              python_record[2]])
 
-            last_record = self.case['redo'].pop()
             self.case.record_func_prev = None
-            self.case.xml_prev = ""
-            self.case['undo'].append([last_record[0],
-                                      self.case.toString(),
-                                      last_record[2],
-                                      last_record[3]])
+            last_record = self.case.journal.redoStep()
 
-            self.case.parseString(last_record[1])
             self.Browser.activeSelectedPage(last_record[2])
             self.Browser.configureTree(self.case)
             self.case['current_index'] = last_record[2]
@@ -60,6 +60,8 @@ class QtCase(Case, QObject):
         """
         Case.__init__(self, package, file_name, studymanager)
         QObject.__init__(self)
+        self.journal = UndoJournal(self)
+        self.xmlEnableIndex()
 
 
     def undoStop(self):
@@ -84,7 +86,7 @@ class QtCase(Case, QObject):
                 self['dump_python'].append([f.__module__, f.func_name, c])
             else:
                 self['dump_python'].append([f.__module__, f.__name__, c])
-            if self.xml_prev != self.toString() or self.xml_prev == "":
+            if self.journal.hasChanges():
                 # control if function have same arguments
                 # last argument is value
                 same = True
@@ -98,8 +100,7 @@ class QtCase(Case, QObject):
                 if same:
                     pass
                 else:
-                    self['undo'].append([self['current_page'], self.toString(), self['current_index'], self['current_tab']])
-                    self.xml_prev = self.toString()
+                    self.journal.openStep(self['current_page'], self['current_index'], self['current_tab'])
                     self.record_func_prev = None
                     self.record_argument_prev = c
                     self.undo_signal.emit()
@@ -111,7 +112,7 @@ class QtCase(Case, QObject):
                 self['dump_python'].append([f.__module__, f.func_name, c])
             else:
                 self['dump_python'].append([f.__module__, f.__name__, c])
-            if self.xml_prev != self.toString():
+            if self.journal.hasChanges():
                 # control if function have same arguments
                 # last argument is value
                 same = True
@@ -127,8 +128,7 @@ class QtCase(Case, QObject):
                 else:
                     self.record_func_prev = f
                     self.record_argument_prev = c
-                    self['undo'].append([self['current_page'], self.toString(), self['current_index'], self['current_tab']])
-                    self.xml_prev = self.toString()
+                    self.journal.openStep(self['current_page'], self['current_index'], self['current_tab'])
                     self.undo_signal.emit()
 
 
@@ -321,12 +321,16 @@ class QMegEditorView(QDialog, Ui_QMegDialog):
         # The provided meg_to_c interpreter should have only one block.
         # Could, and should, be modified in the future to identify
         # the good key if needed...
+        # Expressions are checked in-process; compiling the generated
+        # code is only done when CS_MEG_COMPILE_CHECK is set.
         new_exp = str(self.textEditExpression.toPlainText()) + '\n'
+        deep = os.getenv('CS_MEG_COMPILE_CHECK') not in (None, '', '0')
         check = 0
         for func_type in self.meg_to_c.funcs.keys():
             for k in self.meg_to_c.funcs[func_type].keys():
                 self.meg_to_c.update_block_expression(func_type, k, new_exp)
-                check, err_msg, n_erros = self.meg_to_c.check_meg_code_syntax(func_type)
+                check, err_msg, n_erros = \
+                    self.meg_to_c.check_meg_code_syntax(func_type, deep)
 
         if check != 0:
             if sys.version_info[0] < 3:
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+
+# This file is part of Code_Saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2021 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module defines convergence tracking without a display: residuals
+and probes files of a run directory are followed, and summary statistics
+and PNG snapshots are written when they change.
+
+Changes are detected using inotify when available, or by polling
+file sizes and modification times otherwise.
+
+This module contains the following classes and functions:
+- FileWatcher
+- HeadlessView
+- run
+"""
+
+#-------------------------------------------------------------------------------
+# Standard modules
+#-------------------------------------------------------------------------------
+
+import os, sys, time, select
+
+#-------------------------------------------------------------------------------
+# Third-party modules
+#-------------------------------------------------------------------------------
+
+import numpy
+
+#-------------------------------------------------------------------------------
+# Application modules
+#-------------------------------------------------------------------------------
+
+from code_saturne.trackcvg.MonitorReader import MonitorFile, decimate
+
+#-------------------------------------------------------------------------------
+# Global definitions
+#-------------------------------------------------------------------------------
+
+# inotify events watched: modify, close_write, moved_to, create, delete
+
+_inotify_mask = 0x2 | 0x8 | 0x80 | 0x100 | 0x200
+
+# Number of points per curve in snapshots
+
+_snapshot_width = 1000
+
+#-------------------------------------------------------------------------------
+# Watch directories for changes
+#-------------------------------------------------------------------------------
+
+class FileWatcher(object):
+    """
+    Wait for changes in a set of directories, using inotify if possible,
+    polling otherwise.
+    """
+
+    def __init__(self, poll_interval=5.):
+        """
+        Constructor.
+        """
+        self.poll_interval = poll_interval
+        self.dirs = []
+        self.fd = -1
+        self.signature = None
+
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self.inotify_add_watch = libc.inotify_add_watch
+            self.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                               ctypes.c_uint32]
+            self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except Exception:
+            self.fd = -1
+
+
+    def close(self):
+        """
+        Release inotify resources.
+        """
+        if self.fd > -1:
+            os.close(self.fd)
+            self.fd = -1
+
+
+    def watch(self, path):
+        """
+        Add a directory to the watched set.
+        """
+        if path in self.dirs:
+            return
+        self.dirs.append(path)
+        if self.fd > -1:
+            if self.inotify_add_watch(self.fd, path.encode(),
+                                      _inotify_mask) < 0:
+                self.close()
+
+
+    def __signature(self):
+        """
+        Sizes and modification times of files in watched directories.
+        """
+        sig = []
+        for d in self.dirs:
+            try:
+                for e in os.scandir(d):
+                    st = e.stat()
+                    sig.append((e.path, st.st_size, st.st_mtime))
+            except OSError:
+                pass
+        return sig
+
+
+    def wait(self, timeout=None):
+        """
+        Wait for a change, at most timeout seconds if given.
+        Return True if a change was detected.
+        """
+        if self.fd > -1:
+            r = select.select([self.fd], [], [], timeout)[0]
+            if not r:
+                return False
+            self.drain()
+            return True
+
+        if self.signature == None:
+            self.signature = self.__signature()
+        t_end = None
+        if timeout != None:
+            t_end = time.time() + timeout
+        while True:
+            delay = self.poll_interval
+            if t_end != None:
+                delay = min(delay, t_end - time.time())
+                if delay <= 0:
+                    return False
+            time.sleep(delay)
+            sig = self.__signature()
+            if sig != self.signature:
+                self.signature = sig
+                return True
+
+
+    def drain(self):
+        """
+        Discard pending events.
+        """
+        if self.fd > -1:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except OSError:
+                pass
+
+#-------------------------------------------------------------------------------
+# Headless convergence tracking
+#-------------------------------------------------------------------------------
+
+class HeadlessView(object):
+    """
+    Follow monitoring files of a run directory, writing summary
+    statistics and PNG snapshots in an output directory.
+    """
+
+    def __init__(self, caseName, outputDir=None):
+        """
+        Constructor.
+        """
+        self.caseName = os.path.abspath(caseName)
+        if outputDir == None:
+            outputDir = os.path.join(self.caseName, 'trackcvg')
+        self.outputDir = os.path.abspath(outputDir)
+
+        # name -> [MonitorFile, column names, number of rows at last output]
+        self.monitorFiles = {}
+
+
+    def __columnNames(self, name):
+        """
+        Return column names of a monitoring file, based on its header
+        when present.
+        """
+        f = open(name, 'r')
+        names = []
+        for line in f:
+            if name.endswith('.csv'):
+                names = [s.strip() for s in line.split(',')]
+                break
+            elif line.startswith('#'):
+                if not names:
+                    names = line[1:].split()
+            else:
+                n_cols = len(line.split())
+                if len(names) != n_cols:
+                    names = ['t'] + ['probe_' + str(i) for i in range(n_cols-1)]
+                break
+        f.close()
+        return names
+
+
+    def loadDirectoryContent(self, watcher=None):
+        """
+        Look for residuals and probes files (added to watched
+        directories if a watcher is given).
+        """
+        if watcher != None:
+            watcher.watch(self.caseName)
+        for fl in os.listdir(self.caseName):
+            rep = os.path.join(self.caseName, fl)
+            if os.path.isdir(rep):
+                if rep == self.outputDir:
+                    continue
+                files = []
+                for ffl in os.listdir(rep):
+                    base, ext = os.path.splitext(ffl)
+                    if ext in ['.dat', '.csv'] and base.find("_coords") == -1:
+                        files.append(os.path.join(rep, ffl))
+                if files and watcher != None:
+                    watcher.watch(rep)
+            elif fl in ('residuals.csv', 'residuals.dat'):
+                files = [rep]
+            else:
+                continue
+            for name in files:
+                if name in self.monitorFiles:
+                    continue
+                try:
+                    names = self.__columnNames(name)
+                except Exception:
+                    names = []
+                if len(names) > 1:
+                    self.monitorFiles[name] = [MonitorFile(name, len(names)),
+                                               names, -1]
+
+
+    def writeSummary(self):
+        """
+        Write last, minimum and maximum values of each column.
+        """
+        lines = ['file,variable,n_values,t,last,min,max\n']
+        for name in sorted(self.monitorFiles.keys()):
+            mf, names, n_prev = self.monitorFiles[name]
+            data = mf.data()
+            if mf.n_rows < 1:
+                continue
+            rel_name = os.path.relpath(name, self.caseName)
+            for j in range(1, mf.n_cols):
+                v = data[j]
+                lines.append('%s,%s,%d,%g,%g,%g,%g\n'
+                             % (rel_name, names[j], mf.n_rows, data[0][-1],
+                                v[-1], numpy.nanmin(v), numpy.nanmax(v)))
+
+        self.__writeFile('summary.csv', ''.join(lines).encode())
+
+
+    def writeSnapshot(self, name):
+        """
+        Write a PNG plot of a monitoring file.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        import io
+
+        mf, names, n_prev = self.monitorFiles[name]
+        data = mf.data()
+
+        fig = Figure(figsize=(10, 6), dpi=100)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        for j in range(1, mf.n_cols):
+            x, y = decimate(data[0], data[j], _snapshot_width)
+            ax.plot(x, y, label=names[j])
+        if os.path.basename(name).startswith('residuals'):
+            ax.set_yscale('log')
+        ax.grid(True)
+        ax.set_xlabel("time (s)")
+        ax.set_title(os.path.relpath(name, self.caseName))
+        if mf.n_cols < 20:
+            ax.legend(loc="upper left", bbox_to_anchor=(1.02,1.0),
+                      borderaxespad=0.0, prop={'size':'small'})
+        fig.tight_layout()
+
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png')
+
+        png_name = os.path.relpath(name, self.caseName)
+        png_name = os.path.splitext(png_name.replace(os.sep, '_'))[0] + '.png'
+        self.__writeFile(png_name, buf.getvalue())
+
+
+    def __writeFile(self, name, content):
+        """
+        Replace a file in the output directory.
+        """
+        if not os.path.isdir(self.outputDir):
+            os.makedirs(self.outputDir)
+        path = os.path.join(self.outputDir, name)
+        tmp_path = path + '.tmp'
+        f = open(tmp_path, 'wb')
+        f.write(content)
+        f.close()
+        os.replace(tmp_path, path)
+
+
+    def update(self, watcher=None):
+        """
+        Read new data, and write outputs if any file changed.
+        Return the number of files which changed.
+        """
+        self.loadDirectoryContent(watcher)
+
+        changed = []
+        for name in self.monitorFiles:
+            mf = self.monitorFiles[name][0]
+            mf.update()
+            if mf.n_rows != self.monitorFiles[name][2]:
+                self.monitorFiles[name][2] = mf.n_rows
+                changed.append(name)
+
+        if changed:
+            self.writeSummary()
+            for name in changed:
+                self.writeSnapshot(name)
+
+        return len(changed)
+
+#-------------------------------------------------------------------------------
+# Main loop
+#-------------------------------------------------------------------------------
+
+def run(caseName, outputDir=None, period=30., once=False):
+    """
+    Track convergence of a run directory until interrupted, writing
+    outputs at most once per period (in seconds).
+    """
+    hv = HeadlessView(caseName, outputDir)
+    watcher = FileWatcher(poll_interval=period)
+
+    try:
+        hv.update(watcher)
+        sys.stdout.write('Convergence tracking of %s in %s\n'
+                         % (hv.caseName, hv.outputDir))
+        sys.stdout.flush()
+        t_last = time.time()
+
+        while not once:
+            # Block until something changes, then leave time for more
+            # changes to accumulate before reading them.
+            if not watcher.wait():
+                continue
+            delay = t_last + period - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            watcher.drain()
+            hv.update(watcher)
+            t_last = time.time()
+
+    except KeyboardInterrupt:
+        pass
+
+    watcher.close()
+
+    return 0
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
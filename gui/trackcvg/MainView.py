@@ -70,6 +70,7 @@ except:
 
 from code_saturne.Base.QtPage import getexistingdirectory
 from code_saturne.Base.QtPage import DoubleValidator, from_qvariant, to_text_string
+from code_saturne.trackcvg.MonitorReader import MonitorFile, decimate
 
 import numpy
 import matplotlib
@@ -406,7 +407,14 @@ class CaseStandardItemModel(QAbstractItemModel):
 #-------------------------------------------------------------------------------
 
 class MyMplCanvas(FigureCanvas):
-    """Ultimately, this is a QWidget (as well as a FigureCanvasAgg, etc.)."""
+    """Ultimately, this is a QWidget (as well as a FigureCanvasAgg, etc.).
+
+    Curves are decimated to the pixel width of their axes once their
+    limits are known (and again when zooming), existing lines are updated
+    in place, and refreshes
+    which do not change axes limits or legends only redraw the lines
+    over a saved background (blitting).
+    """
 
     def __init__(self, parent=None, subplotNb=1, width=5, height=4, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
@@ -415,24 +423,16 @@ class MyMplCanvas(FigureCanvas):
         self.xAxe = numpy.array([0])
         self.axes = []
 
-        if subplotNb == 1:
-            self.axes.append(self.fig.add_subplot(111))
-        elif subplotNb == 2:
-            self.axes.append(self.fig.add_subplot(211))
-            self.axes.append(self.fig.add_subplot(212))
-        elif subplotNb == 3:
-            self.axes.append(self.fig.add_subplot(221))
-            self.axes.append(self.fig.add_subplot(222))
-            self.axes.append(self.fig.add_subplot(223))
-        elif subplotNb == 4:
-            self.axes.append(self.fig.add_subplot(221))
-            self.axes.append(self.fig.add_subplot(222))
-            self.axes.append(self.fig.add_subplot(223))
-            self.axes.append(self.fig.add_subplot(224))
+        # Lines and full data by (subplot id, label), lines updated
+        # since the last clear(), and saved backgrounds for blitting
+        self.lines = {}
+        self.curves = {}
+        self.updated = set()
+        self.backgrounds = None
+        self.capturing = False
+        self.autoscaling = False
 
-        #self.axes.autoscale(False)
-        # We want the axes cleared every time plot() is called
-        #self.axes.hold(False)
+        self.setSubplotNumber(subplotNb)
 
         self.compute_initial_figure()
 
@@ -445,70 +445,171 @@ class MyMplCanvas(FigureCanvas):
                                    QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
 
+        self.mpl_connect('draw_event', self.slotDrawEvent)
+
 
     def compute_initial_figure(self):
         pass
 
 
+    def __nbBins(self, ax):
+        """
+        Number of decimation bins for an axes (its width in pixels).
+        """
+        n = int(ax.bbox.width)
+        if n < 2:
+            n = 1000
+        return n
+
+
+    def __updateLine(self, subplot_id, lbl, x, y):
+        """
+        Create or update a line; its data is decimated by drawFigure.
+        """
+        ax = self.axes[subplot_id - 1]
+        key = (subplot_id, lbl)
+        self.curves[key] = (x, y)
+        if key not in self.lines:
+            self.lines[key] = ax.plot([], [], label = lbl)[0]
+        self.updated.add(key)
+
+
+    def __decimateLines(self, ax, x_range=None):
+        """
+        Set the data of the lines of an axes to their decimated curves
+        (restricted to x_range if given).
+        """
+        n_bins = self.__nbBins(ax)
+        for key in self.lines:
+            if self.axes[key[0] - 1] == ax:
+                x, y = self.curves[key]
+                self.lines[key].set_data(*decimate(x, y, n_bins, x_range))
+
+
     def update_figure(self, name, data, nb_probes, lstProbes):
-        self.xAxe = data[0].tolist()
+        self.xAxe = data[0]
         for j in range(nb_probes - 1):
             if (lstProbes[j].status == "on"):
-                self.yAxe = data[j + 1].tolist()
+                self.yAxe = data[j + 1]
 
                 lbl = name + "_s" + str(j)
 
-                self.axes[lstProbes[j].subplot_id - 1].plot(self.xAxe, self.yAxe,
-                                                            label = lbl)
-                self.axes[lstProbes[j].subplot_id - 1].legend(loc="upper left",
-                                                              bbox_to_anchor=(1.02,1.0),
-                                                              borderaxespad=0.0,
-                                                              ncol=1,
-                                                              fancybox=True,
-                                                              shadow=True,
-                                                              prop={'size':'medium',
-                                                                    'style': 'italic'})
+                self.__updateLine(lstProbes[j].subplot_id, lbl,
+                                  self.xAxe, self.yAxe)
 
 
     def update_figure_listing(self, name, data, nb_probes, lstProbes):
-        self.xAxe = data[0].tolist()
+        self.xAxe = data[0]
         for j in range(nb_probes - 1):
             if (lstProbes[j].status == "on"):
-                self.yAxe = data[j + 1].tolist()
+                self.yAxe = data[j + 1]
 
                 lbl = "t res. " + name[j]
 
-                self.axes[lstProbes[j].subplot_id - 1].plot(self.xAxe, self.yAxe,
-                                                            label = lbl)
-                self.axes[lstProbes[j].subplot_id - 1].legend(loc="upper left",
-                                                              bbox_to_anchor=(1.02,1.0),
-                                                              borderaxespad=0.0,
-                                                              ncol=1,
-                                                              fancybox=True,
-                                                              shadow=True,
-                                                              prop={'size':'medium',
-                                                                    'style': 'italic'})
-
+                self.__updateLine(lstProbes[j].subplot_id, lbl,
+                                  self.xAxe, self.yAxe)
 
 
     def drawFigure(self):
+        full_draw = (self.backgrounds == None)
+
+        # Remove lines which were not updated since the last clear()
+        for key in list(self.lines.keys()):
+            if key not in self.updated:
+                self.lines[key].remove()
+                del self.lines[key]
+                del self.curves[key]
+                full_draw = True
+
         for it in range(len(self.axes)):
-            self.axes[it].grid(True)
-            self.axes[it].set_xlabel("time (s)")
-        self.axes[0].set_yscale('log')
+            ax = self.axes[it]
+            limits = (ax.get_xlim(), ax.get_ylim())
+
+            # Decimate lines once for the final x limits: whole curves
+            # if they are autoscaled, the visible range otherwise
+            x_range = None
+            if not ax.get_autoscalex_on():
+                x_range = limits[0]
+            self.__decimateLines(ax, x_range)
+
+            self.autoscaling = True
+            try:
+                ax.relim()
+                ax.autoscale_view()
+            finally:
+                self.autoscaling = False
+            if (ax.get_xlim(), ax.get_ylim()) != limits:
+                full_draw = True
+
+            labels = [l.get_label() for l in ax.get_lines()]
+            legend = ax.get_legend()
+            if legend == None and not labels:
+                continue
+            if legend != None:
+                if [t.get_text() for t in legend.get_texts()] == labels:
+                    continue
+                legend.remove()
+            full_draw = True
+            if labels:
+                ax.legend(loc="upper left",
+                          bbox_to_anchor=(1.02,1.0),
+                          borderaxespad=0.0,
+                          ncol=1,
+                          fancybox=True,
+                          shadow=True,
+                          prop={'size':'medium',
+                                'style': 'italic'})
+
+        if full_draw:
+            # Draw and save the background without lines
+            for l in self.lines.values():
+                l.set_visible(False)
+            self.capturing = True
+            self.fig.canvas.draw()
+            self.capturing = False
+            self.backgrounds = [self.copy_from_bbox(ax.bbox) for ax in self.axes]
+            for l in self.lines.values():
+                l.set_visible(True)
 
-        self.fig.canvas.draw()
+        for it in range(len(self.axes)):
+            ax = self.axes[it]
+            self.restore_region(self.backgrounds[it])
+            for l in ax.get_lines():
+                ax.draw_artist(l)
+            self.blit(ax.bbox)
+
+
+    def slotDrawEvent(self, event):
+        """
+        Invalidate saved backgrounds when the figure is fully redrawn
+        (resizing, toolbar actions, ...).
+        """
+        if not self.capturing:
+            self.backgrounds = None
+
+
+    def slotXlimChanged(self, ax):
+        """
+        Decimate lines again for the visible range when zooming or panning
+        (limit changes due to autoscaling in drawFigure are already handled).
+        """
+        if self.autoscaling:
+            return
+        self.__decimateLines(ax, ax.get_xlim())
 
 
     def clear(self):
-        for plt in range(len(self.axes)):
-            self.axes[plt].clear()
+        self.updated = set()
 
 
     def setSubplotNumber(self, subplotNb):
         self.fig.clear()
         for it in range(len(self.axes)):
             self.axes.remove(self.axes[0])
+        self.lines = {}
+        self.curves = {}
+        self.updated = set()
+        self.backgrounds = None
         if subplotNb == 1:
             self.axes.append(self.fig.add_subplot(111))
         elif subplotNb == 2:
@@ -523,6 +624,11 @@ class MyMplCanvas(FigureCanvas):
             self.axes.append(self.fig.add_subplot(222))
             self.axes.append(self.fig.add_subplot(223))
             self.axes.append(self.fig.add_subplot(224))
+        for it in range(len(self.axes)):
+            self.axes[it].grid(True)
+            self.axes[it].set_xlabel("time (s)")
+            self.axes[it].callbacks.connect('xlim_changed', self.slotXlimChanged)
+        self.axes[0].set_yscale('log')
 
 
 #-------------------------------------------------------------------------------
@@ -698,6 +804,7 @@ class MainView(object):
         self.fileList = []
         self.listingVariable = []
         self.listFileProbes = {}
+        self.monitorFiles = {}
         self.modelCases = CaseStandardItemModel(self.parent, [], [])
         self.treeViewDirectory.setModel(self.modelCases)
         self.modelCases.dataChanged.connect(self.treeViewChanged)
@@ -1023,41 +1130,10 @@ class MainView(object):
 
     def ReadCsvFile(self, name, probes_number):
         """
+        Return values of a CSV file, reading only rows appended
+        since the previous call.
         """
-        data = []
-        comp = 0
-        ficIn= open(name, 'r')
-        typ = 0 # O time / 1 iteration
-        for line in ficIn.readlines():
-            e_id = line.find('\n')
-            if e_id < 0:
-                continue
-            if comp > 0:
-                content = line[:e_id].split(',')
-
-                if comp == 1:
-                    if type(content[0]) == int:
-                        typ = 1
-
-                if typ == 0:
-                    for el in content:
-                        data.append(float(el))
-                else:
-                    data.append(float(content[0]))
-                    for el in content[1:]:
-                        data.append(float(el))
-            comp = comp + 1
-        ficIn.close()
-        A = numpy.array(data)
-        n = A.shape[0]
-        r = n % probes_number
-        if r > 0:
-            n -= r
-            A = numpy.resize(A, n)
-        B = A.reshape(-1, probes_number)
-        C = B.transpose()
-
-        return C
+        return self.__monitorFile(name, probes_number).update()
 
 
     def ReadCsvFileHeader(self, name):
@@ -1076,42 +1152,21 @@ class MainView(object):
 
     def ReadDatFile(self, name, probes_number):
         """
+        Return values of a DAT file, reading only rows appended
+        since the previous call.
         """
-        data = []
-        ficIn= open(name, 'r')
-        comp = 0
-        typ = 0 # O time / 1 iteration
-        for line in ficIn.readlines():
-            if not line.startswith("#"):
-                comp = comp + 1
-                e_id = line.find('\n')
-                if e_id < 0:
-                    continue
-                line = line[:e_id].lstrip()
-                content = line.split()
-
-                if comp == 1:
-                    if type(content[0]) == int:
-                        typ = 1
+        return self.__monitorFile(name, probes_number).update()
 
-                if typ == 0:
-                    for el in content:
-                        data.append(float(el))
-                else:
-                    data.append(float(content[0]))
-                    for el in content[1:]:
-                        data.append(float(el))
-        ficIn.close()
-        A = numpy.array(data)
-        n = A.shape[0]
-        r = n % probes_number
-        if r > 0:
-            n -= r
-            A = numpy.resize(A, n)
-        B = A.reshape(-1, probes_number)
-        C = B.transpose()
 
-        return C
+    def __monitorFile(self, name, probes_number):
+        """
+        Return the incremental reader associated with a file.
+        """
+        mf = self.monitorFiles.get(name)
+        if mf == None or mf.n_cols != probes_number:
+            mf = MonitorFile(name, probes_number)
+            self.monitorFiles[name] = mf
+        return mf
 
 
     def ReadDatFileHeader(self, name):
@@ -1278,6 +1333,7 @@ class MainViewSaturne(QMainWindow, Ui_MainForm, MainView):
         self.fileList = []
         self.listingVariable = []
         self.listFileProbes = {}
+        self.monitorFiles = {}
         self.timer = QTimer()
         self.timer.start(self.timeRefresh * 1000)
 
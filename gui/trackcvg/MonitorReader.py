@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+#-------------------------------------------------------------------------------
+
+# This file is part of Code_Saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2021 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+This module defines an incremental reader for monitoring files
+(residuals and probes, in CSV or DAT format) written by a running
+computation.
+
+This module contains the following classes and functions:
+- MonitorFile
+- decimate
+"""
+
+#-------------------------------------------------------------------------------
+# Standard modules
+#-------------------------------------------------------------------------------
+
+import os
+
+#-------------------------------------------------------------------------------
+# Third-party modules
+#-------------------------------------------------------------------------------
+
+import numpy
+
+#-------------------------------------------------------------------------------
+# Global definitions
+#-------------------------------------------------------------------------------
+
+# Maximum number of bytes parsed at once
+
+_chunk_size = 1 << 24
+
+# Initial number of rows allocated
+
+_initial_rows = 1024
+
+#-------------------------------------------------------------------------------
+# Monitoring file
+#-------------------------------------------------------------------------------
+
+class MonitorFile(object):
+    """
+    Follow a monitoring file, parsing only rows appended since the
+    previous update.
+
+    Values are stored in a preallocated array which grows geometrically;
+    the file is read again from the start if it was truncated or replaced.
+    """
+
+    def __init__(self, name, n_cols):
+        """
+        Constructor.
+        """
+        self.name = name
+        self.n_cols = n_cols
+        self.csv = (os.path.splitext(name)[1] == '.csv')
+        self.reset()
+
+
+    def reset(self):
+        """
+        Forget all data read so far.
+        """
+        self.offset = 0
+        self.ino = None
+        self.n_rows = 0
+        self.values = numpy.empty((_initial_rows, self.n_cols))
+
+
+    def __append(self, text):
+        """
+        Parse complete lines and append matching rows; lines which
+        can not be parsed or do not have the expected number of values
+        are skipped.
+        """
+        if self.csv:
+            text = text.replace(',', ' ')
+
+        lines = [l for l in text.split('\n')
+                 if l.strip() and not l.startswith('#')]
+        n_rows = len(lines)
+        if n_rows < 1:
+            return
+
+        # Parse all lines at once, or line by line if this fails
+
+        try:
+            vals = numpy.array(' '.join(lines).split(), dtype=numpy.float64)
+        except ValueError:
+            vals = None
+
+        if vals is not None and vals.shape[0] == n_rows*self.n_cols:
+            vals = vals.reshape(n_rows, self.n_cols)
+        else:
+            rows = []
+            for l in lines:
+                try:
+                    row = [float(t) for t in l.split()]
+                except ValueError:
+                    continue
+                if len(row) == self.n_cols:
+                    rows.append(row)
+            n_rows = len(rows)
+            if n_rows < 1:
+                return
+            vals = numpy.array(rows)
+
+        n_max = self.values.shape[0]
+        if self.n_rows + n_rows > n_max:
+            while self.n_rows + n_rows > n_max:
+                n_max *= 2
+            values = numpy.empty((n_max, self.n_cols))
+            values[:self.n_rows] = self.values[:self.n_rows]
+            self.values = values
+
+        self.values[self.n_rows:self.n_rows+n_rows] = vals
+        self.n_rows += n_rows
+
+
+    def update(self):
+        """
+        Read rows appended to the file, and return all values,
+        with one row per column of the file.
+        """
+        try:
+            st = os.stat(self.name)
+        except OSError:
+            self.reset()
+            return self.data()
+
+        if st.st_ino != self.ino or st.st_size < self.offset:
+            self.reset()
+            self.ino = st.st_ino
+
+        if st.st_size > self.offset:
+            f = open(self.name, 'rb')
+            f.seek(self.offset)
+
+            # Skip CSV header
+            if self.csv and self.offset == 0:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    f.close()
+                    return self.data()
+                self.offset = f.tell()
+
+            while True:
+                buf = f.read(_chunk_size)
+                if not buf:
+                    break
+                # Only handle complete lines
+                e_id = buf.rfind(b'\n')
+                if e_id < 0:
+                    if len(buf) < _chunk_size:
+                        break
+                    buf += f.readline()
+                    e_id = buf.rfind(b'\n')
+                    if e_id < 0:
+                        break
+                self.__append(buf[:e_id+1].decode('utf-8', 'replace'))
+                self.offset += e_id + 1
+                f.seek(self.offset)
+
+            f.close()
+
+        return self.data()
+
+
+    def data(self):
+        """
+        Return values read so far, with one row per column of the file.
+        """
+        return self.values[:self.n_rows].transpose()
+
+#-------------------------------------------------------------------------------
+# Min/max decimation
+#-------------------------------------------------------------------------------
+
+def decimate(x, y, n_bins, x_range=None):
+    """
+    Reduce a curve to at most 2 points per bin (usually per pixel),
+    keeping the minimum and maximum of each bin, so that peaks are
+    still visible. If x_range is given, only points in that range
+    are kept.
+    """
+    if x_range != None:
+        sel = numpy.flatnonzero((x >= x_range[0]) & (x <= x_range[1]))
+        if sel.shape[0] > 0:
+            s_id = max(sel[0] - 1, 0)
+            e_id = min(sel[-1] + 2, x.shape[0])
+            x = x[s_id:e_id]
+            y = y[s_id:e_id]
+
+    n = y.shape[0]
+    n_bins = max(n_bins, 1)
+    if n <= 2*n_bins:
+        return x, y
+
+    k = n // n_bins
+    m = n // k
+    yb = y[:m*k].reshape(m, k)
+    offsets = numpy.arange(m) * k
+    ids = [offsets + numpy.argmin(yb, axis=1),
+           offsets + numpy.argmax(yb, axis=1),
+           numpy.array([0, n-1])]
+    if m*k < n:
+        ids.append(m*k + numpy.array([numpy.argmin(y[m*k:]),
+                                      numpy.argmax(y[m*k:])]))
+    ids = numpy.unique(numpy.concatenate(ids))
+
+    return x[ids], y[ids]
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------
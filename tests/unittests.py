@@ -184,6 +184,18 @@ def starttest48():
     from code_saturne.model.AtmosphericFlowsModel import runTest
     runTest()
 
+def starttest49():
+    from code_saturne.cs_io_reader import runTest
+    runTest()
+
+def starttest50():
+    from code_saturne.studymanager.cs_studymanager_graph import runTest
+    runTest()
+
+def starttest51():
+    from code_saturne.cs_case import runTest
+    runTest()
+
 if __name__ == '__main__':
 
     print('STARTING GUI UNIT TESTS')
@@ -230,6 +242,9 @@ if __name__ == '__main__':
 ##    starttest46()
     starttest47()
     starttest48()
+    starttest49()
+    starttest50()
+    starttest51()
 
 
 #-------------------------------------------------------------------------------
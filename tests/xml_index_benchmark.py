@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#-------------------------------------------------------------------------------
+
+# This file is part of Code_Saturne, a general-purpose CFD tool.
+#
+# Copyright (C) 1998-2021 EDF S.A.
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+#-------------------------------------------------------------------------------
+
+"""
+Compare the time spent in XML node queries with and without the
+node index of the case (see Case.xmlEnableIndex).
+
+Timings depend on the machine load, so this is not part of the unit tests,
+which only check that both query paths give the same results.
+
+Usage: xml_index_benchmark.py [n_zones]
+"""
+
+#-------------------------------------------------------------------------------
+# Library modules import
+#-------------------------------------------------------------------------------
+
+import sys
+import time
+
+#-------------------------------------------------------------------------------
+# Application modules import
+#-------------------------------------------------------------------------------
+
+from code_saturne.model.XMLengine import Case
+
+#-------------------------------------------------------------------------------
+# Benchmark
+#-------------------------------------------------------------------------------
+
+def build_case(n_zones, indexed):
+    """
+    Build a case with n_zones boundary zones.
+    """
+    case = Case()
+    if indexed:
+        case.xmlEnableIndex()
+    root = case.root()
+    zones_node = root.xmlInitNode('boundary_zones')
+    root.xmlInitNode('boundary_conditions')
+    for i in range(n_zones):
+        zones_node.xmlAddChild('zone', label='BC_%d' % i, name=str(i))
+
+    return case
+
+
+def query_zones(case):
+    """
+    Query each zone and its boundary condition, as GUI models do,
+    and return the elapsed time.
+    """
+    t0 = time.time()
+    for node in case.xmlGetNodeList('zone'):
+        label = node['label']
+        case.xmlGetNode('zone', label=label)
+        b = case.xmlGetNode('boundary_conditions')
+        b.xmlInitChildNode('wall', label=label)
+    case.xmlGetNodeList('wall', 'label')
+
+    return time.time() - t0
+
+
+def main(n_zones):
+    """
+    Print query times for the non-indexed and indexed cases.
+    """
+    for indexed in (False, True):
+        case = build_case(n_zones, indexed)
+        t_init = query_zones(case)
+        t_query = query_zones(case)
+        print("indexed: %-5s  zones: %d  first pass: %.3f s  second pass: %.3f s"
+              % (indexed, n_zones, t_init, t_query))
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    n_zones = 500
+    if len(sys.argv) > 1:
+        n_zones = int(sys.argv[1])
+    main(n_zones)
+
+#-------------------------------------------------------------------------------
+# End
+#-------------------------------------------------------------------------------